@@ -1,49 +1,186 @@
+# Bump when a node class or its fields change; cached programs from older
+# versions are then ignored
+AST_VERSION = 5
+
+# Every node also records the line and column where its source starts, or
+# None for nodes that weren't parsed from source
 class ASTNode:
-    pass
+    __slots__ = ()
+
+    def at(self, node):
+        """Give this node the source position of node, and return it"""
+        self.line = node.line
+        self.column = node.column
+        return self
 
 class Number(ASTNode):
-    def __init__(self, value):
+    __slots__ = ("value", "line", "column")
+
+    def __init__(self, value, line=None, column=None):
         self.value = value
+        self.line = line
+        self.column = column
 
 class String(ASTNode):
-    def __init__(self, value):
+    __slots__ = ("value", "line", "column")
+
+    def __init__(self, value, line=None, column=None):
         self.value = value
+        self.line = line
+        self.column = column
 
 class Identifier(ASTNode):
-    def __init__(self, name):
+    __slots__ = ("name", "slot", "line", "column")
+
+    def __init__(self, name, slot=None, line=None, column=None):
         self.name = name
+        self.slot = slot
+        self.line = line
+        self.column = column
+
+# Made by the resolver for a variable local to a function; slot indexes the
+# call's frame instead of the global slots
+class Local(ASTNode):
+    __slots__ = ("name", "slot", "line", "column")
+
+    def __init__(self, name, slot=None, line=None, column=None):
+        self.name = name
+        self.slot = slot
+        self.line = line
+        self.column = column
 
 class BinaryOp(ASTNode):
-    def __init__(self, left, operator, right):
+    __slots__ = ("left", "operator", "right", "line", "column")
+
+    def __init__(self, left, operator, right, line=None, column=None):
         self.left = left
         self.operator = operator
         self.right = right
+        self.line = line
+        self.column = column
 
 class UnaryOp(ASTNode):
-    def __init__(self, operator, operand):
+    __slots__ = ("operator", "operand", "line", "column")
+
+    def __init__(self, operator, operand, line=None, column=None):
         self.operator = operator
         self.operand = operand
+        self.line = line
+        self.column = column
 
 class Assignment(ASTNode):
-    def __init__(self, name, value):
+    __slots__ = ("name", "value", "slot", "line", "column")
+
+    def __init__(self, name, value, slot=None, line=None, column=None):
+        self.name = name
+        self.value = value
+        self.slot = slot
+        self.line = line
+        self.column = column
+
+# Made by the resolver from an Assignment name = name + part + ..., whose
+# parts are appended to the variable in place (see strings.py). value is
+# the Assignment's, kept so the node counts and reads as the assignment did
+class Append(ASTNode):
+    __slots__ = ("name", "value", "parts", "slot", "line", "column")
+
+    def __init__(self, name, value, parts, slot=None, line=None, column=None):
+        self.name = name
+        self.value = value
+        self.parts = parts
+        self.slot = slot
+        self.line = line
+        self.column = column
+
+# Assignment and Append to a variable local to a function
+class LocalAssignment(ASTNode):
+    __slots__ = ("name", "value", "slot", "line", "column")
+
+    def __init__(self, name, value, slot=None, line=None, column=None):
+        self.name = name
+        self.value = value
+        self.slot = slot
+        self.line = line
+        self.column = column
+
+class LocalAppend(ASTNode):
+    __slots__ = ("name", "value", "parts", "slot", "line", "column")
+
+    def __init__(self, name, value, parts, slot=None, line=None, column=None):
         self.name = name
         self.value = value
+        self.parts = parts
+        self.slot = slot
+        self.line = line
+        self.column = column
+
+# def name(params): body. memo is the size of the function's cache of
+# results, or None if it isn't memoized. The resolver fills in the global
+# slot of name and the number of local variables, parameters first
+class FunctionDef(ASTNode):
+    __slots__ = ("name", "params", "body", "memo", "slot", "local_count", "line", "column")
+
+    def __init__(self, name, params, body, memo=None, slot=None, local_count=None, line=None, column=None):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.memo = memo
+        self.slot = slot
+        self.local_count = local_count
+        self.line = line
+        self.column = column
+
+class Call(ASTNode):
+    __slots__ = ("function", "arguments", "line", "column")
+
+    def __init__(self, function, arguments, line=None, column=None):
+        self.function = function
+        self.arguments = arguments
+        self.line = line
+        self.column = column
 
 class PrintStatement(ASTNode):
-    def __init__(self, arguments):
+    __slots__ = ("arguments", "line", "column")
+
+    def __init__(self, arguments, line=None, column=None):
         self.arguments = arguments
+        self.line = line
+        self.column = column
 
 class IfStatement(ASTNode):
-    def __init__(self, condition, if_body, else_body=None):
+    __slots__ = ("condition", "if_body", "else_body", "line", "column")
+
+    def __init__(self, condition, if_body, else_body=None, line=None, column=None):
         self.condition = condition
         self.if_body = if_body
         self.else_body = else_body
+        self.line = line
+        self.column = column
 
 class WhileStatement(ASTNode):
-    def __init__(self, condition, body):
+    __slots__ = ("condition", "body", "line", "column")
+
+    def __init__(self, condition, body, line=None, column=None):
         self.condition = condition
         self.body = body
+        self.line = line
+        self.column = column
+
+# Added by the optimizer around an expression that doesn't change while a
+# loop runs; depth is the number of loops enclosing that loop
+class LoopInvariant(ASTNode):
+    __slots__ = ("expression", "depth", "line", "column")
+
+    def __init__(self, expression, depth, line=None, column=None):
+        self.expression = expression
+        self.depth = depth
+        self.line = line
+        self.column = column
 
 class Program(ASTNode):
-    def __init__(self, statements):
+    __slots__ = ("statements", "line", "column")
+
+    def __init__(self, statements, line=None, column=None):
         self.statements = statements
+        self.line = line
+        self.column = column
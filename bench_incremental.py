@@ -0,0 +1,81 @@
+"""Benchmark for incremental re-parsing in the web IDE's embedded parser.
+
+Applies single-character edits at random places in a generated program and
+times IncrementalParser.reparse() against a full Lexer + Parser run. Every
+incremental result is checked against the full parse.
+
+Usage: python bench_incremental.py [lines] [edits]
+"""
+import random
+import sys
+import time
+
+from embedded import load_embedded
+
+
+def generate_program(lines):
+    statements = ["total = 0;", "items = [];"]
+    i = 0
+    while len(statements) + 9 < lines:
+        statements.extend([
+            f"value_{i} = {i} * 2 + total;",
+            f"if value_{i} > {i * 3} {{",
+            f"    total = total + value_{i};",
+            "} else {",
+            f'    print("value", value_{i});',
+            "};",
+            f"for n in range({i % 5}) {{",
+            "    items = items + [n];",
+            "};",
+        ])
+        i += 1
+    statements.append('print("total", total);')
+    return "\n".join(statements)
+
+
+def single_character_edits(code, count, seed=0):
+    """Yield successive versions of code, each one character away from the last"""
+    rng = random.Random(seed)
+    digits = [i for i, char in enumerate(code) if char.isdigit()]
+    for _ in range(count):
+        pos = rng.choice(digits)
+        # Swapping one digit for another keeps the program valid
+        code = code[:pos] + rng.choice("123456789") + code[pos + 1:]
+        yield code
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    spl = load_embedded()
+    code = generate_program(lines)
+    edits = list(single_character_edits(code, count))
+    print(f"Program: {len(code.splitlines())} lines, {len(code)} characters, {count} single-character edits")
+
+    parser = spl.IncrementalParser()
+    start = time.perf_counter()
+    parser.reparse(code)
+    initial = time.perf_counter() - start
+
+    incremental = 0.0
+    full = 0.0
+    for text in edits:
+        start = time.perf_counter()
+        result = parser.reparse(text)
+        incremental += time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = spl.Parser(spl.Lexer(text).tokenize()).parse()
+        full += time.perf_counter() - start
+        if result != expected:
+            raise AssertionError("Incremental parse differs from a full parse")
+
+    print(f"Initial parse:          {initial * 1000:9.2f} ms")
+    print(f"Full re-parse per edit: {full / count * 1000:9.2f} ms")
+    print(f"Incremental per edit:   {incremental / count * 1000:9.2f} ms")
+    print(f"Speedup:                {full / incremental:9.1f}x")
+    print(f"Statements reused: {parser.stats['reused']}, re-parsed: {parser.stats['parsed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Memory benchmark for the token stream and AST on a large generated program.
+
+Usage: python bench_memory.py [lines]
+"""
+import sys
+import time
+import tracemalloc
+
+from lexer import Tokenizer
+from parser import Parser
+
+
+def generate_program(lines):
+    statements = ["counter = 1"]
+    for i in range(lines - 1):
+        if i < 100:
+            statements.append(f"value_{i} = {i}")
+        else:
+            statements.append(f"value_{i % 100} = (value_{i % 7} + {i}) * 2 - counter / 3.5")
+    return "\n".join(statements)
+
+
+def measure(label, build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {retained / 1e6:>10.1f} MB {peak / 1e6:>10.1f} MB {elapsed:>9.2f} s")
+    return result
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    code = generate_program(lines)
+    print(f"Program: {lines} lines, {len(code) / 1e6:.1f} MB of source")
+    print(f"{'Phase':<28} {'Retained':>13} {'Peak':>13} {'Time':>11}")
+
+    tokens = measure("Tokenizer.tokenize()", lambda: Tokenizer(code).tokenize())
+    print(f"  {len(tokens)} Token objects")
+    del tokens
+
+    buffer = measure("Tokenizer.tokenize_buffer()", lambda: Tokenizer(code).tokenize_buffer())
+    print(f"  {len(buffer)} tokens in parallel arrays")
+
+    measure("Parser(buffer).parse()", lambda: Parser(buffer).parse())
+
+
+if __name__ == "__main__":
+    main()
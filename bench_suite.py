@@ -0,0 +1,268 @@
+"""Benchmark suite timing the lexer, parser and interpreter on SPL workloads.
+
+Each workload is timed phase by phase (tokenize, parse, interpret) for the
+standalone modules and for the interpreter embedded in script.js. Results
+are written as JSON and compared against a stored baseline; a phase whose
+best time is more than --threshold slower than the baseline's is reported
+as a regression and the run exits with status 1.
+
+Usage:
+    python bench_suite.py                       # compare with bench_baseline.json
+    python bench_suite.py -o results.json       # also write this run's results
+    python bench_suite.py --save-baseline       # store this run as the baseline
+    python bench_suite.py --scale 0.1 --repeat 3
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from bench_memory import generate_program
+from embedded import load_embedded
+from interpreter import Interpreter
+from lexer import Tokenizer
+from optimizer import optimize_ast
+from parser import Parser
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Differences smaller than this many seconds are timer noise, whatever the ratio
+MIN_DIFFERENCE = 0.0005
+
+# Nesting depth of the deep_nesting workload; each level is several Python
+# frames in the parser, so it is not scaled
+NESTING_DEPTH = 40
+
+
+def numeric_loop(size, embedded):
+    header = ["a = 3", "b = 5", "x = 0"]
+    step = "x = x + a * b - (a + b) * 2 + 2"
+    if embedded:
+        return "; ".join(header) + f"; while x < {size} {{ {step}; }}"
+    return "\n".join(header + [f"while x < {size}: {step}"])
+
+
+def string_building(size, embedded):
+    lines = ['word = "spl"', 'sep = ", "', 's = ""']
+    lines += ["s = s + word + sep"] * size
+    return ";\n".join(lines) + ";" if embedded else "\n".join(lines)
+
+
+def list_manipulation(size, embedded):
+    if not embedded:
+        return None  # The standalone language has no lists
+    return "\n".join([
+        "items = [];",
+        f"for i in range({size}) {{ items.append(i * 2); }};",
+        "total = 0;",
+        "for v in items { if v > 10 { total = total + v; } };",
+        "items.reverse();",
+        "last = items.pop();",
+        "found = items.contains(0);",
+        'text = items.join(",");',
+    ])
+
+
+def method_calls(size, embedded):
+    if not embedded:
+        return None  # The standalone language has no methods
+    return "\n".join([
+        'text = "Simple Programming Language";',
+        "items = [3, 1, 2];",
+        "flag = True;",
+        "total = 0;",
+        f"for i in range({size}) {{",
+        "    total = total + text.length() + items.length() + i.abs() + flag.tonumber();",
+        '    if text.contains("Lang") { total = total + text.find("P") + Math.max(items); }',
+        "};",
+    ])
+
+
+def deep_nesting(size, embedded):
+    # A loop around NESTING_DEPTH nested ifs around an expression nested as deep
+    expression = "x"
+    for level in range(NESTING_DEPTH):
+        expression = f"({expression} + {level % 3}) - {level % 3}"
+    body = f"x = {expression} + 1"
+    if embedded:
+        for level in range(NESTING_DEPTH):
+            body = f"if x > {-level - 1} {{ {body}; }}"
+        return f"x = 0; while x < {size} {{ {body} }}"
+    for level in range(NESTING_DEPTH):
+        body = f"if x > {-level - 1}: {body}"
+    return f"x = 0\nwhile x < {size}: {body}"
+
+
+def large_source(size, embedded):
+    code = generate_program(size)
+    return code.replace("\n", ";\n") + ";" if embedded else code
+
+
+# name -> (source generator, size at scale 1)
+WORKLOADS = {
+    "numeric_loop": (numeric_loop, 20000),
+    "string_building": (string_building, 2000),
+    "list_manipulation": (list_manipulation, 20000),
+    "method_calls": (method_calls, 20000),
+    "deep_nesting": (deep_nesting, 200),
+    "large_source": (large_source, 10000),
+}
+
+
+def time_runs(setup, run, repeat):
+    """Seconds taken by run(setup()) in each of repeat runs, with the garbage collector off as in timeit"""
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run(argument)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return times
+
+
+def standalone_phases(code):
+    """(phase, setup, run) for the standalone Tokenizer, Parser and tree Interpreter"""
+    program = optimize_ast(Parser(Tokenizer(code).tokenize_buffer()).parse(), 1)
+    return [
+        ("tokenize", lambda: code, lambda text: Tokenizer(text).tokenize()),
+        ("parse", lambda: Tokenizer(code).tokenize_buffer(), lambda tokens: Parser(tokens).parse()),
+        ("interpret", Interpreter, lambda interpreter: interpreter.run(program)),
+    ]
+
+
+def embedded_phases(spl, code):
+    """(phase, setup, run) for the embedded Lexer, Parser and closure engine"""
+    tokens = spl.Lexer(code).tokenize()
+    ast = spl.Optimizer(1).optimize(spl.Parser(tokens).parse())
+    return [
+        ("tokenize", lambda: code, lambda text: spl.Lexer(text).tokenize()),
+        ("parse", lambda: tokens, lambda tokens: spl.Parser(tokens).parse()),
+        ("interpret", spl.Interpreter, lambda interpreter: spl.Compiler(interpreter).compile(ast)()),
+    ]
+
+
+def run_suite(scale=1.0, repeat=5, workloads=None, spl=None):
+    """Time every phase of every workload; returns a JSON-ready dict.
+
+    Its "results" map "implementation/workload/phase" to the best and median
+    of repeat runs in seconds.
+    """
+    spl = spl or load_embedded()
+    results = {}
+    for name in workloads or WORKLOADS:
+        generate, size = WORKLOADS[name]
+        size = max(1, int(size * scale))
+        for implementation in ("standalone", "embedded"):
+            code = generate(size, implementation == "embedded")
+            if code is None:
+                continue
+            if implementation == "embedded":
+                phases = embedded_phases(spl, code)
+            else:
+                phases = standalone_phases(code)
+            for phase, setup, run in phases:
+                times = time_runs(setup, run, repeat)
+                results[f"{implementation}/{name}/{phase}"] = {
+                    "min": min(times),
+                    "median": statistics.median(times),
+                }
+    return {
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "scale": scale,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.25):
+    """Compare two run_suite() results by best time.
+
+    Returns a list of (key, baseline seconds, current seconds, ratio,
+    status) for the keys both have, where status is "regression",
+    "improvement" or "ok".
+    """
+    rows = []
+    for key, stats in current["results"].items():
+        if key not in baseline["results"]:
+            continue
+        before, after = baseline["results"][key]["min"], stats["min"]
+        ratio = after / before if before else float("inf")
+        status = "ok"
+        if abs(after - before) >= MIN_DIFFERENCE:
+            if ratio > 1 + threshold:
+                status = "regression"
+            elif ratio < 1 / (1 + threshold):
+                status = "improvement"
+        rows.append((key, before, after, ratio, status))
+    return rows
+
+
+def format_results(suite):
+    rows = [f"{'Benchmark':<40} {'Best':>10} {'Median':>10}"]
+    for key, stats in suite["results"].items():
+        rows.append(f"{key:<40} {stats['min'] * 1000:8.2f}ms {stats['median'] * 1000:8.2f}ms")
+    return "\n".join(rows)
+
+
+def format_comparison(rows):
+    lines = [f"{'Benchmark':<40} {'Baseline':>10} {'Current':>10} {'Ratio':>7}"]
+    for key, before, after, ratio, status in rows:
+        flag = "" if status == "ok" else f"  {status.upper()}"
+        lines.append(f"{key:<40} {before * 1000:8.2f}ms {after * 1000:8.2f}ms {ratio:6.2f}x{flag}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time SPL's lexer, parser and interpreter phases")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every workload size (default: 1)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per phase; the best is compared (default: 5)")
+    parser.add_argument("--workload", action="append", choices=list(WORKLOADS),
+                        help="run only this workload (may be repeated)")
+    parser.add_argument("--output", "-o", help="write this run's results as JSON here")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="slowdown counted as a regression, as a fraction (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    suite = run_suite(args.scale, args.repeat, args.workload)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(suite, out, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as out:
+            json.dump(suite, out, indent=2)
+        print(format_results(suite))
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(format_results(suite))
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("scale") != suite["scale"]:
+        print(f"Warning: baseline was run at scale {baseline.get('scale')}, this run at {suite['scale']}")
+    rows = compare(suite, baseline, args.threshold)
+    print(format_comparison(rows))
+    regressions = [row[0] for row in rows if row[4] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import hashlib
+import marshal
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+
+import AST
+from AST import AST_VERSION, ASTNode
+from lexer import Token, TokenType
+from parser import GRAMMAR_VERSION, OPERATOR_TOKENS, parse
+
+# .splc header: magic, grammar version, AST version (like a .pyc header)
+SPLC_MAGIC = b"SPLC"
+SPLC_HEADER = struct.Struct("<4sHH")
+
+
+def encode_node(value):
+    """Turn an AST into nested tuples and lists that marshal can store"""
+    if isinstance(value, ASTNode):
+        return (type(value).__name__,) + tuple(encode_node(getattr(value, field)) for field in value.__slots__)
+    if isinstance(value, Token):
+        return ("Token", value.type.value)
+    if isinstance(value, list):
+        return [encode_node(item) for item in value]
+    return value
+
+
+def decode_node(value):
+    """Rebuild the AST that encode_node() flattened"""
+    if isinstance(value, tuple):
+        if value[0] == "Token":
+            return OPERATOR_TOKENS[TokenType(value[1])]
+        node_class = getattr(AST, value[0])
+        return node_class(*[decode_node(field) for field in value[1:]])
+    if isinstance(value, list):
+        return [decode_node(item) for item in value]
+    return value
+
+
+def dump_program(program):
+    """Serialize a parsed Program to the bytes of a .splc file"""
+    return SPLC_HEADER.pack(SPLC_MAGIC, GRAMMAR_VERSION, AST_VERSION) + marshal.dumps(encode_node(program))
+
+
+def load_program(data):
+    """Read a Program back from .splc bytes; raises ValueError if they are stale or corrupt"""
+    if len(data) < SPLC_HEADER.size:
+        raise ValueError("Truncated .splc data")
+    magic, grammar_version, ast_version = SPLC_HEADER.unpack_from(data)
+    if magic != SPLC_MAGIC:
+        raise ValueError("Not a .splc file")
+    if (grammar_version, ast_version) != (GRAMMAR_VERSION, AST_VERSION):
+        raise ValueError(f"Stale .splc data (grammar {grammar_version}, AST {ast_version})")
+    try:
+        return decode_node(marshal.loads(data[SPLC_HEADER.size:]))
+    except (EOFError, TypeError, AttributeError, KeyError) as e:
+        raise ValueError(f"Corrupt .splc data: {e}") from None
+
+
+class ProgramCache:
+    """LRU cache of parsed programs, keyed by a hash of the source and the
+    grammar/AST versions.
+
+    Entries are weighed by the length of their source; once the total goes
+    over max_bytes the least recently used ones are evicted. With cache_dir
+    set, every parse is also written there as ``<key>.splc`` so later
+    processes can skip the lexer and parser as well.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    def key(self, code):
+        digest = hashlib.sha256(f"{GRAMMAR_VERSION}.{AST_VERSION}\0".encode())
+        digest.update(code.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def parse(self, code):
+        key = self.key(code)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        program = self.load(key)
+        if program is None:
+            program = parse(code)
+            self.store(key, program)
+        self.insert(key, program, len(code))
+        return program
+
+    def insert(self, key, program, size):
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (program, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.splc")
+
+    def load(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.path(key), "rb") as file:
+                program = load_program(file.read())
+        except (OSError, ValueError):
+            return None
+        self.disk_hits += 1
+        return program
+
+    def store(self, key, program):
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary file first so readers never see half a file
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(dump_program(program))
+            os.replace(temp_path, self.path(key))
+        except OSError:
+            os.unlink(temp_path)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "size": self.size,
+        }
@@ -0,0 +1,251 @@
+from enum import IntEnum
+from AST import *
+from resolver import local_names
+from strings import append_parts
+
+
+class OpCode(IntEnum):
+    LOAD_CONST = 0
+    LOAD_NAME = 1
+    STORE_NAME = 2
+    POP = 3
+    BINARY_ADD = 4
+    BINARY_SUB = 5
+    BINARY_MUL = 6
+    BINARY_DIV = 7
+    COMPARE_GT = 8
+    COMPARE_LT = 9
+    UNARY_NEG = 10
+    PRINT = 11
+    JUMP = 12
+    JUMP_IF_FALSE = 13
+    RETURN = 14
+    APPEND_NAME = 15
+    LOAD_LOCAL = 16
+    STORE_LOCAL = 17
+    APPEND_LOCAL = 18
+    MAKE_FUNCTION = 19
+    CALL = 20
+    START_APPEND_NAME = 21
+    START_APPEND_LOCAL = 22
+    APPEND_PARTS_NAME = 23
+    APPEND_PARTS_LOCAL = 24
+
+
+BINARY_OPCODES = {
+    "PLUS": OpCode.BINARY_ADD,
+    "MINUS": OpCode.BINARY_SUB,
+    "MULTIPLY": OpCode.BINARY_MUL,
+    "DIVIDE": OpCode.BINARY_DIV,
+    "GREATER": OpCode.COMPARE_GT,
+    "LESS": OpCode.COMPARE_LT,
+}
+
+
+class CodeObject:
+    """Flat bytecode: ``code`` holds (opcode, argument) pairs back to back.
+
+    A function's code reads its local variables by index into local_names.
+    """
+
+    def __init__(self, code, constants, names, local_names=()):
+        self.code = code
+        self.constants = constants
+        self.names = names
+        self.local_names = local_names
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            op = OpCode(self.code[pc])
+            arg = self.code[pc + 1]
+            if op == OpCode.LOAD_CONST:
+                detail = f" ({self.constants[arg]!r})"
+            elif op in (OpCode.LOAD_NAME, OpCode.STORE_NAME, OpCode.APPEND_NAME, OpCode.START_APPEND_NAME):
+                detail = f" ({self.names[arg]})"
+            elif op in (OpCode.LOAD_LOCAL, OpCode.STORE_LOCAL, OpCode.APPEND_LOCAL, OpCode.START_APPEND_LOCAL):
+                detail = f" ({self.local_names[arg]})"
+            elif op in (OpCode.APPEND_PARTS_NAME, OpCode.APPEND_PARTS_LOCAL):
+                index, count = self.constants[arg]
+                name = self.names[index] if op == OpCode.APPEND_PARTS_NAME else self.local_names[index]
+                detail = f" ({name}, {count} parts)"
+            elif op == OpCode.MAKE_FUNCTION:
+                detail = f" ({self.constants[arg][0]})"
+            else:
+                detail = ""
+            lines.append(f"{pc:4} {op.name:<18} {arg}{detail}")
+        return "\n".join(lines)
+
+
+class Compiler:
+    """Compiles an AST.py node tree into a CodeObject for the VM.
+
+    Every statement leaves exactly one value on the stack, mirroring the
+    value the tree-walking Interpreter returns for it, so both engines
+    agree on the result of a program. A function body is compiled into a
+    CodeObject of its own, with its local variables in slots numbered as
+    in local_names.
+
+    name = name + part compiles to the part, then APPEND. With more parts
+    it compiles to START_APPEND, which checks the variable and pushes its
+    value, then the parts, then APPEND_PARTS, whose constant is (name or
+    slot, number of parts): the variable is changed once every part has
+    run, as on the tree engine.
+    """
+
+    def __init__(self, local_names=None):
+        self.code = []
+        self.constants = []
+        self.names = []
+        self._constant_index = {}
+        self._name_index = {}
+        self.local_names = local_names
+        self.locals = None if local_names is None else {name: slot for slot, name in enumerate(local_names)}
+
+    def compile(self, node):
+        self.visit(node)
+        self.emit(OpCode.RETURN)
+        return CodeObject(self.code, self.constants, self.names, self.local_names or ())
+
+    def emit(self, op, arg=0):
+        self.code.append(int(op))
+        self.code.append(arg)
+        return len(self.code) - 1
+
+    def patch(self, arg_pos, target):
+        self.code[arg_pos] = target
+
+    def constant(self, value):
+        key = (type(value), value)
+        if key not in self._constant_index:
+            self._constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self._constant_index[key]
+
+    def name(self, name):
+        if name not in self._name_index:
+            self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return self._name_index[name]
+
+    def visit(self, node):
+        method_name = f'compile_{node.__class__.__name__}'
+        method = getattr(self, method_name, self.generic_visit)
+        return method(node)
+
+    def generic_visit(self, node):
+        raise Exception(f"No compile method for {node.__class__.__name__}")
+
+    def compile_block(self, statements):
+        if not statements:
+            self.emit(OpCode.LOAD_CONST, self.constant(None))
+            return
+        for i, statement in enumerate(statements):
+            if i:
+                self.emit(OpCode.POP)
+            self.visit(statement)
+
+    def compile_Program(self, node):
+        self.compile_block(node.statements)
+
+    def compile_Number(self, node):
+        self.emit(OpCode.LOAD_CONST, self.constant(node.value))
+
+    def compile_String(self, node):
+        self.emit(OpCode.LOAD_CONST, self.constant(node.value))
+
+    def compile_Identifier(self, node):
+        if self.locals is not None and node.name in self.locals:
+            self.emit(OpCode.LOAD_LOCAL, self.locals[node.name])
+        else:
+            self.emit(OpCode.LOAD_NAME, self.name(node.name))
+
+    def compile_BinaryOp(self, node):
+        op = BINARY_OPCODES.get(node.operator.type.value)
+        if op is None:
+            raise Exception(f"Unknown binary operator: {node.operator.type}")
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(op)
+
+    def compile_UnaryOp(self, node):
+        self.visit(node.operand)
+        if node.operator.type.value == "MINUS":
+            self.emit(OpCode.UNARY_NEG)
+        elif node.operator.type.value != "PLUS":
+            raise Exception(f"Unknown unary operator: {node.operator.type}")
+
+    def compile_Assignment(self, node):
+        if self.locals is not None and node.name in self.locals:
+            store, append, arg = OpCode.STORE_LOCAL, OpCode.APPEND_LOCAL, self.locals[node.name]
+            start, append_parts_op = OpCode.START_APPEND_LOCAL, OpCode.APPEND_PARTS_LOCAL
+        else:
+            store, append, arg = OpCode.STORE_NAME, OpCode.APPEND_NAME, self.name(node.name)
+            start, append_parts_op = OpCode.START_APPEND_NAME, OpCode.APPEND_PARTS_NAME
+        parts = append_parts(node)
+        if parts is None:
+            self.visit(node.value)
+            self.emit(store, arg)
+            return
+        # name = name + part + ... appends the parts to the variable in place
+        if len(parts) == 1:
+            self.visit(parts[0])
+            self.emit(append, arg)
+            return
+        self.emit(start, arg)
+        for part in parts:
+            self.visit(part)
+        self.emit(append_parts_op, self.constant((arg, len(parts))))
+
+    def compile_FunctionDef(self, node):
+        if self.locals is not None:
+            raise SyntaxError("Functions can only be defined at the top level")
+        names = local_names(node)
+        body = Compiler(names)
+        body.compile_block(node.body)
+        body.emit(OpCode.RETURN)
+        code = CodeObject(body.code, body.constants, body.names, names)
+        # MAKE_FUNCTION makes a Function of these, each time the def runs
+        self.emit(OpCode.MAKE_FUNCTION, self.constant((node.name, len(node.params), code, len(names), node.memo)))
+        self.emit(OpCode.STORE_NAME, self.name(node.name))
+        self.emit(OpCode.POP)
+        self.emit(OpCode.LOAD_CONST, self.constant(None))
+
+    def compile_Call(self, node):
+        self.visit(node.function)
+        for argument in node.arguments:
+            self.visit(argument)
+        self.emit(OpCode.CALL, len(node.arguments))
+
+    def compile_PrintStatement(self, node):
+        for arg in node.arguments:
+            self.visit(arg)
+        self.emit(OpCode.PRINT, len(node.arguments))
+
+    def compile_IfStatement(self, node):
+        self.visit(node.condition)
+        to_else = self.emit(OpCode.JUMP_IF_FALSE)
+        self.compile_block(node.if_body)
+        to_end = self.emit(OpCode.JUMP)
+        self.patch(to_else, len(self.code))
+        self.compile_block(node.else_body)
+        self.patch(to_end, len(self.code))
+
+    def compile_WhileStatement(self, node):
+        self.emit(OpCode.LOAD_CONST, self.constant(None))
+        loop_start = len(self.code)
+        self.visit(node.condition)
+        to_end = self.emit(OpCode.JUMP_IF_FALSE)
+        self.emit(OpCode.POP)
+        self.compile_block(node.body)
+        self.emit(OpCode.JUMP, loop_start)
+        self.patch(to_end, len(self.code))
+
+    def compile_LoopInvariant(self, node):
+        # The VM evaluates invariants in place; only the tree-walker memoizes them
+        self.visit(node.expression)
+
+
+def compile_ast(ast):
+    """Convenience function to compile a parsed Program"""
+    return Compiler().compile(ast)
@@ -0,0 +1,108 @@
+"""Loads the SPL interpreter embedded in script.js as a Python module.
+
+The web IDE runs that source under Pyodide; this lets benchmarks and tests
+run the same code with a regular Python interpreter. It also builds
+spl_interpreter.zip, the package the IDE imports at startup:
+
+    python embedded.py [output.zip]
+
+Build it with the Python version Pyodide runs (3.11 for Pyodide 0.24) so
+the bytecode in it is used rather than recompiled from source.
+"""
+import contextlib
+import importlib.util
+import io
+import marshal
+import os
+import re
+import sys
+import time
+import types
+import zipfile
+import zipimport
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_PATH = os.path.join(ROOT, "script.js")
+PACKAGE_PATH = os.path.join(ROOT, "spl_interpreter.zip")
+MODULE_NAME = "spl_interpreter"
+
+# Escapes a JS template literal can contain, mapped to the characters they stand for
+TEMPLATE_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+def embedded_source(path=SCRIPT_PATH):
+    """Return the Python source held in script.js's splInterpreterCode template"""
+    with open(path, encoding="utf-8") as f:
+        script = f.read()
+    match = re.search(r"const splInterpreterCode = `(.*?)`;", script, re.S)
+    if match is None:
+        raise ValueError(f"No splInterpreterCode template in {path}")
+    return re.sub(r"\\(.)", lambda m: TEMPLATE_ESCAPES.get(m.group(1), m.group(1)),
+                  match.group(1), flags=re.S)
+
+
+def load_embedded(path=SCRIPT_PATH):
+    """Execute the embedded interpreter source and return it as a module"""
+    module = types.ModuleType("spl_embedded")
+    exec(compile(embedded_source(path), "<splInterpreterCode>", "exec"), module.__dict__)
+    return module
+
+
+def build_package(path=PACKAGE_PATH, script_path=SCRIPT_PATH):
+    """Write the embedded interpreter to a zip as the module spl_interpreter.
+
+    The zip holds the module compiled to bytecode for this Python, which
+    zipimport loads without parsing or compiling anything. The source is
+    stored beside it, and zipimport falls back to it under a Python whose
+    bytecode format differs. Entries get a fixed date so a rebuild of the
+    same source gives the same file.
+    """
+    source = embedded_source(script_path).encode("utf-8")
+    code = compile(source, f"{MODULE_NAME}.py", "exec")
+    # An unchecked hash-based .pyc: no timestamps to compare, nothing to recompile
+    pyc = (importlib.util.MAGIC_NUMBER + (0b01).to_bytes(4, "little")
+           + importlib.util.source_hash(source) + marshal.dumps(code))
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as package:
+        for name, data in ((f"{MODULE_NAME}.pyc", pyc), (f"{MODULE_NAME}.py", source)):
+            package.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), data,
+                             compress_type=zipfile.ZIP_DEFLATED)
+    return path
+
+
+def load_package(path=PACKAGE_PATH):
+    """Import spl_interpreter from a zip built by build_package() as a new module"""
+    spec = zipimport.zipimporter(path).find_spec(MODULE_NAME)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def packaged_source(path=PACKAGE_PATH):
+    """The interpreter source stored in a package built by build_package()"""
+    with zipfile.ZipFile(path) as package:
+        return package.read(f"{MODULE_NAME}.py").decode("utf-8")
+
+
+def _best_time(load, repeat=5):
+    times = []
+    # Silence the interpreter's loading message
+    with contextlib.redirect_stdout(io.StringIO()):
+        load()  # Once first, so the timings exclude the stdlib imports
+        for _ in range(repeat):
+            start = time.perf_counter()
+            load()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    path = build_package(sys.argv[1] if len(sys.argv) > 1 else PACKAGE_PATH)
+    print(f"Wrote {path} ({os.path.getsize(path)} bytes) for Python {sys.version.split()[0]}")
+    source_time = _best_time(load_embedded)
+    package_time = _best_time(lambda: load_package(path))
+    print(f"Compile from source: {source_time * 1000:7.1f} ms")
+    print(f"Import from the zip: {package_time * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
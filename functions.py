@@ -0,0 +1,72 @@
+"""User-defined functions.
+
+def name(a, b): body defines a function whose result is the value of its
+body, as a program's is the value of its last statement. Parameters and
+the names a body assigns are local to each call and live in a list of slots,
+the call's frame; other names are global. @memo before def keeps the
+function's results by argument in a Memo, so a pure function is only run
+once for each set of arguments it is called with.
+"""
+from collections import OrderedDict
+from resolver import UNDEFINED
+
+# Results a @memo function keeps when no size is given
+DEFAULT_MEMO_SIZE = 1024
+
+# Calls deeper than this raise CallDepthError
+MAX_CALL_DEPTH = 10000
+
+
+class CallDepthError(RecursionError):
+    """Raised when calls nest deeper than MAX_CALL_DEPTH, or than the Python stack allows"""
+
+
+class Function:
+    """The value a def statement gives its name.
+
+    body is what the engine runs: the resolved statements for the tree
+    Interpreter, a CodeObject for the VM. cost is the number of nodes in the
+    body, charged to quotas on every call.
+    """
+    __slots__ = ("name", "arity", "body", "local_count", "memo", "cost")
+
+    def __init__(self, name, arity, body, local_count, memo_size=None, cost=0):
+        self.name = name
+        self.arity = arity
+        self.body = body
+        self.local_count = local_count
+        self.memo = Memo(memo_size) if memo_size else None
+        self.cost = cost
+
+    def frame(self, args):
+        """The slots of a call with the argument values args, which it takes over"""
+        if len(args) != self.arity:
+            raise TypeError(f"{self.name}() takes {self.arity} arguments but {len(args)} were given")
+        if self.local_count > self.arity:
+            args.extend([UNDEFINED] * (self.local_count - self.arity))
+        return args
+
+    def __repr__(self):
+        return f"<function {self.name}>"
+
+
+class Memo:
+    """A bounded LRU cache of a function's results by argument tuple"""
+    __slots__ = ("size", "results")
+
+    def __init__(self, size):
+        self.size = size
+        self.results = OrderedDict()
+
+    def get(self, key, default=None):
+        results = self.results
+        if key in results:
+            results.move_to_end(key)
+            return results[key]
+        return default
+
+    def put(self, key, value):
+        results = self.results
+        results[key] = value
+        if len(results) > self.size:
+            results.popitem(last=False)
@@ -1,23 +1,107 @@
+import inspect
+import mmap
+import os
+import sys
+from collections import deque
 from AST import *
-from parser import parse
+from parser import parse, parse_stream
+from resolver import SlotTable, Resolver, UNDEFINED
+from functions import MAX_CALL_DEPTH, CallDepthError, Function
+from quotas import count_nodes
+from strings import StringBuilder, flatten
+
+# Memo.get() result for arguments a function has no result for yet
+_MISSING = object()
+
+# Python frames an SPL call may take on the tree engine: the visits of the
+# statements and expressions between one call and the next
+FRAMES_PER_CALL = 50
+
+def make_sink(sink):
+    """Turn a callable, generator or file-like object into a function taking a list of lines"""
+    if sink is None or callable(sink):
+        return sink
+    if inspect.isgenerator(sink):
+        next(sink)  # Run it up to its first yield, ready for send()
+        return sink.send
+    if hasattr(sink, "write"):
+        return lambda lines: sink.write("".join(line + "\n" for line in lines))
+    raise TypeError(f"Not an output sink: {sink!r}")
 
 class OutputHandler:
-    def __init__(self):
-        self.output = []
+    """Collects the lines a program prints.
+
+    Only the last max_lines lines are kept (all of them if it is None), and
+    dropped counts the ones that fell off the front. With a sink, every line
+    is also passed on in batches of batch_size; flush() sends a partial
+    batch. The sink can be a callable or a generator, which get a list of
+    lines, or a file-like object, which gets them joined with newlines.
+    """
+
+    def __init__(self, sink=None, batch_size=1, max_lines=None):
+        self.sink = make_sink(sink)
+        self.batch_size = batch_size
+        self.output = deque(maxlen=max_lines)
+        self.pending = []
+        self.dropped = 0
     
     def write(self, text):
-        self.output.append(str(text))
+        line = str(text)
+        if len(self.output) == self.output.maxlen:
+            self.dropped += 1
+        self.output.append(line)
+        if self.sink is not None:
+            self.pending.append(line)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if self.pending:
+            lines, self.pending = self.pending, []
+            self.sink(lines)
     
     def get_output(self):
-        return self.output
+        return list(self.output)
     
     def clear(self):
-        self.output = []
+        self.output.clear()
+        self.pending = []
+        self.dropped = 0
 
 class Interpreter:
-    def __init__(self):
-        self.variables = {}
+    def __init__(self, quotas=None, profiler=None):
+        # A dict-like SlotTable; resolved nodes index its slots list directly
+        self.variables = SlotTable()
+        self.slots = self.variables.slots
         self.output_handler = OutputHandler()
+        # A quotas.Quotas to enforce, or None to run without limits
+        self.quotas = quotas
+        # One dict of LoopInvariant values per running while loop of the
+        # program or function running now
+        self.loop_frames = []
+        # The local slots of the function call running now, and the number
+        # of calls under way
+        self.frame = None
+        self.depth = 0
+        # A profiler.Profiler timing every visit, or None
+        self.profiler = profiler
+        if profiler is not None:
+            self.visit = profiler.wrap(self.visit)
+
+    def run(self, program):
+        """Resolve the variables of program to slots of this interpreter, then execute it"""
+        return flatten(self.execute(program))
+
+    def execute(self, program):
+        """run() without flattening the result, which may be a StringBuilder"""
+        # Each SPL call nests Python calls, so let Python's stack hold
+        # MAX_CALL_DEPTH of them while the program runs
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, MAX_CALL_DEPTH * FRAMES_PER_CALL))
+        try:
+            return self.visit(Resolver(self.variables).resolve(program))
+        finally:
+            sys.setrecursionlimit(limit)
 
     def visit(self, node):
         method_name = f'visit_{node.__class__.__name__}'
@@ -40,10 +124,21 @@ class Interpreter:
         return node.value
     
     def visit_Identifier(self, node):
-        if node.name in self.variables:
-            return self.variables[node.name]
-        else:
+        slot = node.slot if node.slot is not None else self.variables.slot(node.name)
+        value = self.slots[slot]
+        if value is UNDEFINED:
             raise NameError(f"Variable '{node.name}' is not defined")
+        if type(value) is StringBuilder:
+            return value.build()
+        return value
+
+    def visit_Local(self, node):
+        value = self.frame[node.slot]
+        if value is UNDEFINED:
+            raise NameError(f"Variable '{node.name}' is not defined")
+        if type(value) is StringBuilder:
+            return value.build()
+        return value
         
     def visit_BinaryOp(self, node):
         left = self.visit(node.left)
@@ -51,11 +146,16 @@ class Interpreter:
 
         if node.operator.type.value == "PLUS":
             if isinstance(left, str) or isinstance(right, str):
-                return str(left) + str(right)
+                text = str(left) + str(right)
+                if self.quotas is not None:
+                    self.quotas.charge_string(text)
+                return text
             return left + right
         elif node.operator.type.value == "MINUS":
             return left - right
         elif node.operator.type.value == "MULTIPLY":
+            if self.quotas is not None:
+                return self.quotas.multiply(left, right)
             return left * right
         elif node.operator.type.value == "DIVIDE":
             if right == 0:
@@ -80,9 +180,90 @@ class Interpreter:
     
     def visit_Assignment(self, node):
         value = self.visit(node.value)
-        self.variables[node.name] = value
+        slot = node.slot if node.slot is not None else self.variables.slot(node.name)
+        self.slots[slot] = value
         return value
     
+    def visit_LocalAssignment(self, node):
+        value = self.frame[node.slot] = self.visit(node.value)
+        return value
+
+    def visit_Append(self, node):
+        return self._append(self.slots, node)
+
+    def visit_LocalAppend(self, node):
+        return self._append(self.frame, node)
+
+    def _append(self, slots, node):
+        current = slots[node.slot]
+        if current is UNDEFINED:
+            raise NameError(f"Variable '{node.name}' is not defined")
+        # Strings to append; the variable is only changed once every part has run
+        pending = []
+        for part in node.parts:
+            value = self.visit(part)
+            if pending or isinstance(value, str) or isinstance(current, (str, StringBuilder)):
+                text = str(value)
+                if self.quotas is not None:
+                    self.quotas.charge_string_length(len(text))
+                pending.append(text)
+            else:
+                current = current + value
+        if pending:
+            if type(current) is StringBuilder:
+                current.extend(pending)
+            else:
+                current = StringBuilder([str(current)] + pending)
+        slots[node.slot] = current
+        return current
+
+    def visit_FunctionDef(self, node):
+        cost = count_nodes(node.body) if self.quotas is not None else 0
+        self.slots[node.slot] = Function(node.name, len(node.params), node.body, node.local_count, node.memo, cost)
+        return None
+
+    def visit_Call(self, node):
+        function = self.visit(node.function)
+        args = [self.visit(argument) for argument in node.arguments]
+        if type(function) is not Function:
+            raise TypeError(f"{function!r} is not a function")
+        return self.call(function, args)
+
+    def call(self, function, args):
+        """Run function with the argument values args in a frame of its own, and return its result"""
+        memo = function.memo
+        if memo is not None:
+            key = tuple(args)
+            result = memo.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+        frame = function.frame(args)
+        if self.depth >= MAX_CALL_DEPTH:
+            raise CallDepthError(f"Maximum call depth of {MAX_CALL_DEPTH} exceeded in {function.name}()")
+        if self.quotas is not None:
+            self.quotas.charge_nodes(function.cost)
+        outer_frame, outer_loops = self.frame, self.loop_frames
+        # Invariant depths in a function body count from its own loops
+        self.frame, self.loop_frames = frame, []
+        self.depth += 1
+        try:
+            result = None
+            for statement in function.body:
+                result = self.visit(statement)
+        except RecursionError as error:
+            if isinstance(error, CallDepthError):
+                raise
+            # Python's stack ran out first, in a body nesting unusually deep
+            raise CallDepthError(f"Maximum call depth exceeded in {function.name}() "
+                                 f"at depth {self.depth}: out of Python stack") from None
+        finally:
+            self.frame, self.loop_frames = outer_frame, outer_loops
+            self.depth -= 1
+        result = flatten(result)
+        if memo is not None:
+            memo.put(key, result)
+        return result
+
     def visit_PrintStatement(self, node):
         values = []
         for arg in node.arguments:
@@ -90,6 +271,8 @@ class Interpreter:
             values.append(str(value))
         
         output_line = " ".join(values)
+        if self.quotas is not None:
+            self.quotas.charge_output_line()
         self.output_handler.write(output_line)
         return None
     
@@ -108,12 +291,93 @@ class Interpreter:
     
     def visit_WhileStatement(self, node):
         result = None
-        while self.visit(node.condition):
-            for statement in node.body:
-                result = self.visit(statement)
+        quotas = self.quotas
+        # Each iteration is charged as every node in the loop
+        cost = count_nodes(node) if quotas is not None else 0
+        self.loop_frames.append({})
+        try:
+            while self.visit(node.condition):
+                if quotas is not None:
+                    quotas.charge_nodes(cost)
+                for statement in node.body:
+                    result = self.visit(statement)
+        finally:
+            self.loop_frames.pop()
         return result
 
-def interpret(code):
-    ast = parse(code)
-    interpreter = Interpreter()
-    return interpreter.visit(ast)
\ No newline at end of file
+    def visit_LoopInvariant(self, node):
+        frame = self.loop_frames[node.depth]
+        if node in frame:
+            return frame[node]
+        value = frame[node] = self.visit(node.expression)
+        return value
+
+def _make_runner(engine, output, quotas=None, profiler=None):
+    """Return a function that runs an optimized Program on a new engine printing to output"""
+    if quotas is not None:
+        if engine != "tree":
+            raise ValueError("Quotas are only enforced by the tree engine")
+        quotas.start()
+    if profiler is not None and engine != "tree":
+        raise ValueError("Only the tree engine can be profiled")
+    if engine == "tree":
+        interpreter = Interpreter(quotas, profiler)
+        if output is not None:
+            interpreter.output_handler = output
+        return interpreter.execute
+    elif engine == "vm":
+        from compiler import compile_ast
+        from vm import VM
+        vm = VM()
+        if output is not None:
+            vm.output_handler = output
+        return lambda program: vm.execute(compile_ast(program))
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+def interpret(code, engine="tree", cache=None, optimize=1, output=None, quotas=None, profiler=None):
+    """Parse and run code with the tree-walking Interpreter or the bytecode VM.
+
+    Pass a cache.ProgramCache to reuse the parse of code seen before;
+    optimize is the optimizer level (0, 1 or 2, as in -O0/-O1/-O2). Printed
+    lines go to output, an OutputHandler, which is flushed when the program
+    ends. With quotas.Quotas the run raises QuotaExceededError once it goes
+    over a limit, and a profiler.Profiler records where the run's time went.
+    """
+    from optimizer import optimize_ast
+    run = _make_runner(engine, output, quotas, profiler)
+    try:
+        return flatten(run(optimize_ast(parse(code, cache), optimize)))
+    finally:
+        if output is not None:
+            output.flush()
+
+def interpret_stream(source, engine="tree", chunk_size=1 << 16, optimize=1, output=None, quotas=None,
+                     profiler=None):
+    """Run a file object or mmap, executing each top-level statement as soon as it is parsed"""
+    from optimizer import optimize_ast
+    run = _make_runner(engine, output, quotas, profiler)
+    result = None
+    try:
+        for statement in parse_stream(source, chunk_size):
+            result = run(optimize_ast(Program([statement]), optimize))
+    finally:
+        if output is not None:
+            output.flush()
+    return flatten(result)
+
+def interpret_file(path, engine="tree", cache=None, optimize=1, output=None, quotas=None, profiler=None):
+    """Memory-map the file at path and stream it through interpret_stream().
+
+    With a cache.ProgramCache the whole file is read and run through
+    interpret() instead, so a script that was parsed before skips parsing.
+    """
+    if cache is not None:
+        with open(path, encoding="utf-8") as file:
+            return interpret(file.read(), engine, cache, optimize, output, quotas, profiler)
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return interpret_stream(file, engine, optimize=optimize, output=output, quotas=quotas, profiler=profiler)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return interpret_stream(mapped, engine, optimize=optimize, output=output, quotas=quotas,
+                                    profiler=profiler)
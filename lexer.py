@@ -1,7 +1,12 @@
 from enum import Enum
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
+from array import array
+from collections import deque
+import codecs
 import string
+import sys
+import re
 
 
 class TokenType(Enum):
@@ -12,6 +17,8 @@ class TokenType(Enum):
     DIVIDE = "DIVIDE"
     LPAREN = "LPAREN"
     RPAREN = "RPAREN"
+    COMMA = "COMMA"
+    AT = "AT"
 
     IDENTIFIER = "IDENTIFIER"
     STRING = "STRING"
@@ -31,6 +38,8 @@ class TokenType(Enum):
     NEWLINE = "NEWLINE"
 
 class Token:
+    __slots__ = ("type", "value", "line", "column")
+
     def __init__(self, type, value, line, column):
         self.type = type
         self.value = value
@@ -40,6 +49,100 @@ class Token:
     def __str__(self):
         return f"Token({self.type}, {self.value})"
 
+TOKEN_TYPES = list(TokenType)
+TOKEN_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+
+# Tokens whose value is implied by their type
+FIXED_VALUES = {
+    TokenType.PLUS: "+", TokenType.MINUS: "-", TokenType.MULTIPLY: "*",
+    TokenType.DIVIDE: "/", TokenType.LPAREN: "(", TokenType.RPAREN: ")",
+    TokenType.COMMA: ",", TokenType.AT: "@",
+    TokenType.ASSIGN: "=", TokenType.GREATER: ">", TokenType.LESS: "<",
+    TokenType.COLON: ":", TokenType.NEWLINE: "\\n", TokenType.EOF: "",
+}
+
+class TokenBuffer:
+    """Struct-of-arrays token stream.
+
+    Token types, source offsets, lines and columns are kept in parallel
+    typed arrays instead of one Token object per token. Values are sliced
+    out of the source text on demand; only values that cannot be recovered
+    that way (string literals with escapes) are stored in ``values``.
+    """
+
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.types = array("B")
+        self.offsets = array("I")
+        self.ends = array("I")
+        self.lines = array("I")
+        self.columns = array("I")
+        self.values = {}
+
+    @classmethod
+    def from_tokens(cls, tokens: List[Token]) -> "TokenBuffer":
+        buffer = cls()
+        for token in tokens:
+            buffer.append(token, 0, 0)
+        return buffer
+
+    def append(self, token: Token, start: int, end: int):
+        index = len(self.types)
+        self.types.append(TOKEN_CODES[token.type])
+        self.offsets.append(start)
+        self.ends.append(end)
+        self.lines.append(token.line)
+        self.columns.append(token.column)
+
+        if token.type not in FIXED_VALUES and self.text[start:end] != token.value:
+            self.values[index] = token.value
+
+    def __len__(self):
+        return len(self.types)
+
+    def has(self, index: int) -> bool:
+        return index < len(self.types)
+
+    def type(self, index: int) -> TokenType:
+        return TOKEN_TYPES[self.types[index]]
+
+    def value(self, index: int):
+        token_type = TOKEN_TYPES[self.types[index]]
+        if token_type in FIXED_VALUES:
+            return FIXED_VALUES[token_type]
+        if index in self.values:
+            return self.values[index]
+        value = self.text[self.offsets[index]:self.ends[index]]
+        return sys.intern(value) if token_type == TokenType.IDENTIFIER else value
+
+    def position(self, index: int) -> Tuple[int, int]:
+        return self.lines[index], self.columns[index]
+
+    def __getitem__(self, index: int) -> Token:
+        if index < 0:
+            index += len(self.types)
+        return Token(self.type(index), self.value(index), self.lines[index], self.columns[index])
+
+OPERATOR_TYPES = {value: token_type for token_type, value in FIXED_VALUES.items() if len(value) == 1}
+
+# Master pattern for the common ASCII tokens. Anything it declines (errors,
+# non-ASCII text, strings spanning lines) is handed to the character scanner,
+# so both paths produce the same tokens and LexerError messages.
+TOKEN_PATTERN = re.compile(r'''[ \t]*(?:
+    (?P<NEWLINE>\n)
+  | (?P<IDENTIFIER>[A-Za-z_][A-Za-z0-9_]*)(?![A-Za-z0-9_]|[^\x00-\x7f])
+  | (?P<NUMBER>[0-9]+(?:\.[0-9]*)?)(?![0-9.A-Za-z_]|[^\x00-\x7f])
+  | (?P<STRING>"(?:[^"\\\n]|\\[^\n])*"|'(?:[^'\\\n]|\\[^\n])*')
+  | (?P<OPERATOR>[-+*/()=><:,@])
+)''', re.VERBOSE)
+
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+ESCAPES = {"n": "\n", "t": "\t"}
+
+def _unescape(match):
+    char = match.group(1)
+    return ESCAPES.get(char, char)
+
 class LexerError(Exception):
     def __init__(self, message: str, line:int, column:int):
         self.message = message
@@ -53,6 +156,7 @@ class Tokenizer:
         self.pos = 0
         self.line = 1
         self.column = 1
+        self.token_start = 0
 
         self.keywords = {
             "if": TokenType.IF,
@@ -122,6 +226,7 @@ class Tokenizer:
         while (self.peek() and (self.peek().isalnum() or self.peek()== "_")):
             result += self.advance()
 
+        result = sys.intern(result)
         token_type = self.keywords.get(result, TokenType.IDENTIFIER)
 
         return Token(token_type, result, self.line, start_column)
@@ -160,6 +265,7 @@ class Tokenizer:
         while self.peek():
             current_char = self.peek()
             start_column = self.column
+            self.token_start = self.pos
 
             if current_char in " \t":
                 self.skip_whitespace()
@@ -192,6 +298,10 @@ class Tokenizer:
                 return Token(TokenType.LPAREN, "(", self.line, start_column)
             elif current_char == ")":
                 return Token(TokenType.RPAREN, ")", self.line, start_column)
+            elif current_char == ",":
+                return Token(TokenType.COMMA, ",", self.line, start_column)
+            elif current_char == "@":
+                return Token(TokenType.AT, "@", self.line, start_column)
             elif current_char == "=":
                 return Token(TokenType.ASSIGN, "=", self.line, start_column)
             elif current_char == ">":
@@ -203,23 +313,240 @@ class Tokenizer:
             else:
                 self.error(f"Unexpected Character: '{current_char}'")
         
+        self.token_start = self.pos
         return Token(TokenType.EOF, "", self.line, self.column)
 
-    def tokenize(self) -> List[Token]:
-        tokens = []
+    def check_trailing_operator(self, last_token: Optional[Token]):
+        # Check for incomplete expressions (trailing operators)
+        if last_token and last_token.type in [TokenType.PLUS, TokenType.MINUS, TokenType.MULTIPLY, TokenType.DIVIDE]:
+            raise LexerError(f"Incomplete expression: trailing operator '{last_token.value}'", 
+                           last_token.line, last_token.column)
 
+    def iter_tokens(self) -> Iterator[Token]:
+        """Yield tokens up to and including EOF using TOKEN_PATTERN.
+
+        ``token_start`` and ``pos`` describe the source span of each token
+        as it is yielded.
+        """
         while True:
-            token = self.next_token()
-            tokens.append(token)
+            limit = self.scan_limit()
+            yield from self.scan_fast(limit)
+            if self.pos == limit and self.more_input():
+                continue
 
+            # TOKEN_PATTERN stopped: let the character scanner take one token
+            token = self.next_token()
+            yield token
             if token.type == TokenType.EOF:
-                break
+                return
+
+    def scan_limit(self) -> int:
+        return len(self.text)
+
+    def more_input(self) -> bool:
+        return False
+
+    def scan_fast(self, limit: int) -> Iterator[Token]:
+        text = self.text
+        keywords = self.keywords
+        intern = sys.intern
+        line = self.line
+        line_start = self.pos - self.column + 1
+
+        for match in iter(TOKEN_PATTERN.scanner(text, self.pos, limit).match, None):
+            kind = match.lastgroup
+            value = match.group(kind)
+            start = match.start(kind)
+            self.token_start = start
+            self.pos = end = match.end()
+
+            if kind == "IDENTIFIER":
+                value = intern(value)
+                yield Token(keywords.get(value, TokenType.IDENTIFIER), value, line, start - line_start + 1)
+            elif kind == "OPERATOR":
+                yield Token(OPERATOR_TYPES[value], value, line, start - line_start + 1)
+            elif kind == "NUMBER":
+                yield Token(TokenType.NUMBER, value, line, start - line_start + 1)
+            elif kind == "NEWLINE":
+                self.line = line + 1
+                self.column = 1
+                yield Token(TokenType.NEWLINE, "\\n", line, start - line_start + 1)
+                line += 1
+                line_start = end
+            else:
+                yield Token(TokenType.STRING, self.decode_string(value), line, start - line_start + 1)
+
+        self.line = line
+        self.column = self.pos - line_start + 1
+
+    def decode_string(self, literal: str) -> str:
+        value = literal[1:-1]
+        if "\\" in value:
+            value = ESCAPE_PATTERN.sub(_unescape, value)
+        return value
+
+    def tokenize(self) -> List[Token]:
+        tokens = list(self.iter_tokens())
         
-        # Check for incomplete expressions (trailing operators)
         if len(tokens) >= 2:
-            second_last_token = tokens[-2]  # Second to last token (before EOF)
-            if second_last_token.type in [TokenType.PLUS, TokenType.MINUS, TokenType.MULTIPLY, TokenType.DIVIDE]:
-                raise LexerError(f"Incomplete expression: trailing operator '{second_last_token.value}'", 
-                               second_last_token.line, second_last_token.column)
+            self.check_trailing_operator(tokens[-2])  # Second to last token (before EOF)
         
-        return tokens
\ No newline at end of file
+        return tokens
+
+    def tokenize_buffer(self) -> TokenBuffer:
+        """Like tokenize(), but stores the tokens in a compact TokenBuffer.
+
+        The TOKEN_PATTERN fast path writes straight into the buffer arrays
+        without creating Token objects.
+        """
+        text = self.text
+        buffer = TokenBuffer(text)
+        add_type, add_offset, add_end = buffer.types.append, buffer.offsets.append, buffer.ends.append
+        add_line, add_column = buffer.lines.append, buffer.columns.append
+        values = buffer.values
+        codes = {token_type.value: TOKEN_CODES[token_type] for token_type in TokenType}
+        keyword_codes = {word: TOKEN_CODES[token_type] for word, token_type in self.keywords.items()}
+        operator_codes = {value: TOKEN_CODES[token_type] for value, token_type in OPERATOR_TYPES.items()}
+        identifier_code = TOKEN_CODES[TokenType.IDENTIFIER]
+
+        while True:
+            line = self.line
+            pos = self.pos
+            line_start = pos - self.column + 1
+            for match in iter(TOKEN_PATTERN.scanner(text, pos).match, None):
+                kind = match.lastgroup
+                start = match.start(kind)
+                pos = match.end()
+
+                if kind == "IDENTIFIER":
+                    add_type(keyword_codes.get(match.group(kind), identifier_code))
+                elif kind == "OPERATOR":
+                    add_type(operator_codes[match.group(kind)])
+                else:
+                    if kind == "STRING":
+                        values[len(buffer.types)] = self.decode_string(match.group(kind))
+                    add_type(codes[kind])
+                add_offset(start)
+                add_end(pos)
+                add_line(line)
+                add_column(start - line_start + 1)
+
+                if kind == "NEWLINE":
+                    line += 1
+                    line_start = pos
+
+            # TOKEN_PATTERN stopped: let the character scanner take one token
+            self.line = line
+            self.pos = pos
+            self.column = pos - line_start + 1
+            token = self.next_token()
+            buffer.append(token, self.token_start, self.pos)
+            if token.type == TokenType.EOF:
+                break
+
+        last_token = buffer[len(buffer) - 2] if len(buffer) >= 2 else None
+        self.check_trailing_operator(last_token)
+        return buffer
+
+class StreamTokenizer(Tokenizer):
+    """Tokenizer that reads its source in chunks from a file object or mmap.
+
+    Only the unconsumed part of the source is kept in ``text``. The
+    TOKEN_PATTERN fast path is limited to whole lines, so no match can be
+    cut short by a chunk boundary; the character scanner pulls in more
+    input on demand through peek() and advance().
+    """
+
+    def __init__(self, source, chunk_size: int = 1 << 16):
+        super().__init__("")
+        self.source = source
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.exhausted = False
+        self.offset = 0  # Position of text[0] in the whole source
+
+    def fill(self) -> bool:
+        while not self.exhausted:
+            data = self.source.read(self.chunk_size)
+            if isinstance(data, (bytes, bytearray)):
+                chunk = self.decoder.decode(data, final=not data)
+            else:
+                chunk = data
+            if not data:
+                self.exhausted = True
+            if chunk:
+                self.text += chunk
+                return True
+        return False
+
+    def scan_limit(self) -> int:
+        # Drop consumed text; this only happens between tokens
+        self.offset += self.pos
+        self.token_start -= self.pos
+        self.text = self.text[self.pos:]
+        self.pos = 0
+
+        while True:
+            limit = self.text.rfind("\n") + 1
+            if limit or not self.fill():
+                return limit or len(self.text)
+
+    def more_input(self) -> bool:
+        return self.pos < len(self.text) or not self.exhausted
+
+    def peek(self, offset: int = 0) -> Optional[str]:
+        while self.pos + offset >= len(self.text) and self.fill():
+            pass
+        return super().peek(offset)
+
+    def advance(self):
+        self.peek()
+        return super().advance()
+
+    def iter_tokens(self) -> Iterator[Token]:
+        last_token = None
+        for token in super().iter_tokens():
+            if token.type == TokenType.EOF:
+                self.check_trailing_operator(last_token)
+            yield token
+            last_token = token
+
+class TokenStream:
+    """Small lookahead window over a token iterator, indexed like TokenBuffer.
+
+    Parser only ever reads the current token and the one after it, so
+    tokens more than one place behind the latest requested index are
+    dropped as the parser moves on.
+    """
+
+    def __init__(self, tokens: Iterator[Token]):
+        self.tokens = iter(tokens)
+        self.window = deque()
+        self.start = 0  # Index of window[0]
+
+    def has(self, index: int) -> bool:
+        while index >= self.start + len(self.window):
+            token = next(self.tokens, None)
+            if token is None:
+                return False
+            self.window.append(token)
+
+        while self.start < index - 1:
+            self.window.popleft()
+            self.start += 1
+        return True
+
+    def type(self, index: int) -> TokenType:
+        return self[index].type
+
+    def value(self, index: int):
+        return self[index].value
+
+    def position(self, index: int) -> Tuple[int, int]:
+        token = self[index]
+        return token.line, token.column
+
+    def __getitem__(self, index: int) -> Token:
+        if not self.has(index):
+            raise IndexError(index)
+        return self.window[index - self.start]
@@ -0,0 +1,148 @@
+"""Command-line entry point for running SPL programs.
+
+    python main.py run program.spl
+    python main.py run program.spl --profile
+    python main.py batch tests/ --jobs 8 > results.jsonl
+
+``batch`` runs every .spl file under the given paths in a pool of worker
+processes and writes one JSON object per file, in input order, with the
+exit status, wall time, result and printed output of the run. ``--profile``
+prints a table of the program's hottest lines to stderr after it runs.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import ProgramCache
+from interpreter import OutputHandler, interpret, interpret_file
+from profiler import Profiler
+
+# Set in each batch worker by _init_worker(), so every file it runs reuses them
+_worker_options = None
+_worker_cache = None
+
+
+def run_file(path, engine="tree", optimize=1, cache=None, output=None, profiler=None):
+    """Run the program at path; returns a JSON-ready dict describing the run.
+
+    With a profiler.Profiler the dict also has its report under "profile".
+    """
+    output = output if output is not None else OutputHandler()
+    start = time.perf_counter()
+    try:
+        if cache is not None:
+            with open(path, encoding="utf-8") as file:
+                result = interpret(file.read(), engine, cache, optimize, output, profiler=profiler)
+        else:
+            result = interpret_file(path, engine, optimize=optimize, output=output, profiler=profiler)
+        status, error = 0, None
+    except Exception as e:
+        result, status, error = None, 1, f"{type(e).__name__}: {e}"
+    record = {
+        "file": path,
+        "status": status,
+        "time": time.perf_counter() - start,
+        "result": result,
+        "error": error,
+        "output": output.get_output(),
+    }
+    if profiler is not None:
+        record["profile"] = profiler.report()
+    return record
+
+
+def _init_worker(engine, optimize, cache_dir):
+    global _worker_options, _worker_cache
+    _worker_options = (engine, optimize)
+    _worker_cache = ProgramCache(cache_dir=cache_dir) if cache_dir else None
+    # Run a small program once so the first real file doesn't pay for warm-up
+    interpret("x = 1\nwhile x < 2: x = x + 1", engine, optimize=optimize)
+
+
+def _run_in_worker(path):
+    engine, optimize = _worker_options
+    return run_file(path, engine, optimize, _worker_cache)
+
+
+def find_programs(paths):
+    """Yield the .spl files named by paths, searching directories recursively in sorted order"""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".spl"):
+                    yield os.path.join(root, name)
+
+
+def run_batch(paths, jobs=None, engine="tree", optimize=1, cache_dir=None, out=None):
+    """Run every program in paths across jobs worker processes, writing JSON lines to out (stdout by default).
+
+    Returns the number of programs that failed.
+    """
+    out = out or sys.stdout
+    files = list(find_programs(paths))
+    jobs = jobs or os.cpu_count() or 1
+    # Hand files out in chunks so inter-process overhead doesn't dominate small programs
+    chunksize = max(1, min(64, len(files) // (jobs * 4)))
+    failures = 0
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(engine, optimize, cache_dir)) as pool:
+        for record in pool.map(_run_in_worker, files, chunksize=chunksize):
+            failures += record["status"] != 0
+            out.write(json.dumps(record, default=str) + "\n")
+    return failures
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="spl", description="Run Simple Programming Language programs")
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--engine", choices=["tree", "vm"], default="tree",
+                         help="tree-walking interpreter or bytecode VM (default: tree)")
+    options.add_argument("-O", dest="optimize", type=int, choices=[0, 1, 2], default=1,
+                         help="optimization level, as in -O0, -O1 or -O2 (default: 1)")
+    options.add_argument("--cache-dir", help="directory for cached .splc parses")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", parents=[options], help="run one program")
+    run.add_argument("file")
+    run.add_argument("--profile", action="store_true", help="print the hottest lines to stderr (tree engine only)")
+
+    batch = commands.add_parser("batch", parents=[options], help="run many programs in parallel, printing JSON lines")
+    batch.add_argument("paths", nargs="+", help=".spl files or directories to search")
+    batch.add_argument("--jobs", "-j", type=int, help="worker processes (default: one per CPU)")
+    batch.add_argument("--output", "-o", help="write the JSON lines here instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "run":
+        cache = ProgramCache(cache_dir=args.cache_dir) if args.cache_dir else None
+        # Printed lines go straight to stdout rather than being collected
+        output = OutputHandler(sys.stdout, max_lines=0)
+        profiler = Profiler() if args.profile else None
+        record = run_file(args.file, args.engine, args.optimize, cache, output, profiler)
+        if record["error"] is not None:
+            print(record["error"], file=sys.stderr)
+        elif record["result"] is not None:
+            print(record["result"])
+        if profiler is not None and profiler.node_types:
+            with open(args.file, encoding="utf-8") as file:
+                print(profiler.format(file.read()), file=sys.stderr)
+        return record["status"]
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            failures = run_batch(args.paths, args.jobs, args.engine, args.optimize, args.cache_dir, out)
+    else:
+        failures = run_batch(args.paths, args.jobs, args.engine, args.optimize, args.cache_dir)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
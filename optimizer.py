@@ -0,0 +1,184 @@
+from AST import *
+from interpreter import Interpreter
+from quotas import Quotas
+
+# Optimization levels, as in -O0/-O1/-O2
+O0 = 0
+O1 = 1
+O2 = 2
+
+# Longest string a constant expression is folded into; longer ones are left to run time
+MAX_FOLDED_STRING = 4096
+
+
+class Optimizer:
+    """Rewrites a parsed AST before it is run.
+
+    -O0 leaves the tree alone. -O1 folds constant expressions and drops
+    if/while branches whose condition is a constant. -O2 also wraps
+    expressions that can't change while a loop runs in LoopInvariant, so
+    they are evaluated once per run of the loop instead of once per
+    iteration. Function bodies are optimized like the program, and an
+    expression containing a call is never treated as invariant, since the
+    function may read a name the loop assigns.
+
+    The input tree is never modified, since a parse can be shared through a
+    cache.ProgramCache. Expressions are folded by evaluating them with the
+    Interpreter itself, and anything that raises (such as a division by
+    zero, or a string longer than MAX_FOLDED_STRING) is left to run time.
+    """
+
+    def __init__(self, level=O1):
+        self.level = level
+
+    def optimize(self, node):
+        if self.level <= O0:
+            return node
+        node = self.visit(node)
+        if self.level >= O2:
+            node = self.hoist(node, 0)
+        return node
+
+    def visit(self, node):
+        method_name = f'optimize_{node.__class__.__name__}'
+        method = getattr(self, method_name, self.generic_visit)
+        return method(node)
+
+    def generic_visit(self, node):
+        return node
+
+    def optimize_block(self, statements):
+        optimized = []
+        for i, statement in enumerate(statements):
+            statement = self.visit(statement)
+            is_last = i == len(statements) - 1
+            if isinstance(statement, IfStatement) and is_constant(statement.condition):
+                branch = statement.if_body if statement.condition.value else statement.else_body
+                # An if whose branch is empty still gives the block its None result
+                if branch or not is_last:
+                    optimized.extend(branch or [])
+                    continue
+            elif isinstance(statement, WhileStatement) and is_constant(statement.condition):
+                if not statement.condition.value and not is_last:
+                    continue
+            optimized.append(statement)
+        return optimized
+
+    def optimize_Program(self, node):
+        return Program(self.optimize_block(node.statements))
+
+    def optimize_BinaryOp(self, node):
+        return self.fold(BinaryOp(self.visit(node.left), node.operator, self.visit(node.right)).at(node))
+
+    def optimize_UnaryOp(self, node):
+        return self.fold(UnaryOp(node.operator, self.visit(node.operand)).at(node))
+
+    def optimize_Assignment(self, node):
+        return Assignment(node.name, self.visit(node.value)).at(node)
+
+    def optimize_PrintStatement(self, node):
+        return PrintStatement([self.visit(arg) for arg in node.arguments]).at(node)
+
+    def optimize_IfStatement(self, node):
+        else_body = self.optimize_block(node.else_body) if node.else_body else node.else_body
+        return IfStatement(self.visit(node.condition), self.optimize_block(node.if_body), else_body).at(node)
+
+    def optimize_WhileStatement(self, node):
+        return WhileStatement(self.visit(node.condition), self.optimize_block(node.body)).at(node)
+
+    def optimize_FunctionDef(self, node):
+        return FunctionDef(node.name, node.params, self.optimize_block(node.body), node.memo).at(node)
+
+    def optimize_Call(self, node):
+        return Call(node.function, [self.visit(arg) for arg in node.arguments]).at(node)
+
+    def fold(self, node):
+        operands = [node.left, node.right] if isinstance(node, BinaryOp) else [node.operand]
+        if not all(is_constant(operand) for operand in operands):
+            return node
+        try:
+            # The quota stops a repetition like "ab" * 10**9 before it is built
+            value = Interpreter(Quotas(max_string_chars=MAX_FOLDED_STRING)).visit(node)
+        except Exception:
+            return node
+        if isinstance(value, str):
+            return String(value).at(node)
+        return Number(value).at(node)
+
+    def hoist(self, node, depth):
+        """Mark loop invariants in every while loop inside node"""
+        if isinstance(node, Program):
+            return Program([self.hoist(statement, depth) for statement in node.statements])
+        if isinstance(node, IfStatement):
+            else_body = [self.hoist(statement, depth) for statement in node.else_body] if node.else_body else node.else_body
+            return IfStatement(node.condition, [self.hoist(statement, depth) for statement in node.if_body], else_body).at(node)
+        if isinstance(node, WhileStatement):
+            assigned = assigned_names(node)
+            # Loops inside this one get their own invariants, one level deeper
+            body = [self.hoist(self.mark(statement, assigned, depth), depth + 1) for statement in node.body]
+            return WhileStatement(self.mark(node.condition, assigned, depth), body).at(node)
+        if isinstance(node, FunctionDef):
+            # A call runs with loops of its own, so its body starts again at depth 0
+            return FunctionDef(node.name, node.params, [self.hoist(statement, 0) for statement in node.body],
+                               node.memo).at(node)
+        return node
+
+    def mark(self, node, assigned, depth):
+        """Wrap the largest expressions in node that don't use a name in assigned"""
+        if isinstance(node, (BinaryOp, UnaryOp)):
+            names = used_names(node)
+            if names and not names & assigned:
+                return LoopInvariant(node, depth).at(node)
+            if isinstance(node, BinaryOp):
+                return BinaryOp(self.mark(node.left, assigned, depth), node.operator, self.mark(node.right, assigned, depth)).at(node)
+            return UnaryOp(node.operator, self.mark(node.operand, assigned, depth)).at(node)
+        if isinstance(node, Assignment):
+            return Assignment(node.name, self.mark(node.value, assigned, depth)).at(node)
+        if isinstance(node, PrintStatement):
+            return PrintStatement([self.mark(arg, assigned, depth) for arg in node.arguments]).at(node)
+        if isinstance(node, IfStatement):
+            else_body = [self.mark(statement, assigned, depth) for statement in node.else_body] if node.else_body else node.else_body
+            return IfStatement(self.mark(node.condition, assigned, depth),
+                               [self.mark(statement, assigned, depth) for statement in node.if_body], else_body).at(node)
+        if isinstance(node, WhileStatement):
+            return WhileStatement(self.mark(node.condition, assigned, depth),
+                                  [self.mark(statement, assigned, depth) for statement in node.body]).at(node)
+        return node
+
+
+def is_constant(node):
+    return isinstance(node, (Number, String))
+
+
+def used_names(node):
+    """Names an expression reads, or None if it contains a LoopInvariant already"""
+    if isinstance(node, Identifier):
+        return {node.name}
+    if isinstance(node, BinaryOp):
+        left = used_names(node.left)
+        right = used_names(node.right)
+        return None if left is None or right is None else left | right
+    if isinstance(node, UnaryOp):
+        return used_names(node.operand)
+    if isinstance(node, (LoopInvariant, Call)):
+        return None
+    return set()
+
+
+def assigned_names(node):
+    """Every name assigned anywhere inside a statement"""
+    if isinstance(node, (Assignment, FunctionDef)):
+        return {node.name}
+    names = set()
+    if isinstance(node, IfStatement):
+        for statement in node.if_body + (node.else_body or []):
+            names |= assigned_names(statement)
+    elif isinstance(node, WhileStatement):
+        for statement in node.body:
+            names |= assigned_names(statement)
+    return names
+
+
+def optimize_ast(ast, level=O1):
+    """Convenience function to optimize a parsed Program"""
+    return Optimizer(level).optimize(ast)
@@ -1,56 +1,93 @@
-from lexer import Tokenizer, TokenType
+from lexer import Tokenizer, StreamTokenizer, TokenType, TokenBuffer, TokenStream, Token, FIXED_VALUES
 from AST import *
+from functions import DEFAULT_MEMO_SIZE
+
+# Bump when the grammar changes so cached parses are invalidated
+GRAMMAR_VERSION = 2
+
+# Operator tokens are shared by every node that uses them; the interpreter
+# only ever looks at their type
+OPERATOR_TOKENS = {token_type: Token(token_type, value, 0, 0) for token_type, value in FIXED_VALUES.items()}
 
 class Parser:
     def __init__(self, tokens):
+        # Accepts a TokenBuffer, a TokenStream or a list of Token objects
+        if not isinstance(tokens, (TokenBuffer, TokenStream)):
+            tokens = TokenBuffer.from_tokens(tokens)
         self.tokens = tokens
         self.pos = 0
+        # Set while parsing the body of a def, which can't define functions
+        self.in_function = False
+
+    def current_type(self):
+        if self.tokens.has(self.pos):
+            return self.tokens.type(self.pos)
+        return None
+
+    def peek_type(self, offset = 1):
+        peek_pos = self.pos + offset
+        if self.tokens.has(peek_pos):
+            return self.tokens.type(peek_pos)
+        return None
 
     def current_token(self):
-        if self.pos < len(self.tokens):
+        if self.tokens.has(self.pos):
             return self.tokens[self.pos]
         return None
     
     def peek_token(self, offset = 1):
         peek_pos = self.pos + offset
-        if peek_pos < len(self.tokens):
+        if self.tokens.has(peek_pos):
             return self.tokens[peek_pos]
         return None
     
     def advance(self):
-        if self.pos < len(self.tokens):
+        if self.tokens.has(self.pos):
             self.pos += 1
 
+    def position(self):
+        """Line and column of the current token, for the node that starts there"""
+        if self.tokens.has(self.pos):
+            return self.tokens.position(self.pos)
+        return None, None
+
     def expect(self, token_type):
-        token = self.current_token()
-        if token and token.type == token_type:
+        current_type = self.current_type()
+        if current_type == token_type:
+            value = self.tokens.value(self.pos)
             self.advance()
-            return token
-        raise SyntaxError(f"Expected {token_type}, got {token.type if token else 'EOF'}")
+            return value
+        raise SyntaxError(f"Expected {token_type}, got {current_type if current_type else 'EOF'}")
     
     def parse_statement(self):
-        token = self.current_token()
+        current_type = self.current_type()
 
-        if not token:
+        if not current_type:
             return None
         
-        if token.type == TokenType.IDENTIFIER and self.peek_token() and self.peek_token().type == TokenType.ASSIGN:
+        if current_type == TokenType.IDENTIFIER and self.peek_type() == TokenType.ASSIGN:
             return self.parse_assignment()
-        elif token.type == TokenType.IF:
+        elif current_type == TokenType.IF:
             return self.parse_if()
-        elif token.type == TokenType.WHILE:
+        elif current_type == TokenType.WHILE:
             return self.parse_while()
+        elif current_type == TokenType.DEF:
+            return self.parse_def()
+        elif current_type == TokenType.AT:
+            return self.parse_decorated()
         else:
             expr = self.parse_expression()
             return expr
         
     def parse_assignment(self):
-        name = self.expect(TokenType.IDENTIFIER).value
+        line, column = self.position()
+        name = self.expect(TokenType.IDENTIFIER)
         self.expect(TokenType.ASSIGN)
         value = self.parse_expression()
-        return Assign(name, value)
+        return Assignment(name, value, line=line, column=column)
     
     def parse_if(self):
+        line, column = self.position()
         self.expect(TokenType.IF)
         condition = self.parse_expression()
         self.expect(TokenType.COLON)
@@ -58,102 +95,173 @@ class Parser:
         then_branch = [self.parse_statement()]
 
         else_branch = None
-        if self.current_token() and self.current_token().type == TokenType.ELSE:
+        if self.current_type() == TokenType.ELSE:
             self.advance()
             self.expect(TokenType.COLON)
             else_branch = [self.parse_statement()]
         
-        return If(condition, then_branch, else_branch)
+        return IfStatement(condition, then_branch, else_branch, line, column)
     
     def parse_while(self):
+        line, column = self.position()
         self.expect(TokenType.WHILE)
         condition = self.parse_expression()
         self.expect(TokenType.COLON)
 
         body = [self.parse_statement()]
 
-        return While(condition, body)
+        return WhileStatement(condition, body, line, column)
     
+    def parse_def(self, memo=None):
+        line, column = self.position()
+        self.expect(TokenType.DEF)
+        if self.in_function:
+            raise SyntaxError("Functions can only be defined at the top level")
+        name = self.expect(TokenType.IDENTIFIER)
+        self.expect(TokenType.LPAREN)
+        params = []
+        while self.current_type() != TokenType.RPAREN:
+            if params:
+                self.expect(TokenType.COMMA)
+            param = self.expect(TokenType.IDENTIFIER)
+            if param in params:
+                raise SyntaxError(f"Duplicate parameter '{param}' in function {name}")
+            params.append(param)
+        self.expect(TokenType.RPAREN)
+        self.expect(TokenType.COLON)
+
+        self.in_function = True
+        try:
+            body = [self.parse_statement()]
+        finally:
+            self.in_function = False
+
+        return FunctionDef(name, params, body, memo, line=line, column=column)
+
+    def parse_decorated(self):
+        """@memo or @memo(size), then the def it applies to"""
+        self.expect(TokenType.AT)
+        decorator = self.expect(TokenType.IDENTIFIER)
+        if decorator != "memo":
+            raise SyntaxError(f"Unknown decorator: @{decorator}")
+        size = DEFAULT_MEMO_SIZE
+        if self.current_type() == TokenType.LPAREN:
+            self.advance()
+            text = self.expect(TokenType.NUMBER)
+            if not text.isdigit() or int(text) < 1:
+                raise SyntaxError(f"@memo size must be a positive whole number, not {text}")
+            size = int(text)
+            self.expect(TokenType.RPAREN)
+        while self.current_type() == TokenType.NEWLINE:
+            self.advance()
+        if self.current_type() != TokenType.DEF:
+            raise SyntaxError(f"Expected {TokenType.DEF} after @memo, got {self.current_type() or 'EOF'}")
+        return self.parse_def(size)
+
+    def parse_call(self, function):
+        self.expect(TokenType.LPAREN)
+        arguments = []
+        while self.current_type() != TokenType.RPAREN:
+            if arguments:
+                self.expect(TokenType.COMMA)
+            arguments.append(self.parse_expression())
+        self.expect(TokenType.RPAREN)
+        return Call(function, arguments).at(function)
+
     def parse_expression(self):
         return self.parse_comparison()
     
     def parse_comparison(self):
         expr = self.parse_addition()
 
-        while self.current_token() and self.current_token().type in [TokenType.GREATER, TokenType.LESS]:
-            op = self.current_token().value
+        while self.current_type() in [TokenType.GREATER, TokenType.LESS]:
+            op = OPERATOR_TOKENS[self.current_type()]
             self.advance()
             right = self.parse_addition()
-            expr = BinOp(expr, op, right)
+            expr = BinaryOp(expr, op, right).at(expr)
 
         return expr
     
     def parse_addition(self):
         expr = self.parse_multiplication()
 
-        while self.current_token() and self.current_token().type in [TokenType.PLUS, TokenType.MINUS]:
-            op = self.current_token().value
+        while self.current_type() in [TokenType.PLUS, TokenType.MINUS]:
+            op = OPERATOR_TOKENS[self.current_type()]
             self.advance()
             right = self.parse_multiplication()
-            expr = BinOp(expr,op, right)
+            expr = BinaryOp(expr, op, right).at(expr)
         return expr
 
     def parse_multiplication(self):
         expr = self.parse_unary()
 
-        while self.current_token() and self.current_token().type in [TokenType.MULTIPLY, TokenType.DIVIDE]:
-            op = self.current_token().value
+        while self.current_type() in [TokenType.MULTIPLY, TokenType.DIVIDE]:
+            op = OPERATOR_TOKENS[self.current_type()]
             self.advance()
             right = self.parse_unary()
-            expr = BinOp(expr, op, right)
+            expr = BinaryOp(expr, op, right).at(expr)
         return expr
     
     def parse_unary(self):
-        if self.current_token() and self.current_token().type == TokenType.MINUS:
-            op = self.current_token().value
+        if self.current_type() == TokenType.MINUS:
+            line, column = self.position()
+            op = OPERATOR_TOKENS[self.current_type()]
             self.advance()
             operand = self.parse_unary()
-            return UnaryOp(op, operand)
+            return UnaryOp(op, operand, line, column)
         
         return self.parse_primary()
 
     def parse_primary(self):
-        token = self.current_token()
+        current_type = self.current_type()
 
-        if not token:
+        if not current_type:
             raise SyntaxError("Unexpected end of input")
 
-        if token.type == TokenType.NUMBER:
-            self.advance()
-            return Number(token.value)
-        elif token.type == TokenType.STRING:
-            self.advance()
-            return String(token.value)
-        elif token.type == TokenType.IDENTIFIER:
-            self.advance()
-            return Variable(token.value)
-        elif token.type == TokenType.LPAREN:
+        line, column = self.position()
+        if current_type == TokenType.NUMBER:
+            text = self.expect(TokenType.NUMBER)
+            value = float(text) if "." in text else int(text)
+            return Number(value, line, column)
+        elif current_type == TokenType.STRING:
+            return String(self.expect(TokenType.STRING), line, column)
+        elif current_type == TokenType.IDENTIFIER:
+            name = Identifier(self.expect(TokenType.IDENTIFIER), line=line, column=column)
+            if self.current_type() == TokenType.LPAREN:
+                return self.parse_call(name)
+            return name
+        elif current_type == TokenType.LPAREN:
             self.advance()
             expr = self.parse_expression()
             self.expect(TokenType.RPAREN)
             return expr
         else:
-            raise SyntaxError(f"Unexpected token: {token.type}")
+            raise SyntaxError(f"Unexpected token: {current_type}")
 
-    def parse(self):
-        statements = []
-        while self.current_token() and self.current_token().type != TokenType.EOF:
-            if self.current_token().type == TokenType.NEWLINE:
+    def iter_statements(self):
+        """Yield each top-level statement as soon as it has been parsed"""
+        while self.current_type() and self.current_type() != TokenType.EOF:
+            if self.current_type() == TokenType.NEWLINE:
                 self.advance()
                 continue
             statement = self.parse_statement()
             if statement:
-                statements.append(statement)
-        return Program(statements)
+                yield statement
 
-def parse(code):
-    """Convenience function to parse code string"""
+    def parse(self):
+        return Program(list(self.iter_statements()))
+
+def parse(code, cache=None):
+    """Convenience function to parse code string, optionally through a cache.ProgramCache"""
+    if cache is not None:
+        return cache.parse(code)
     tokenizer = Tokenizer(code)
-    tokens = tokenizer.tokenize()
+    tokens = tokenizer.tokenize_buffer()
     parser = Parser(tokens)
-    return parser.parse()
\ No newline at end of file
+    return parser.parse()
+
+def parse_stream(source, chunk_size=1 << 16):
+    """Parse a file object or mmap incrementally, yielding top-level statements"""
+    tokenizer = StreamTokenizer(source, chunk_size)
+    parser = Parser(TokenStream(tokenizer.iter_tokens()))
+    return parser.iter_statements()
@@ -0,0 +1,76 @@
+import time
+from collections import defaultdict
+from AST import (Append, Assignment, FunctionDef, IfStatement, LocalAppend, LocalAssignment, PrintStatement,
+                 Program, WhileStatement)
+
+STATEMENTS = (Assignment, Append, LocalAssignment, LocalAppend, FunctionDef, PrintStatement, IfStatement,
+              WhileStatement)
+
+
+class Profiler:
+    """Hit counts and times per source line and per node type for one run.
+
+    Every node the interpreter visits is counted and timed. A node's own
+    time, its time less that of the nodes inside it, is charged to its type
+    and to its line, so each table adds up to the whole run. A line's hits
+    count the statements on it that ran, including expressions run as
+    top-level statements.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.lines = defaultdict(lambda: [0, 0.0])  # line -> [hits, seconds]
+        self.node_types = defaultdict(lambda: [0, 0.0])  # node class -> [hits, seconds]
+
+    def wrap(self, visit):
+        """Return visit(node) with every call timed into this profiler"""
+        clock, lines, node_types = self.clock, self.lines, self.node_types
+        # Class and child time of the node running now
+        running = None
+        nested = 0.0
+
+        def profiled_visit(node):
+            nonlocal running, nested
+            outer, outer_nested = running, nested
+            running, nested = node.__class__, 0.0
+            start = clock()
+            try:
+                return visit(node)
+            finally:
+                elapsed = clock() - start
+                own = elapsed - nested
+                stats = node_types[running]
+                stats[0] += 1
+                stats[1] += own
+                if node.line is not None:
+                    stats = lines[node.line]
+                    stats[0] += running in STATEMENTS or outer is Program
+                    stats[1] += own
+                running, nested = outer, outer_nested + elapsed
+        return profiled_visit
+
+    def report(self):
+        """The profile as a JSON-ready dict, lines in order and node types slowest first"""
+        return {
+            "total": sum(seconds for _, seconds in self.node_types.values()),
+            "lines": [{"line": line, "hits": hits, "time": seconds}
+                      for line, (hits, seconds) in sorted(self.lines.items())],
+            "nodes": [{"type": node_class.__name__, "hits": hits, "time": seconds}
+                      for node_class, (hits, seconds) in sorted(self.node_types.items(), key=lambda item: -item[1][1])],
+        }
+
+    def format(self, source=None, limit=10):
+        """A table of the limit hottest lines, with their text when source is given"""
+        report = self.report()
+        total = report["total"] or 1.0
+        source_lines = source.splitlines() if source is not None else []
+        rows = ["  Line       Hits      Time  % Time  Source"]
+        for entry in sorted(report["lines"], key=lambda entry: -entry["time"])[:limit]:
+            line = entry["line"]
+            text = source_lines[line - 1].strip() if 0 < line <= len(source_lines) else ""
+            rows.append(f"{line:6} {entry['hits']:10} {entry['time']:9.4f} {entry['time'] / total * 100:7.1f}  {text}")
+        rows.append("")
+        rows.append("  Node type            Hits      Time")
+        for entry in report["nodes"]:
+            rows.append(f"  {entry['type']:16} {entry['hits']:8} {entry['time']:9.4f}")
+        return "\n".join(rows)
@@ -0,0 +1,97 @@
+import time
+from AST import ASTNode
+
+
+class SPLError(Exception):
+    """Base class for errors a running SPL program raises by breaking SPL's own rules"""
+
+
+class QuotaExceededError(SPLError):
+    """Raised when a run goes over one of its Quotas.
+
+    quota names the limit ("nodes", "time", "string_chars" or
+    "output_lines"), limit is its configured value and used is how much had
+    been used when the run was stopped.
+    """
+
+    def __init__(self, quota, limit, used):
+        self.quota = quota
+        self.limit = limit
+        self.used = used
+        super().__init__(f"Quota exceeded: {quota} (limit {limit}, used {used})")
+
+
+class Quotas:
+    """Execution budgets for one run; a limit of None means unlimited.
+
+    Nodes are charged once per loop iteration, as the number of AST nodes in
+    the loop, and once per call of a function, as the number of nodes in
+    its body, so the count approximates evaluated nodes without adding work
+    to every visit. The wall-time limit is checked every check_interval
+    charged nodes. string_chars counts the characters of every string a
+    concatenation or repetition creates; a repetition is charged before it
+    is built, and an append in place (s = s + part) only for what it adds.
+    """
+
+    def __init__(self, max_nodes=None, max_time=None, max_string_chars=None, max_output_lines=None,
+                 check_interval=10000):
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.max_string_chars = max_string_chars
+        self.max_output_lines = max_output_lines
+        self.check_interval = check_interval
+        self.start()
+
+    def start(self):
+        """Reset the counters and start the clock for a new run"""
+        self.nodes = 0
+        self.string_chars = 0
+        self.output_lines = 0
+        self.started = time.monotonic()
+        self.next_check = self._next_check()
+
+    def _next_check(self):
+        next_check = self.nodes + self.check_interval
+        if self.max_nodes is not None:
+            next_check = min(next_check, self.max_nodes + 1)
+        return next_check
+
+    def charge_nodes(self, count):
+        self.nodes += count
+        if self.nodes >= self.next_check:
+            if self.max_nodes is not None and self.nodes > self.max_nodes:
+                raise QuotaExceededError("nodes", self.max_nodes, self.nodes)
+            elapsed = time.monotonic() - self.started
+            if self.max_time is not None and elapsed > self.max_time:
+                raise QuotaExceededError("time", self.max_time, round(elapsed, 3))
+            self.next_check = self._next_check()
+
+    def charge_string(self, text):
+        self.charge_string_length(len(text))
+
+    def charge_string_length(self, length):
+        self.string_chars += length
+        if self.max_string_chars is not None and self.string_chars > self.max_string_chars:
+            raise QuotaExceededError("string_chars", self.max_string_chars, self.string_chars)
+
+    def multiply(self, left, right):
+        """left * right, charging a repeated string before it is built"""
+        if isinstance(left, str) and isinstance(right, int):
+            self.charge_string_length(len(left) * max(right, 0))
+        elif isinstance(right, str) and isinstance(left, int):
+            self.charge_string_length(len(right) * max(left, 0))
+        return left * right
+
+    def charge_output_line(self):
+        self.output_lines += 1
+        if self.max_output_lines is not None and self.output_lines > self.max_output_lines:
+            raise QuotaExceededError("output_lines", self.max_output_lines, self.output_lines)
+
+
+def count_nodes(node):
+    """Number of AST nodes in node, counting every node inside it"""
+    if isinstance(node, list):
+        return sum(count_nodes(item) for item in node)
+    if not isinstance(node, ASTNode):
+        return 0
+    return 1 + sum(count_nodes(getattr(node, field)) for field in node.__slots__)
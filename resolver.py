@@ -0,0 +1,157 @@
+from collections.abc import MutableMapping
+from AST import *
+from strings import append_parts, flatten
+
+# Value of a slot whose variable hasn't been assigned yet
+UNDEFINED = object()
+
+
+class SlotTable(MutableMapping):
+    """Variable storage: each name gets a fixed index into the ``slots`` list.
+
+    Indices are never reused or renumbered, even by clear(), so code that
+    was resolved against the table stays valid for as long as the table
+    lives. It also behaves as a dict of the variables that are defined.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.slots = []
+
+    def slot(self, name):
+        index = self.index.get(name)
+        if index is None:
+            index = self.index[name] = len(self.slots)
+            self.slots.append(UNDEFINED)
+        return index
+
+    def __getitem__(self, name):
+        index = self.index.get(name)
+        if index is None or self.slots[index] is UNDEFINED:
+            raise KeyError(name)
+        return flatten(self.slots[index])
+
+    def __setitem__(self, name, value):
+        self.slots[self.slot(name)] = value
+
+    def __delitem__(self, name):
+        index = self.index.get(name)
+        if index is None or self.slots[index] is UNDEFINED:
+            raise KeyError(name)
+        self.slots[index] = UNDEFINED
+
+    def __iter__(self):
+        return (name for name, index in self.index.items() if self.slots[index] is not UNDEFINED)
+
+    def __len__(self):
+        return sum(1 for value in self.slots if value is not UNDEFINED)
+
+    def clear(self):
+        self.slots[:] = [UNDEFINED] * len(self.slots)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Resolver:
+    """Returns a copy of an AST whose Identifier and Assignment nodes carry
+    the slot index of their variable in a SlotTable, and whose Assignments
+    of the form name = name + part + ... are Appends. Source positions are
+    kept.
+
+    In the body of a function, locals maps each local variable to its slot
+    in the call's frame, and they become Local, LocalAssignment and
+    LocalAppend nodes.
+    """
+
+    def __init__(self, table, locals=None):
+        self.table = table
+        self.locals = locals
+
+    def resolve(self, node):
+        method = getattr(self, f'resolve_{node.__class__.__name__}', None)
+        return method(node) if method else node
+
+    def resolve_block(self, statements):
+        return [self.resolve(statement) for statement in statements]
+
+    def resolve_Program(self, node):
+        return Program(self.resolve_block(node.statements))
+
+    def resolve_Identifier(self, node):
+        if self.locals is not None and node.name in self.locals:
+            return Local(node.name, self.locals[node.name]).at(node)
+        return Identifier(node.name, self.table.slot(node.name)).at(node)
+
+    def resolve_Local(self, node):
+        return self.resolve_Identifier(node)
+
+    def resolve_Assignment(self, node):
+        if self.locals is not None and node.name in self.locals:
+            assign, append, slot = LocalAssignment, LocalAppend, self.locals[node.name]
+        else:
+            assign, append, slot = Assignment, Append, self.table.slot(node.name)
+        assignment = assign(node.name, self.resolve(node.value), slot).at(node)
+        parts = append_parts(assignment)
+        if parts is None:
+            return assignment
+        return append(node.name, assignment.value, tuple(parts), slot).at(node)
+
+    def resolve_Append(self, node):
+        return self.resolve_Assignment(node)
+
+    def resolve_LocalAssignment(self, node):
+        return self.resolve_Assignment(node)
+
+    def resolve_LocalAppend(self, node):
+        return self.resolve_Assignment(node)
+
+    def resolve_FunctionDef(self, node):
+        if self.locals is not None:
+            raise SyntaxError("Functions can only be defined at the top level")
+        names = local_names(node)
+        body = Resolver(self.table, {name: slot for slot, name in enumerate(names)}).resolve_block(node.body)
+        return FunctionDef(node.name, node.params, body, node.memo, self.table.slot(node.name), len(names)).at(node)
+
+    def resolve_Call(self, node):
+        return Call(self.resolve(node.function), self.resolve_block(node.arguments)).at(node)
+
+    def resolve_BinaryOp(self, node):
+        return BinaryOp(self.resolve(node.left), node.operator, self.resolve(node.right)).at(node)
+
+    def resolve_UnaryOp(self, node):
+        return UnaryOp(node.operator, self.resolve(node.operand)).at(node)
+
+    def resolve_PrintStatement(self, node):
+        return PrintStatement(self.resolve_block(node.arguments)).at(node)
+
+    def resolve_IfStatement(self, node):
+        else_body = self.resolve_block(node.else_body) if node.else_body else node.else_body
+        return IfStatement(self.resolve(node.condition), self.resolve_block(node.if_body), else_body).at(node)
+
+    def resolve_WhileStatement(self, node):
+        return WhileStatement(self.resolve(node.condition), self.resolve_block(node.body)).at(node)
+
+    def resolve_LoopInvariant(self, node):
+        return LoopInvariant(self.resolve(node.expression), node.depth).at(node)
+
+
+def local_names(node):
+    """The local variables of a FunctionDef in slot order: its parameters,
+    then the names its body assigns"""
+    names = list(node.params)
+    for name in _assigned(node.body):
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def _assigned(statements):
+    for statement in statements:
+        if isinstance(statement, (Assignment, Append, LocalAssignment, LocalAppend)):
+            yield statement.name
+        elif isinstance(statement, IfStatement):
+            yield from _assigned(statement.if_body)
+            yield from _assigned(statement.else_body or [])
+        elif isinstance(statement, WhileStatement):
+            yield from _assigned(statement.body)
@@ -1,11 +1,38 @@
 // Simplified SPL interpreter code - more concise and readable
 const splInterpreterCode = `
-import math, random, string
+# Modules that only some features use are imported where they are used,
+# so loading the interpreter doesn't pay for them: asyncio by async runs,
+# hashlib and marshal by the caches, bisect by incremental re-parsing,
+# weakref by list views, NumPy by arrays, and random and string by the
+# Math and String methods that need them
+import math, operator, re, collections, collections.abc, itertools, os, sys, time, types, importlib
+
+# NumPy once List.array has imported it, and None before that or without it
+numpy = None
+_spl_numpy_tried = False
+
+def _spl_import_numpy():
+    """NumPy, imported the first time an array is made, or None if it isn't installed"""
+    global numpy, _spl_numpy_tried
+    if not _spl_numpy_tried:
+        _spl_numpy_tried = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
 class SPLError(Exception): pass
 
 class Token:
-    def __init__(self, type, value, line=1, col=1):
-        self.type, self.value, self.line, self.col = type, value, line, col
+    __slots__ = ('type', 'value', 'line', 'col', 'pos')
+
+    def __init__(self, type, value, line=1, col=1, pos=None):
+        self.type = type
+        self.value = value
+        self.line = line
+        self.col = col
+        self.pos = pos
     def __repr__(self): return f"Token({self.type}, {self.value})"
 
 class Lexer:
@@ -22,53 +49,109 @@ class Lexer:
         'String': 'STRING_CLASS', 'List':'LIST_CLASS',
         'Math': 'MATH_CLASS', 'Number': 'NUMBER_CLASS'
     }
+
+    SYMBOLS = dict(OPERATORS, **{
+        '==': 'EQ', '>=': 'GTE', '<=': 'LTE', '!=': 'NEQ',
+        '=': 'ASSIGN', '>': 'GT', '<': 'LT'
+    })
+
+    # Fast path for the common ASCII tokens; whatever it declines (errors,
+    # non-ASCII text) goes through scan_char so positions and errors match.
+    TOKEN_PATTERN = re.compile(r'''[ \\t\\r\\f\\v]*(?:
+        (?P<NEWLINE>\\n)
+      | (?P<COMMENT>\\#[^\\n]*)
+      | (?P<NUMBER>[0-9][0-9.]*)(?![0-9.]|[^\\x00-\\x7f])
+      | (?P<IDENTIFIER>[A-Za-z_][A-Za-z0-9_]*)(?![A-Za-z0-9_]|[^\\x00-\\x7f])
+      | (?P<STRING>"[^"]*")
+      | (?P<SYMBOL>==|>=|<=|!=|[-+*/()\\[\\]{};,.=<>])
+    )''', re.VERBOSE)
     
-    def __init__(self, text):
+    def __init__(self, text, pos=0, end=None, line=1, col=1):
+        # pos/end/line/col let a caller lex just one region of a larger text
         self.text = text
-        self.pos = 0
-        self.line = 1
-        self.col = 1
+        self.pos = pos
+        self.end = len(text) if end is None else end
+        self.line = line
+        self.col = col
         
     def tokenize(self):
         tokens = []
-        while self.pos < len(self.text):
-            char = self.current_char()
-            if not char: break
-            
-            if char.isspace():
-                if char == '\\n':
-                    tokens.append(Token('NEWLINE', '\\n', self.line, self.col))
-                    self.line += 1
-                    self.col = 1
-                self.advance()
-            elif char == '#':
-                self.skip_comment()
-            elif char.isdigit():
-                tokens.append(self.make_number())
-            elif char.isalpha() or char == '_':
-                tokens.append(self.make_identifier())
-            elif char == '"':
-                tokens.append(self.make_string())
-            elif char in self.OPERATORS:
-                tokens.append(Token(self.OPERATORS[char], char, self.line, self.col))
-                self.advance()
-            elif char in '=><!' and self.peek() == '=':
-                op_map = {'==': 'EQ', '>=': 'GTE', '<=': 'LTE', '!=': 'NEQ'}
-                op = char + self.peek()
-                tokens.append(Token(op_map[op], op, self.line, self.col))
-                self.advance(2)
-            elif char == '=':
-                tokens.append(Token('ASSIGN', '=', self.line, self.col))
-                self.advance()
-            elif char in '><':
-                op_map = {'>': 'GT', '<': 'LT'}
-                tokens.append(Token(op_map[char], char, self.line, self.col))
-                self.advance()
-            else:
-                raise SPLError(f"Unexpected character: {char}")
+        while self.pos < self.end:
+            self.scan_fast(tokens)
+            if self.pos < self.end:
+                count, start = len(tokens), self.pos
+                self.scan_char(tokens)
+                if len(tokens) > count:
+                    tokens[-1].pos = start
         
-        tokens.append(Token('EOF', None, self.line, self.col))
+        tokens.append(Token('EOF', None, self.line, self.col, self.pos))
         return tokens
+
+    def scan_fast(self, tokens):
+        append, keywords, symbols = tokens.append, self.KEYWORDS, self.SYMBOLS
+        line, col, pos = self.line, self.col, self.pos
+        for match in iter(self.TOKEN_PATTERN.scanner(self.text, pos, self.end).match, None):
+            kind = match.lastgroup
+            start, end = match.span(kind)
+            value = match.group(kind)
+            col += start - pos
+            pos = end
+
+            if kind == 'IDENTIFIER':
+                append(Token(keywords.get(value, 'IDENTIFIER'), value, line, col, start))
+            elif kind == 'SYMBOL':
+                append(Token(symbols[value], value, line, col, start))
+            elif kind == 'NUMBER':
+                append(Token('NUMBER', float(value), line, col, start))
+            elif kind == 'NEWLINE':
+                append(Token('NEWLINE', '\\n', line, col, start))
+                line += 1
+                col = 2  # advance() moved past the newline after col was reset
+                continue
+            elif kind == 'STRING':
+                append(Token('STRING', value[1:-1], line, col, start))
+                newlines = value.count('\\n')
+                if newlines:
+                    # A string spanning lines moves the position to its last line
+                    line += newlines
+                    col = end - (start + value.rindex('\\n')) + 1
+                    continue
+            col += end - start
+        self.line, self.col, self.pos = line, col, pos
+
+    def scan_char(self, tokens):
+        char = self.current_char()
+        if char.isspace():
+            if char == '\\n':
+                tokens.append(Token('NEWLINE', '\\n', self.line, self.col))
+                self.line += 1
+                self.col = 1
+            self.advance()
+        elif char == '#':
+            self.skip_comment()
+        elif char.isdigit():
+            tokens.append(self.make_number())
+        elif char.isalpha() or char == '_':
+            tokens.append(self.make_identifier())
+        elif char == '"':
+            tokens.append(self.make_string())
+        elif char in self.OPERATORS:
+            tokens.append(Token(self.OPERATORS[char], char, self.line, self.col))
+            self.advance()
+        elif char in '=><!' and self.peek() == '=':
+            op_map = {'==': 'EQ', '>=': 'GTE', '<=': 'LTE', '!=': 'NEQ'}
+            op = char + self.peek()
+            tokens.append(Token(op_map[op], op, self.line, self.col))
+            self.advance(2)
+        elif char == '=':
+            tokens.append(Token('ASSIGN', '=', self.line, self.col))
+            self.advance()
+        elif char in '><':
+            op_map = {'>': 'GT', '<': 'LT'}
+            tokens.append(Token(op_map[char], char, self.line, self.col))
+            self.advance()
+        else:
+            raise SPLError(f"Unexpected character: {char}")
     
     def current_char(self):
         return None if self.pos >= len(self.text) else self.text[self.pos]
@@ -106,11 +189,14 @@ class Lexer:
         return Token(token_type, id_str, self.line, start_col)
     
     def make_string(self):
-        start_col = self.col
+        start_line, start_col = self.line, self.col
         self.advance()  # Skip opening quote
         string_val = ''
         while self.current_char() and self.current_char() != '"':
             string_val += self.current_char()
+            if self.current_char() == '\\n':
+                self.line += 1
+                self.col = 1
             self.advance()
         
         if self.current_char() == '"':
@@ -118,7 +204,7 @@ class Lexer:
         else:
             raise SPLError("Unterminated string")
         
-        return Token('STRING', string_val, self.line, start_col)
+        return Token('STRING', string_val, start_line, start_col)
 
 
 class Parser:
@@ -151,7 +237,8 @@ class Parser:
             while self.current_token() and self.current_token().type == 'NEWLINE':
                 self.advance()
             if (self.current_token() and 
-                self.current_token().type not in ['EOF', 'RBRACE', 'ELSE', 'IF', 'WHILE', 'FOR', 'PRINT']):
+                self.current_token().type not in ['EOF', 'RBRACE', 'ELSE', 'IF', 'WHILE', 'FOR', 'PRINT'] and
+                not self._at_parallel_for()):
                 self.expect('SEMICOLON')
         elif not self.current_token() or self.current_token().type == 'EOF':
             pass
@@ -163,7 +250,8 @@ class Parser:
     def parse_statement(self):
         if not self.current_token(): return None
         
-        token_type = self.current_token().type
+        token = self.current_token()
+        token_type = token.type
         parsers = {
             'PRINT': self.parse_print,
             'IF': self.parse_if,
@@ -173,11 +261,19 @@ class Parser:
             'IDENTIFIER': self.parse_assignment
         }
         
+        if self._at_parallel_for():
+            return self._at(self.parse_parallel_for(), token)
         if token_type in parsers:
-            return parsers[token_type]()
+            return self._at(parsers[token_type](), token)
         else:
             raise SPLError(f"Unexpected token: {token_type}")
 
+    def _at(self, node, token):
+        """Give node the line and column of token, unless it already has a position"""
+        if 'line' not in node:
+            node['line'], node['col'] = token.line, token.col
+        return node
+
     def parse_break(self):
         self.advance()
         return {'type': 'Break'}
@@ -238,6 +334,16 @@ class Parser:
         body = self.parse_block()
 
         return {'type': 'For', 'var_name': var_name, 'iterable': iterable, 'body': body}
+
+    def _at_parallel_for(self):
+        """Whether the current token starts parallel for; parallel is a name anywhere else"""
+        token = self.current_token()
+        return (token.type == 'IDENTIFIER' and token.value == 'parallel' and self.pos + 1 < len(self.tokens)
+                and self.tokens[self.pos + 1].type == 'FOR')
+
+    def parse_parallel_for(self):
+        self.advance()  # consume 'parallel'
+        return dict(self.parse_for(), parallel=True)
     
     def parse_static_method(self, class_name):
         self.advance()
@@ -303,7 +409,7 @@ class Parser:
             op = self.current_token().value
             self.advance()
             right = self.parse_term()
-            left = {'type': 'BinOp', 'left': left, 'op': op, 'right': right}
+            left = {'type': 'BinOp', 'left': left, 'op': op, 'right': right, 'line': left['line'], 'col': left['col']}
         return left
     
     def parse_term(self):
@@ -312,7 +418,7 @@ class Parser:
             op = self.current_token().value
             self.advance()
             right = self.parse_factor()
-            left = {'type': 'BinOp', 'left': left, 'op': op, 'right': right}
+            left = {'type': 'BinOp', 'left': left, 'op': op, 'right': right, 'line': left['line'], 'col': left['col']}
         return left
     
     def parse_factor(self):
@@ -321,11 +427,15 @@ class Parser:
             op = self.current_token().value
             self.advance()
             right = self.parse_primary()
-            left = {'type': 'BinOp', 'left': left, 'op': op, 'right': right}
+            left = {'type': 'BinOp', 'left': left, 'op': op, 'right': right, 'line': left['line'], 'col': left['col']}
         return left
     
     def parse_primary(self):
         token = self.current_token()
+        return self._at(self._parse_primary(), token)
+
+    def _parse_primary(self):
+        token = self.current_token()
         
         simple_types = {
             'NUMBER': lambda: {'type': 'Number', 'value': token.value},
@@ -353,9 +463,10 @@ class Parser:
                 self.advance()
                 index = self.parse_expression()
                 self.expect('RBRACKET')
-                result =  {'type': 'Index', 'object': {'type': 'Variable', 'name': name}, 'index': index}
+                variable = {'type': 'Variable', 'name': name, 'line': token.line, 'col': token.col}
+                result = {'type': 'Index', 'object': variable, 'index': index, 'line': token.line, 'col': token.col}
             else:
-                result =  {'type': 'Variable', 'name': name}
+                result = {'type': 'Variable', 'name': name, 'line': token.line, 'col': token.col}
             
             while self.current_token() and self.current_token().type == 'DOT':
                 self.advance()
@@ -375,7 +486,9 @@ class Parser:
                     'type': 'MethodCall',
                     'object': result,
                     'method': method_name,
-                    'args': args
+                    'args': args,
+                    'line': token.line,
+                    'col': token.col
                 }
             return result
 
@@ -421,11 +534,956 @@ class Parser:
             current = self.current_token().type if self.current_token() else 'EOF'
             raise SPLError(f"Expected {token_type}, got {current}")
 
+class IncrementalParser(Parser):
+    """Parser for the editor that keeps its results between edits.
+
+    Top-level statements are cached with the source offset where they
+    start; reparse() finds the text an edit changed and re-tokenizes and
+    re-parses only the statements around it. Statements outside that
+    region are reused as the same dict objects, and blocks are cached by a
+    hash of their source text so unchanged blocks inside a re-parsed
+    statement are reused too. A reused statement or block that the edit
+    moved is copied with its line and column numbers updated.
+    """
+    MAX_CACHED_BLOCKS = 4096
+
+    def __init__(self):
+        super().__init__([])
+        self.text = ''
+        self.starts = []
+        self.statements = []
+        self.program = None
+        self.block_cache = {}
+        self.stats = {'reused': 0, 'parsed': 0}
+
+    def reparse(self, text):
+        if self.program is not None and text == self.text:
+            self.stats['reused'] += len(self.statements)
+            return self.program
+        starts = None
+        if self.program is not None:
+            try:
+                starts, statements = self._reparse_edit(text)
+            except SPLError:
+                pass
+        if starts is None:
+            # Anything the edit region can't settle is left to a full parse,
+            # which also produces the error message a plain Parser would
+            self.program = None
+            starts, statements, _ = self._parse_region(text, 0, len(text))
+        self.text = text
+        self.starts = starts
+        self.statements = statements
+        self.program = {'type': 'Program', 'statements': list(statements)}
+        return self.program
+
+    def _reparse_edit(self, text):
+        import bisect
+        old = self.text
+        prefix = _common_prefix(old, text)
+        suffix = _common_suffix(old, text, min(len(old), len(text)) - prefix)
+        delta = len(text) - len(old)
+        starts = self.starts
+
+        # Start one statement before the edit: its separator check looks at
+        # the first token of the next statement, which the edit may change
+        first = max(bisect.bisect_right(starts, prefix - 1) - 2, 0)
+        resume = bisect.bisect_right(starts, len(old) - suffix)
+        if resume >= len(starts):
+            raise SPLError("Edit reaches the last statement")
+        # Lex through the statement at resume as lookahead for the
+        # separator check of the last re-parsed statement
+        end = starts[resume + 1] + delta if resume + 1 < len(starts) else len(text)
+        region_start = starts[first] if first else 0
+
+        new_starts, new_statements, next_start = self._parse_region(
+            text, region_start, end, starts[resume] + delta)
+        if next_start != starts[resume] + delta:
+            raise SPLError("Edit changed statement boundaries")
+
+        self.stats['reused'] += first + len(starts) - resume
+        moved = self.statements[resume:]
+        line, col = _source_position(text, starts[resume] + delta)
+        old_line, old_col = moved[0]['line'], moved[0]['col']
+        if (line, col) != (old_line, old_col):
+            moved = _spl_move(moved, line - old_line, col - old_col, old_line)
+        return (starts[:first] + new_starts + [start + delta for start in starts[resume:]],
+                self.statements[:first] + new_statements + moved)
+
+    def _parse_region(self, text, start, end, stop=None):
+        """Parse top-level statements in text[start:end], stopping at offset stop"""
+        line, col = _source_position(text, start)
+        self.text = text
+        self.tokens = Lexer(text, start, end, line, col).tokenize()
+        self.pos = 0
+        starts, statements = [], []
+        while self.current_token().type != 'EOF':
+            if self.current_token().type == 'NEWLINE':
+                self.advance()
+                continue
+            if self.current_token().pos == stop:
+                break
+            starts.append(self.current_token().pos)
+            statements.append(self.parse_statement())
+            self._handle_statement_separator()
+        self.stats['parsed'] += len(statements)
+        return starts, statements, self.current_token().pos
+
+    def parse_block(self):
+        close = self._matching_brace(self.pos)
+        if close is None:
+            return super().parse_block()
+        import hashlib
+        brace = self.tokens[self.pos]
+        key = hashlib.blake2b(
+            self.text[brace.pos:self.tokens[close].pos].encode('utf-8'),
+            digest_size=16).digest()
+        cached = self.block_cache.get(key)
+        if cached is None:
+            statements = super().parse_block()
+            if len(self.block_cache) >= self.MAX_CACHED_BLOCKS:
+                self.block_cache.clear()
+            self.block_cache[key] = (statements, brace.line, brace.col)
+            return statements
+        self.pos = close + 1
+        statements, line, col = cached
+        if (line, col) != (brace.line, brace.col):
+            statements = _spl_move(statements, brace.line - line, brace.col - col, line)
+        return statements
+
+    def _matching_brace(self, pos):
+        tokens = self.tokens
+        if tokens[pos].type != 'LBRACE':
+            return None
+        depth = 0
+        for index in range(pos, len(tokens)):
+            kind = tokens[index].type
+            if kind == 'LBRACE':
+                depth += 1
+            elif kind == 'RBRACE':
+                depth -= 1
+                if depth == 0:
+                    return index
+        return None
+
+def _common_prefix(a, b):
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def _common_suffix(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid:len(a) - low] == b[len(b) - mid:len(b) - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def _spl_move(node, lines, cols, first_line):
+    """Copy of parsed nodes moved down by lines lines; nodes on first_line
+    also move right by cols columns, as the text before them changed"""
+    if isinstance(node, list):
+        return [_spl_move(item, lines, cols, first_line) for item in node]
+    if not isinstance(node, dict):
+        return node
+    moved = {key: _spl_move(value, lines, cols, first_line) for key, value in node.items()}
+    if 'line' in node:
+        moved['line'] = node['line'] + lines
+        if node['line'] == first_line:
+            moved['col'] = node['col'] + cols
+    return moved
+
+def _source_position(text, offset):
+    """Line and column the Lexer would report at offset"""
+    line_start = text.rfind('\\n', 0, offset)
+    if line_start < 0:
+        return 1, offset + 1
+    return text.count('\\n', 0, offset) + 1, offset - line_start + 1
+
+# Value of a slot whose variable hasn't been assigned yet
+_spl_missing = object()
+
+class SlotTable(collections.abc.MutableMapping):
+    """Variable storage: each name gets a fixed index into the slots list.
+
+    Indices are never reused, even by clear(), so code resolved against the
+    table stays valid while it lives. It also acts as a dict of the defined
+    variables.
+    """
+    def __init__(self):
+        self.index = {}
+        self.slots = []
+
+    def slot(self, name):
+        index = self.index.get(name)
+        if index is None:
+            index = self.index[name] = len(self.slots)
+            self.slots.append(_spl_missing)
+        return index
+
+    def __getitem__(self, name):
+        index = self.index.get(name)
+        if index is None or self.slots[index] is _spl_missing:
+            raise KeyError(name)
+        return _spl_flatten(self.slots[index])
+
+    def __setitem__(self, name, value):
+        self.slots[self.slot(name)] = value
+
+    def __delitem__(self, name):
+        index = self.index.get(name)
+        if index is None or self.slots[index] is _spl_missing:
+            raise KeyError(name)
+        self.slots[index] = _spl_missing
+
+    def __iter__(self):
+        return (name for name, index in self.index.items() if self.slots[index] is not _spl_missing)
+
+    def __len__(self):
+        return sum(1 for value in self.slots if value is not _spl_missing)
+
+    def clear(self):
+        self.slots[:] = [_spl_missing] * len(self.slots)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class Resolver:
+    """Copies the dict AST, giving each Variable, Assign and For node the
+    slot of its variable in a SlotTable. An Assign of the form
+    name = name + part + ... also gets its parts, as a tuple so that node
+    counts don't see them twice."""
+    NAME_KEYS = {'Variable': 'name', 'Assign': 'name', 'For': 'var_name'}
+
+    def __init__(self, table):
+        self.table = table
+
+    def resolve(self, node):
+        copy = {}
+        for key, value in node.items():
+            if isinstance(value, dict):
+                value = self.resolve(value)
+            elif isinstance(value, list):
+                value = [self.resolve(item) if isinstance(item, dict) else item for item in value]
+            copy[key] = value
+        name_key = self.NAME_KEYS.get(node.get('type'))
+        if name_key is not None:
+            copy['slot'] = self.table.slot(node[name_key])
+        if copy.get('type') == 'Assign':
+            parts = _spl_append_parts(copy)
+            if parts is not None:
+                copy['parts'] = tuple(parts)
+        return copy
+
+class StringBuilder:
+    """A string held as a list of parts, joined when it is read.
+
+    s = s + part copies all of s, so building a long string one part at a
+    time takes quadratic time. Assignments of that form append the part to
+    a StringBuilder in the variable's slot instead. Reading the variable
+    calls build(), so every other value a program sees is a plain str.
+    """
+    __slots__ = ('parts',)
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def build(self):
+        parts = self.parts
+        if len(parts) != 1:
+            parts[:] = [''.join(parts)]
+        return parts[0]
+
+def _spl_flatten(value):
+    return value.build() if type(value) is StringBuilder else value
+
+def _spl_append_parts(node):
+    """The parts of an Assign name = name + part + ..., or None.
+
+    Assigns whose parts read name are left alone, since those must see the
+    value from before the assignment."""
+    name, value, parts = node['name'], node['value'], []
+    while value['type'] == 'BinOp' and value['op'] == '+':
+        parts.append(value['right'])
+        value = value['left']
+    if not parts or value['type'] != 'Variable' or value['name'] != name:
+        return None
+    if any(item['type'] == 'Variable' and item['name'] == name for part in parts for item in _walk(part)):
+        return None
+    parts.reverse()
+    return parts
+
+def _spl_append(current, parts, quotas=None):
+    """current + parts[0] + parts[1] ..., for the variable holding current.
+
+    When current and the parts are strings they are appended to a
+    StringBuilder, and quotas is charged for the new characters only.
+    current is only changed once every part is known to be a string, so an
+    error leaves the variable as it was."""
+    kind = type(current)
+    if kind is str or kind is StringBuilder:
+        if all(type(part) is str for part in parts):
+            if quotas is not None:
+                for part in parts:
+                    quotas.charge_value(part)
+            if kind is str:
+                return StringBuilder([current, *parts])
+            current.parts.extend(parts)
+            return current
+        current = _spl_flatten(current)
+    for part in parts:
+        current = current + part
+        if quotas is not None:
+            quotas.charge_value(current)
+    return current
+
+class SPLArray:
+    """Numeric array made by List.array(items).
+
+    Arithmetic and comparisons with another array of the same length or
+    with a number apply element-wise, and the Math reductions take the whole
+    array in one call. The elements live in a NumPy float64 array when NumPy
+    is available and in a list of floats otherwise; NumPy is only imported
+    when the first array is made.
+    """
+    __slots__ = ('data',)
+    # == compares element-wise, so arrays can't be dict keys
+    __hash__ = None
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_value(cls, value):
+        if isinstance(value, SPLArray):
+            return cls(value.data.copy())
+        items = _spl_iterate(value)
+        if isinstance(items, ListView):
+            items = items.tolist()
+        np = _spl_import_numpy()
+        if np is None:
+            if not isinstance(items, range) and not all(isinstance(item, (int, float)) for item in items):
+                raise SPLError("List.array needs a list of numbers")
+            return cls(list(map(float, items)))
+        if isinstance(items, range):
+            return cls(np.arange(items.start, items.stop, items.step, dtype=float))
+        try:
+            data = np.array(items)
+        except ValueError:
+            data = None
+        if data is None or data.ndim != 1 or data.dtype.kind not in 'biuf':
+            raise SPLError("List.array needs a list of numbers")
+        return cls(data.astype(float))
+
+    def tolist(self):
+        return list(self.data) if isinstance(self.data, list) else self.data.tolist()
+
+    def _apply(self, other, fn, reflected=False):
+        if isinstance(other, SPLArray):
+            other = other.data
+            if len(other) != len(self.data):
+                raise SPLError(f"Array lengths differ: {len(self.data)} and {len(other)}")
+        elif not isinstance(other, (int, float)):
+            return NotImplemented
+        if not isinstance(self.data, list):
+            return SPLArray(fn(other, self.data) if reflected else fn(self.data, other))
+        if not isinstance(other, list):
+            other = itertools.repeat(other, len(self.data))
+        left, right = (other, self.data) if reflected else (self.data, other)
+        return SPLArray(list(map(fn, left, right)))
+
+    def __add__(self, other): return self._apply(other, operator.add)
+    def __radd__(self, other): return self._apply(other, operator.add, True)
+    def __sub__(self, other): return self._apply(other, operator.sub)
+    def __rsub__(self, other): return self._apply(other, operator.sub, True)
+    def __mul__(self, other): return self._apply(other, operator.mul)
+    def __rmul__(self, other): return self._apply(other, operator.mul, True)
+    def __gt__(self, other): return self._apply(other, operator.gt)
+    def __lt__(self, other): return self._apply(other, operator.lt)
+    def __ge__(self, other): return self._apply(other, operator.ge)
+    def __le__(self, other): return self._apply(other, operator.le)
+    def __eq__(self, other): return self._apply(other, operator.eq)
+    def __ne__(self, other): return self._apply(other, operator.ne)
+
+    def __truediv__(self, other):
+        _spl_check_divisor(other.data if isinstance(other, SPLArray) else other)
+        return self._apply(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        _spl_check_divisor(self.data)
+        return self._apply(other, operator.truediv, True)
+
+    def __neg__(self):
+        if isinstance(self.data, list):
+            return SPLArray([-item for item in self.data])
+        return SPLArray(-self.data)
+
+    def __bool__(self):
+        raise SPLError("An array has no single truth value; compare its Math.sum or Math.max instead")
+
+    def __len__(self): return len(self.data)
+
+    def sum(self):
+        return float(sum(self.data) if isinstance(self.data, list) else self.data.sum())
+
+    def max(self):
+        self._check_not_empty('max')
+        return float(max(self.data) if isinstance(self.data, list) else self.data.max())
+
+    def min(self):
+        self._check_not_empty('min')
+        return float(min(self.data) if isinstance(self.data, list) else self.data.min())
+
+    def average(self):
+        self._check_not_empty('average')
+        return self.sum() / len(self.data)
+
+    def _check_not_empty(self, name):
+        if not len(self.data):
+            raise SPLError(f"Math.{name} of an empty array")
+
+    def __str__(self): return str(self.tolist())
+    __repr__ = __str__
+
+class SharedList:
+    """Storage that ListViews read: items, whose index 0 is the parent
+    list's index offset.
+
+    While views are on a list, _spl_shared maps the list's id to its
+    SharedList, whose items is the list itself. Before the list changes,
+    detach() gives the SharedList a copy of the part views were made on,
+    low to high, so they go on seeing the items as they were. The items of
+    a lazy list are LazyItems, which never change.
+    """
+    __slots__ = ('items', 'offset', 'low', 'high', '__weakref__')
+
+    def __init__(self, items):
+        self.items = items
+        self.offset = 0
+        self.low = len(items)
+        self.high = 0
+
+    def detach(self):
+        self.items = self.items[self.low:self.high]
+        self.offset = self.low
+
+class ListView:
+    """A window onto a list, made by slice() and copy() without copying it,
+    or a lazy list such as range() makes.
+
+    Items are read from the parent's SharedList, so making a view takes O(1)
+    time whatever its length. Copy-on-write keeps a view a snapshot: a
+    change to the parent first detaches the SharedList, and a view copies
+    its window into a list of its own before its first change. Quotas charge
+    a view its length when it is made, as they did for the copy slice() used
+    to make, which also pays for the one copy it may need later. Lazy lists
+    are charged when that copy is made instead, as until then they take no
+    memory.
+    """
+    __slots__ = ('shared', 'start', 'stop', 'owned')
+    # Lists can't be dict keys either
+    __hash__ = None
+
+    def __init__(self, shared, start, stop):
+        self.shared = shared
+        # The window, as indices into the parent list
+        self.start = start
+        self.stop = stop
+        # Set once shared holds this view's own copy of its items
+        self.owned = False
+
+    def writable(self):
+        """The list of this view's items, copied out of the parent's before the first change"""
+        if not self.owned:
+            self.shared = SharedList(self.tolist())
+            self.start, self.owned = 0, True
+        return self.shared.items
+
+    def item(self, index):
+        shared = self.shared
+        return shared.items[self.start - shared.offset + index]
+
+    def tolist(self):
+        shared = self.shared
+        return shared.items[self.start - shared.offset:self.stop - shared.offset]
+
+    def index(self, item):
+        shared = self.shared
+        start = self.start - shared.offset
+        return shared.items.index(item, start, self.stop - shared.offset) - start
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        i = 0
+        shared = self.shared
+        if isinstance(shared.items, LazyItems):
+            # Lazy items don't change, so they are walked directly until the
+            # loop body changes this view
+            for item in shared.items.iterate(self.start, self.stop):
+                yield item
+                i += 1
+                if self.shared is not shared:
+                    break
+        # Looks the storage up each step, as the loop body may change it
+        while self.start + i < self.stop:
+            yield self.item(i)
+            i += 1
+
+    def __contains__(self, item):
+        try:
+            self.index(item)
+        except ValueError:
+            return False
+        return True
+
+    def _combine(self, other, fn):
+        if isinstance(other, ListView):
+            other = other.tolist()
+        elif not isinstance(other, list):
+            return NotImplemented
+        return fn(self.tolist(), other)
+
+    def __add__(self, other): return self._combine(other, operator.add)
+    def __radd__(self, other): return self._combine(other, lambda items, other: other + items)
+    def __eq__(self, other): return self._combine(other, operator.eq)
+    def __lt__(self, other): return self._combine(other, operator.lt)
+    def __le__(self, other): return self._combine(other, operator.le)
+    def __gt__(self, other): return self._combine(other, operator.gt)
+    def __ge__(self, other): return self._combine(other, operator.ge)
+    def __mul__(self, count): return self.tolist() * count
+    __rmul__ = __mul__
+
+    def __str__(self): return str(self.tolist())
+    __repr__ = __str__
+
+class LazyItems:
+    """Items worked out from their index instead of stored: the storage of
+    the lazy lists that range(), List.range(), List.fill() and
+    List.from_string() return.
+
+    A for loop walks them without making a list, indexing works them out
+    one at a time, and a lazy list makes a list of its items only when it
+    changes. A new lazy built-in subclasses this, giving __len__, items by
+    int index and by slice from __getitem__, and iterate(); index() may be
+    made faster than the walk here.
+    """
+    __slots__ = ()
+
+    def iterate(self, start, stop):
+        """An iterator over the items from start to stop"""
+        return map(self.__getitem__, range(start, stop))
+
+    def index(self, item, start, stop):
+        for i, value in enumerate(self.iterate(start, stop), start):
+            if value == item:
+                return i
+        raise ValueError(f"{item!r} is not in list")
+
+class RangeItems(LazyItems):
+    __slots__ = ('range',)
+
+    def __init__(self, items):
+        self.range = items
+
+    def __len__(self):
+        return len(self.range)
+
+    def __getitem__(self, index):
+        item = self.range[index]
+        return list(item) if isinstance(index, slice) else item
+
+    def iterate(self, start, stop):
+        return iter(self.range[start:stop])
+
+    def index(self, item, start, stop):
+        # range finds ints without a search, and SPL's numbers are floats
+        if type(item) is float and item.is_integer():
+            item = int(item)
+        if type(item) is int:
+            window = self.range[start:stop]
+            if item not in window:
+                raise ValueError(f"{item!r} is not in list")
+            return window.index(item) + start
+        return super().index(item, start, stop)
+
+class FillItems(LazyItems):
+    __slots__ = ('value', 'count')
+
+    def __init__(self, value, count):
+        self.value = value
+        self.count = max(count, 0)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.value] * len(range(*index.indices(self.count)))
+        if not -self.count <= index < self.count:
+            raise IndexError("list index out of range")
+        return self.value
+
+    def iterate(self, start, stop):
+        return itertools.repeat(self.value, max(stop - start, 0))
+
+class CharItems(LazyItems):
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __len__(self):
+        return len(self.text)
+
+    def __getitem__(self, index):
+        item = self.text[index]
+        return list(item) if isinstance(index, slice) else item
+
+    def iterate(self, start, stop):
+        return iter(self.text[start:stop])
+
+    def index(self, item, start, stop):
+        # Only one-character strings are among the items
+        i = self.text.find(item, start, stop) if type(item) is str and len(item) == 1 else -1
+        if i < 0:
+            raise ValueError(f"{item!r} is not in list")
+        return i
+
+def _spl_lazy(items):
+    """A lazy list of the LazyItems items"""
+    return ListView(SharedList(items), 0, len(items))
+
+def _spl_python_range(args):
+    """The Python range for range(end), range(start, end) or range(start, end, step)"""
+    if not 1 <= len(args) <= 3:
+        raise SPLError('range() takes 1 to 3 arguments')
+    return range(*map(int, args))
+
+def _spl_range(*args):
+    """range(...) as a lazy list"""
+    return _spl_lazy(RangeItems(_spl_python_range(args)))
+
+# id(list) -> weak reference to the SharedList of a list that views are on
+_spl_shared = {}
+
+def _spl_forget_shared(ref):
+    if _spl_shared.get(ref.key) is ref:
+        del _spl_shared[ref.key]
+
+def _spl_slice(items, start, end=None):
+    """items[start:end] of a list or ListView, as a ListView onto the same storage"""
+    end = None if end is None else int(end)
+    start, stop, _ = slice(int(start), end).indices(len(items))
+    stop = max(start, stop)
+    if isinstance(items, ListView):
+        if not items.owned:
+            shared = items.shared
+            start, stop = items.start + start, items.start + stop
+            return ListView(shared, start, stop)
+        items = items.shared.items
+    ref = _spl_shared.get(id(items))
+    shared = ref() if ref is not None else None
+    if shared is None:
+        import weakref
+        shared = SharedList(items)
+        _spl_shared[id(items)] = weakref.KeyedRef(shared, _spl_forget_shared, id(items))
+    if start < shared.low:
+        shared.low = start
+    if stop > shared.high:
+        shared.high = stop
+    return ListView(shared, start, stop)
+
+def _spl_unshare(items):
+    """The list items, once the views on it have been given their own copy"""
+    if _spl_shared:
+        ref = _spl_shared.pop(id(items), None)
+        shared = ref() if ref is not None else None
+        if shared is not None:
+            shared.detach()
+    return items
+
+def _spl_view_write(method):
+    """A list method that changes the list, for ListViews: the view first
+    copies its items into a list of its own"""
+    def write(view, *args):
+        items = view.writable()
+        try:
+            result = method(items, *args)
+        finally:
+            view.stop = len(items)
+        return view if result is items else result
+    return write
+
+# The list methods that change the list
+_SPL_LIST_WRITES = ('append', 'prepend', 'pop', 'remove', 'reverse', 'sort', 'clear')
+
+def _spl_check_divisor(divisor):
+    if isinstance(divisor, list):
+        zero = 0 in divisor
+    elif numpy is not None and isinstance(divisor, numpy.ndarray):
+        zero = not divisor.all()
+    else:
+        zero = divisor == 0
+    if zero:
+        raise SPLError("Division by zero")
+
+_SPL_SEQUENCES = (str, list, ListView)
+
+class QuotaExceeded(SPLError):
+    """Raised when a run goes over one of its Quotas.
+
+    quota names the limit ('nodes', 'time', 'list_elements', 'string_chars'
+    or 'output_lines'), limit is its configured value and used is how much
+    had been used when the run was stopped.
+    """
+    def __init__(self, quota, limit, used):
+        self.quota = quota
+        self.limit = limit
+        self.used = used
+        super().__init__(f"Quota exceeded: {quota} (limit {limit}, used {used})")
+
+class Quotas:
+    """Execution budgets for one run; a limit of None means unlimited.
+
+    Nodes are charged once per loop iteration, as the number of AST nodes in
+    the loop, and the wall-time limit is checked every check_interval
+    charged nodes. list_elements and string_chars count the size of every
+    list, array and string an operator, list literal or method creates; a
+    repetition with * is charged before it is built, and an append in place
+    (s = s + part) only for what it adds.
+    """
+    def __init__(self, max_nodes=None, max_time=None, max_list_elements=None, max_string_chars=None,
+                 max_output_lines=None, check_interval=10000):
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.max_list_elements = max_list_elements
+        self.max_string_chars = max_string_chars
+        self.max_output_lines = max_output_lines
+        self.check_interval = check_interval
+        self.start()
+
+    def start(self):
+        """Reset the counters and start the clock for a new run"""
+        self.nodes = 0
+        self.list_elements = 0
+        self.string_chars = 0
+        self.output_lines = 0
+        self.started = time.monotonic()
+        self.next_check = self.nodes + self.pause_interval()
+
+    def pause_interval(self):
+        """Nodes to run between checks of the node and time limits"""
+        if self.max_nodes is None:
+            return self.check_interval
+        return max(1, min(self.check_interval, self.max_nodes + 1 - self.nodes))
+
+    def charge_nodes(self, count):
+        self.nodes += count
+        if self.nodes >= self.next_check:
+            if self.max_nodes is not None and self.nodes > self.max_nodes:
+                raise QuotaExceeded('nodes', self.max_nodes, self.nodes)
+            elapsed = time.monotonic() - self.started
+            if self.max_time is not None and elapsed > self.max_time:
+                raise QuotaExceeded('time', self.max_time, round(elapsed, 3))
+            self.next_check = self.nodes + self.pause_interval()
+
+    def charge_value(self, value):
+        """Charge a newly created value by its size and return it"""
+        kind = type(value)
+        if kind is str:
+            self._charge_string(len(value))
+        elif kind is list or kind is SPLArray:
+            self._charge_list(len(value))
+        elif kind is ListView and not isinstance(value.shared.items, LazyItems):
+            self._charge_list(len(value))
+        return value
+
+    def multiply(self, left, right):
+        """left * right, charging a repeated string or list before it is built"""
+        if type(left) in _SPL_SEQUENCES and isinstance(right, (int, float)):
+            self._charge_repeat(left, right)
+        elif type(right) in _SPL_SEQUENCES and isinstance(left, (int, float)):
+            self._charge_repeat(right, left)
+        return left * right
+
+    def _charge_repeat(self, sequence, count):
+        size = len(sequence) * max(int(count), 0)
+        if type(sequence) is str:
+            self._charge_string(size)
+        else:
+            self._charge_list(size)
+
+    def call_method(self, obj, method_name, call, args):
+        """Return call(obj, args) for a method call on obj, charging what it allocates"""
+        if isinstance(obj, ListView) and method_name in _SPL_LIST_WRITES and isinstance(obj.shared.items, LazyItems):
+            # The view is about to make a list of its lazy items
+            self._charge_list(len(obj))
+        result = call(obj, args)
+        if isinstance(obj, (list, ListView)) and method_name in ('append', 'prepend'):
+            self._charge_list(1)
+        elif result is not obj:
+            self.charge_value(result)
+        return result
+
+    def charge_output_line(self):
+        self.output_lines += 1
+        if self.max_output_lines is not None and self.output_lines > self.max_output_lines:
+            raise QuotaExceeded('output_lines', self.max_output_lines, self.output_lines)
+
+    def _charge_list(self, size):
+        self.list_elements += size
+        if self.max_list_elements is not None and self.list_elements > self.max_list_elements:
+            raise QuotaExceeded('list_elements', self.max_list_elements, self.list_elements)
+
+    def _charge_string(self, size):
+        self.string_chars += size
+        if self.max_string_chars is not None and self.string_chars > self.max_string_chars:
+            raise QuotaExceeded('string_chars', self.max_string_chars, self.string_chars)
+
+class Profiler:
+    """Hit counts and times per source line and per node type for one run.
+
+    Every node that runs is counted, but to keep the overhead low only
+    statements are timed; the time of the expressions in a statement is
+    part of the statement's. A statement's own time, its time less that of
+    the statements inside it, is charged to its type and to its line, so
+    the line times add up to the whole run. A line's hits count the
+    statements on it that ran.
+    """
+    STATEMENTS = ('Assign', 'Print', 'If', 'While', 'For', 'Break', 'ExpressionStatement')
+
+    def __init__(self):
+        self.lines = collections.defaultdict(lambda: [0, 0.0])  # line -> [hits, seconds]
+        self.node_types = collections.defaultdict(lambda: [0, 0.0])  # type -> [hits, seconds]
+        # Time of the statements inside the statement running now
+        self.nested = 0.0
+
+    def measure(self, node, function, *args):
+        """Call function(*args) to run node, counting it and timing it if it is a statement"""
+        stats = self.node_types[node['type']]
+        stats[0] += 1
+        if node['type'] not in self.STATEMENTS:
+            return function(*args)
+        outer_nested, self.nested = self.nested, 0.0
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - self.nested
+            stats[1] += own
+            if node.get('line') is not None:
+                line_stats = self.lines[node['line']]
+                line_stats[0] += 1
+                line_stats[1] += own
+            self.nested = outer_nested + elapsed
+
+    def wrap(self, node, function):
+        """Return the compiled closure function for node, measured by this profiler"""
+        if node['type'] in self.STATEMENTS:
+            measure = self.measure
+            return lambda: measure(node, function)
+        stats = self.node_types[node['type']]
+        def counted():
+            stats[0] += 1
+            return function()
+        return counted
+
+    def report(self):
+        """The profile as a JSON-ready dict, lines in order and node types slowest first"""
+        return {
+            'total': sum(seconds for _, seconds in self.node_types.values()),
+            'lines': [{'line': line, 'hits': hits, 'time': seconds}
+                      for line, (hits, seconds) in sorted(self.lines.items())],
+            'nodes': [{'type': kind, 'hits': hits, 'time': seconds}
+                      for kind, (hits, seconds) in sorted(self.node_types.items(), key=lambda item: -item[1][1])]
+        }
+
+class OutputSink:
+    """Where printed lines go. It has the append() of the list it replaces.
+
+    Only the last max_lines lines are kept for the result (all of them if it
+    is None), and dropped counts the ones that fell off the front. With a
+    target, every line is also passed on in batches of batch_size; flush()
+    sends a partial batch. The target can be a callable or a generator,
+    which get a list of lines, or a file-like object, which gets them joined
+    with newlines.
+    """
+    def __init__(self, target=None, batch_size=100, max_lines=None):
+        self.deliver = _spl_sink(target)
+        self.batch_size = batch_size
+        self.lines = collections.deque(maxlen=max_lines)
+        self.pending = []
+        self.dropped = 0
+        # Quotas whose output_lines limit applies, if any
+        self.quotas = None
+
+    def append(self, line):
+        if self.quotas is not None:
+            self.quotas.charge_output_line()
+        lines = self.lines
+        if len(lines) == lines.maxlen:
+            self.dropped += 1
+        lines.append(line)
+        if self.deliver is not None:
+            self.pending.append(line)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if self.pending:
+            lines, self.pending = self.pending, []
+            self.deliver(lines)
+
+def _spl_sink(target):
+    """Turn a callable, generator or file-like object into a function taking a list of lines"""
+    if target is None or callable(target):
+        return target
+    if isinstance(target, types.GeneratorType):
+        next(target)  # Run it up to its first yield, ready for send()
+        return target.send
+    if hasattr(target, 'write'):
+        return lambda lines: target.write(''.join(line + '\\n' for line in lines))
+    raise SPLError(f"Not an output sink: {target!r}")
+
 class Interpreter:
     def __init__(self):
-        self.variables = {}
-        self.output = []
+        self.variables = SlotTable()
+        self.slots = self.variables.slots
+        self.output = OutputSink()
+        # Set by cancel_spl_code() to stop an execute_spl_code_async run
+        self.stop_requested = False
+        # Quotas enforced on the current run, or None for no limits
+        self.quotas = None
+        # One dict of Invariant values per running loop
+        self.loop_frames = []
+        # Profiler timing the current run, set with set_profiler()
+        self.profiler = None
+        # Checkpoints of the last incremental run, made by the first one
+        self.checkpoints = None
+
+    def set_profiler(self, profiler):
+        """Time every node this interpreter runs into profiler; None stops profiling"""
+        self.profiler = profiler
+        if profiler is None:
+            self.__dict__.pop('interpret', None)
+        else:
+            interpret = Interpreter.interpret.__get__(self)
+            self.interpret = lambda node: profiler.measure(node, interpret, node)
     
+    def run(self, program):
+        """Resolve variables to slots, then interpret the program"""
+        return _spl_flatten(self.interpret(Resolver(self.variables).resolve(program)))
+
     def interpret(self, node):
         method_name = f'visit_{node["type"]}'
         method = getattr(self, method_name, self.generic_visit)
@@ -446,20 +1504,28 @@ class Interpreter:
 
     def visit_Break(self, node): raise BreakException()
     
+    def _slot(self, node, name):
+        slot = node.get('slot')
+        return self.variables.slot(name) if slot is None else slot
+
     def visit_Variable(self, node):
         name = node['name']
-        if name in self.variables:
-            return self.variables[name]
-        else:
+        value = self.slots[self._slot(node, name)]
+        if value is _spl_missing:
             raise SPLError(f"Variable '{name}' is not defined")
+        if type(value) is StringBuilder:
+            return value.build()
+        return value
     
     def visit_BinOp(self, node):
         left = self.interpret(node['left'])
         right = self.interpret(node['right'])
         op = node['op']
         
-        if op == '/' and right == 0:
-            raise SPLError("Division by zero")
+        if op == '/':
+            return _spl_divide(left, right)
+        if self.quotas is not None and op in ('+', '*'):
+            return self.quotas.charge_value(left + right) if op == '+' else self.quotas.multiply(left, right)
 
         ops = {
             '+': lambda l, r: l + r,
@@ -487,10 +1553,22 @@ class Interpreter:
             raise SPLError(f"Unknown unary operator: {node['op']}")
     
     def visit_Assign(self, node):
+        parts = node.get('parts')
+        if parts is not None:
+            return self._append(node, parts)
         value = self.interpret(node['value'])
-        self.variables[node['name']] = value
+        self.slots[self._slot(node, node['name'])] = value
         return value
     
+    def _append(self, node, parts):
+        name = node['name']
+        slot = self._slot(node, name)
+        current = self.slots[slot]
+        if current is _spl_missing:
+            raise SPLError(f"Variable '{name}' is not defined")
+        result = self.slots[slot] = _spl_append(current, [self.interpret(part) for part in parts], self.quotas)
+        return result
+
     def visit_ExpressionStatement(self, node):
         # Evaluate expression but don't return the value (for statements)
         self.interpret(node['expression'])
@@ -511,58 +1589,92 @@ class Interpreter:
         return None
 
     def visit_For(self, node):
-        iterable_value = self.interpret(node['iterable'])
+        items = self._iterate(node['iterable'])
+        if node.get('parallel'):
+            ran = _spl_parallel_for(self, _spl_parallel_plan(node), items, self.variables)
+            if ran is not _spl_missing:
+                return _spl_parallel_result(self.variables, ran)
+        slots, slot = self.slots, self._slot(node, node['var_name'])
+        quotas = self.quotas
+        cost = _spl_node_count(node) if quotas is not None else 0
         result = None
+        self.loop_frames.append({})
         try:
-            if isinstance(iterable_value, list):
-                for item in iterable_value:
-                    self.variables[node['var_name']] = item
-                    result = self._execute_statements(node['body'])
-            elif isinstance(iterable_value, dict) and iterable_value.get('type') == 'range':
-                start = int(iterable_value.get('start', 0))
-                end = int(iterable_value.get('end', 0))
-                step = int(iterable_value.get('step', 1))
-                for i in range(start, end, step):
-                    self.variables[node['var_name']] = i
-                    result = self._execute_statements(node['body'])
-            else:
-                raise SPLError(f"Object is not iterable: {type(iterable_value)}")
+            for item in items:
+                if quotas is not None:
+                    quotas.charge_nodes(cost)
+                slots[slot] = item
+                result = self._execute_statements(node['body'])
         except BreakException:
             pass
+        finally:
+            self.loop_frames.pop()
         return result
     
+    def _iterate(self, node):
+        """What a for loop over the expression node walks"""
+        if node['type'] == 'Range':
+            # Nothing else can see the range a loop over range() makes, so
+            # it walks a Python range instead of a lazy list
+            return _spl_python_range([self.interpret(arg) for arg in node['args']])
+        return _spl_iterate(self.interpret(node))
+
     def visit_Range(self, node):
-        args = [self.interpret(arg) for arg in node['args']]
-        if len(args) == 1:
-            return {'type': 'range', 'start': 0, 'end': int(args[0]), 'step': 1}
-        elif len(args) == 2:
-            return {'type': 'range', 'start': int(args[0]), 'end': int(args[1]), 'step': 1}
-        elif len(args) == 3:
-            return {'type': 'range', 'start': int(args[0]), 'end': int(args[1]), 'step': int(args[2])}
-        else:
-            raise SPLError('range() takes 1 to 3 arguments')
+        return self._make_range([self.interpret(arg) for arg in node['args']])
+
+    def _make_range(self, args):
+        return _spl_range(*args)
 
     def visit_While(self, node):
+        quotas = self.quotas
+        cost = _spl_node_count(node) if quotas is not None else 0
         result = None
+        self.loop_frames.append({})
         try:
             while self.interpret(node['condition']):
+                if quotas is not None:
+                    quotas.charge_nodes(cost)
                 result = self._execute_statements(node['body'])
         except BreakException:
             pass
+        finally:
+            self.loop_frames.pop()
         return result
+
+    def visit_Invariant(self, node):
+        frame = self.loop_frames[node['depth']]
+        key = id(node)
+        if key in frame:
+            return frame[key]
+        value = frame[key] = self.interpret(node['expression'])
+        return value
     
     def visit_List(self, node):
-        return [self.interpret(element) for element in node['elements']]
+        items = [self.interpret(element) for element in node['elements']]
+        if self.quotas is not None:
+            self.quotas.charge_value(items)
+        return items
     
     def visit_Index(self, node):
-        obj = self.interpret(node['object'])
-        index = int(self.interpret(node['index']))
-        
+        return self._index(self.interpret(node['object']), self.interpret(node['index']))
+
+    def _index(self, obj, index):
+        index = int(index)
         if isinstance(obj, list):
             if 0 <= index < len(obj):
                 return obj[index]
             else:
                 raise SPLError(f"List index out of range: {index}")
+        elif isinstance(obj, ListView):
+            if 0 <= index < len(obj):
+                return obj.item(index)
+            else:
+                raise SPLError(f"List index out of range: {index}")
+        elif isinstance(obj, SPLArray):
+            if 0 <= index < len(obj):
+                return float(obj.data[index])
+            else:
+                raise SPLError(f"Array index out of range: {index}")
         else:
             raise SPLError(f"Object is not indexable: {type(obj)}")
     
@@ -570,163 +1682,178 @@ class Interpreter:
         obj = self.interpret(node['object'])
         method_name = node['method']
         args = [self.interpret(arg) for arg in node['args']]
+        return self._call_method(obj, method_name, args)
 
-        if isinstance(obj, str):
-            return self._call_string_method(obj, method_name, args)
-        elif isinstance(obj, list):
-            return self._call_list_method(obj, method_name, args)
-        elif isinstance(obj, (int, float)):
-            return self._call_number_method(obj, method_name, args)
-        elif isinstance(obj, bool):
-            return self._call_boolean_method(obj, method_name, args)
-        else:
-            raise SPLError(f"Object of type {type(obj)} has no methods")
+    def _call_method(self, obj, method_name, args):
+        if self.quotas is not None:
+            return self.quotas.call_method(obj, method_name, self._lookup_method(type(obj), method_name), args)
+        return self._dispatch_method(obj, method_name, args)
+
+    def _dispatch_method(self, obj, method_name, args):
+        return self._lookup_method(type(obj), method_name)(obj, args)
 
     def visit_StaticMethodCall(self, node):
         class_name = node['class']
         method_name = node['method']
         args = [self.interpret(arg) for arg in node['args']]
+        return self._call_static_method(class_name, method_name, args)
 
-        if class_name == 'String':
-            return self._call_string_static_method(method_name, args)
-        elif class_name == 'List':
-            return self._call_list_static_method(method_name, args)
-        elif class_name == 'Math':
-            return self._call_math_static_method(method_name, args)
-        else:
-            raise SPLError(f"Unknown class: {class_name}")
-    
-    def _call_string_static_method(self, method_name, args):
-        methods = {
+    def _call_static_method(self, class_name, method_name, args):
+        if self.quotas is not None:
+            return self.quotas.charge_value(self._dispatch_static_method(class_name, method_name, args))
+        return self._dispatch_static_method(class_name, method_name, args)
+
+    def _dispatch_static_method(self, class_name, method_name, args):
+        return self._lookup_static_method(class_name, method_name)(*args)
+
+    # The methods of each type of value, called as method(obj, *args)
+    STRING_METHODS = {
+        'length': lambda string_obj: len(string_obj),
+        'upper': lambda string_obj: string_obj.upper(),
+        'lower': lambda string_obj: string_obj.lower(),
+        'slice': lambda string_obj, start, end=None: string_obj[start:end] if end else string_obj[start:],
+        'replace': lambda string_obj, old, new: string_obj.replace(old, new),
+        'split': lambda string_obj, sep=' ': string_obj.split(sep),
+        'strip': lambda string_obj: string_obj.strip(),
+        'startswith': lambda string_obj, prefix: string_obj.startswith(prefix),
+        'endswith': lambda string_obj, suffix: string_obj.endswith(suffix),
+        'find': lambda string_obj, substring: string_obj.find(substring),
+        'contains': lambda string_obj, substring: substring in string_obj
+    }
+
+    LIST_METHODS = {
+        'length': lambda list_obj: len(list_obj),
+        # Loops call these most, so they skip the call unless this list has views
+        'append': lambda list_obj, item: (_spl_unshare(list_obj) if _spl_shared and id(list_obj) in _spl_shared
+                                          else list_obj).append(item) or list_obj,
+        'prepend': lambda list_obj, item: (_spl_unshare(list_obj) if _spl_shared and id(list_obj) in _spl_shared
+                                           else list_obj).insert(0, item) or list_obj,
+        'pop': lambda list_obj, index=-1: _spl_unshare(list_obj).pop(index),
+        'remove': lambda list_obj, item: _spl_unshare(list_obj).remove(item) or list_obj,
+        'reverse': lambda list_obj: _spl_unshare(list_obj).reverse() or list_obj,
+        'sort': lambda list_obj: _spl_unshare(list_obj).sort() or list_obj,
+        'contains': lambda list_obj, item: item in list_obj,
+        'index': lambda list_obj, item: list_obj.index(item) if item in list_obj else -1,
+        'slice': _spl_slice,
+        'join': lambda list_obj, separator=',': separator.join(str(x) for x in list_obj),
+        'clear': lambda list_obj: _spl_unshare(list_obj).clear() or list_obj,
+        'copy': lambda list_obj: _spl_slice(list_obj, 0)
+    }
+
+    # Slices and copies; reading methods work on them as on lists
+    LIST_VIEW_METHODS = dict(LIST_METHODS, **{
+        name: _spl_view_write(method) for name, method in LIST_METHODS.items() if name in _SPL_LIST_WRITES
+    })
+
+    ARRAY_METHODS = {
+        'length': lambda array_obj: len(array_obj),
+        'copy': lambda array_obj: SPLArray.from_value(array_obj),
+        'tolist': lambda array_obj: array_obj.tolist()
+    }
+
+    NUMBER_METHODS = {
+        'abs': lambda number_obj: abs(number_obj),
+        'round': lambda number_obj, digits=0: round(number_obj, int(digits)),
+        'floor': lambda number_obj: math.floor(number_obj),
+        'ceil': lambda number_obj: math.ceil(number_obj),
+        'sqrt': lambda number_obj: math.sqrt(number_obj),
+        'pow': lambda number_obj, exponent: number_obj ** exponent,
+        'tostring': lambda number_obj: str(number_obj),
+        'sign': lambda number_obj: 1 if number_obj > 0 else (-1 if number_obj < 0 else 0)
+    }
+
+    BOOLEAN_METHODS = {
+        'tostring': lambda bool_obj: str(bool_obj).lower(),
+        'tonumber': lambda bool_obj: 1 if bool_obj else 0,
+        'not': lambda bool_obj: not bool_obj
+    }
+
+    # Receiver type -> (its name in errors, its methods, the exceptions a
+    # method raises for bad arguments, the error they become). bool comes
+    # before int, its base class, for receivers found by subclass.
+    RECEIVERS = {
+        str: ('String', STRING_METHODS, (TypeError,), "Wrong number of arguments for string.{method}"),
+        list: ('List', LIST_METHODS, (TypeError, ValueError), "Error in list.{method}: {error}"),
+        ListView: ('List', LIST_VIEW_METHODS, (TypeError, ValueError), "Error in list.{method}: {error}"),
+        SPLArray: ('Array', ARRAY_METHODS, (TypeError,), "Wrong number of arguments for array.{method}"),
+        bool: ('Boolean', BOOLEAN_METHODS, (TypeError,), "Wrong number of arguments for boolean.{method}"),
+        int: ('Number', NUMBER_METHODS, (TypeError, ValueError), "Error in number.{method}: {error}"),
+        float: ('Number', NUMBER_METHODS, (TypeError, ValueError), "Error in number.{method}: {error}")
+    }
+
+    STATIC_METHODS = {
+        'String': {
             'fromcode': lambda code: chr(int(code)),
             'join': lambda items, sep='': sep.join(str(x) for x in items),
             'repeat': lambda text, count: str(text) * int(count),
-            'ascii_letters': lambda: string.ascii_letters,
-            'digits': lambda: string.digits
-            
-        }
-        
-        if method_name not in methods:
-            raise SPLError(f"String class has no static method '{method_name}'")
-        
-        return methods[method_name](*args)
-
-    def _call_string_method(self, string_obj, method_name, args):
-        methods = {
-            'length': lambda: len(string_obj),
-            'upper': lambda: string_obj.upper(),
-            'lower': lambda: string_obj.lower(),
-            'slice': lambda start, end=None: string_obj[start:end] if end else string_obj[start:],
-            'replace': lambda old, new: string_obj.replace(old, new),
-            'split': lambda sep=' ': string_obj.split(sep),
-            'strip': lambda: string_obj.strip(),
-            'startswith': lambda prefix: string_obj.startswith(prefix),
-            'endswith': lambda suffix: string_obj.endswith(suffix),
-            'find': lambda substring: string_obj.find(substring),
-            'contains': lambda substring: substring in string_obj 
-        }
-
-        if method_name not in methods:
-            raise SPLError(f"String has no method '{method_name}'")
-
-        try:
-            return methods[method_name](*args)
-        except TypeError:
-            raise SPLError(f"Wrong number of arguments for string.{method_name}")
-
-    def _call_list_static_method(self, method_name, args):
-        methods = {
-            'range': lambda start, end=None, step=1: list(range(start, end or start, step)),
-            'fill': lambda count, value: [value] * int(count),
+            'ascii_letters': lambda: importlib.import_module('string').ascii_letters,
+            'digits': lambda: importlib.import_module('string').digits
+        },
+        'List': {
+            'range': _spl_range,
+            'fill': lambda count, value: _spl_lazy(FillItems(value, int(count))),
             'empty': lambda: [],
-            'from_string': lambda text: list(text)
-        }
-        
-        if method_name not in methods:
-            raise SPLError(f"List class has no static method '{method_name}'")
-        
-        return methods[method_name](*args)
-    
-    def _call_math_static_method(self, method_name, args):
-        methods = {
+            'from_string': lambda text: _spl_lazy(CharItems(text)) if isinstance(text, str) else list(text),
+            'array': lambda items: SPLArray.from_value(items)
+        },
+        'Math': {
             'pi': lambda: math.pi,
             'e': lambda: math.e,
-            'random': lambda: random.random(),
-            'max': lambda items: max(items),
-            'min': lambda items: min(items),
-            'sum': lambda items: sum(items),
-            'average': lambda items: sum(items) / len(items),
+            'random': lambda: importlib.import_module('random').random(),
+            'max': lambda items: items.max() if isinstance(items, SPLArray) else max(items),
+            'min': lambda items: items.min() if isinstance(items, SPLArray) else min(items),
+            'sum': lambda items: items.sum() if isinstance(items, SPLArray) else sum(items),
+            'average': lambda items: items.average() if isinstance(items, SPLArray) else sum(items) / len(items),
             'sin': lambda x: math.sin(x),
             'cos': lambda x: math.cos(x),
             'tan': lambda x: math.tan(x),
             'log': lambda x: math.log(x)
         }
+    }
 
-        if method_name not in methods:
-            raise SPLError(f"Math class has no static method '{method_name}'")
-        
-        return methods[method_name](*args)
-
-    def _call_list_method(self, list_obj, method_name, args):
-        methods = {
-            'length': lambda: len(list_obj),
-            'append': lambda item: list_obj.append(item) or list_obj,
-            'prepend': lambda item: list_obj.insert(0, item) or list_obj,
-            'pop': lambda index=-1: list_obj.pop(index),
-            'remove': lambda item: list_obj.remove(item) or list_obj,
-            'reverse': lambda: list_obj.reverse() or list_obj,
-            'sort': lambda: list_obj.sort() or list_obj,
-            'contains': lambda item: item in list_obj,
-            'index': lambda item: list_obj.index(item) if item in list_obj else -1,
-            'slice': lambda start, end=None: list_obj[start:end] if end else list_obj[start:],
-            'join': lambda separator=',': separator.join(str(x) for x in list_obj),
-            'clear': lambda: list_obj.clear() or list_obj,
-            'copy': lambda: list_obj.copy()
-        }
-        
-        if method_name not in methods:
-            raise SPLError(f"List has no method '{method_name}'")
-        
-        try:
-            return methods[method_name](*args)
-        except (TypeError, ValueError) as e:
-            raise SPLError(f"Error in list.{method_name}: {str(e)}")
-
-    def _call_number_method(self, number_obj, method_name, args):
-
-        methods = {
-            'abs': lambda: abs(number_obj),
-            'round': lambda digits=0: round(number_obj, int(digits)),
-            'floor': lambda: math.floor(number_obj),
-            'ceil': lambda: math.ceil(number_obj),
-            'sqrt': lambda: math.sqrt(number_obj),
-            'pow': lambda exponent: number_obj ** exponent,
-            'tostring': lambda: str(number_obj),
-            'sign': lambda: 1 if number_obj > 0 else (-1 if number_obj < 0 else 0)
-        }
+    # (receiver type, method name) -> call(obj, args), filled in by _lookup_method
+    _method_cache = {}
 
-        if method_name not in methods:
-            raise SPLError(f"Number has no method '{method_name}'")
-        
-        try:
-            return methods[method_name](*args)
-        except (TypeError, ValueError) as e:
-            raise SPLError(f"Error in number.{method_name}: {str(e)}")
-
-    def _call_boolean_method(self, bool_obj, method_name, args):
-        methods = {
-            'tostring': lambda: str(bool_obj).lower(),
-            'tonumber': lambda: 1 if bool_obj else 0,
-            'not': lambda: not bool_obj
-        }
+    @classmethod
+    def _lookup_method(cls, receiver_type, method_name):
+        """call(obj, args), which runs method_name on a receiver_type and
+        turns bad arguments into an SPLError"""
+        key = (receiver_type, method_name)
+        call = cls._method_cache.get(key)
+        if call is None:
+            call = cls._method_cache[key] = cls._bind_method(receiver_type, method_name)
+        return call
 
-        if method_name not in methods:
-            raise SPLError(f"Boolean has no method '{method_name}'")
-        
-        try:
-            return methods[method_name](*args)
-        except TypeError:
-            raise SPLError(f"Wrong number of arguments for boolean.{method_name}")
+    @classmethod
+    def _bind_method(cls, receiver_type, method_name):
+        receiver = cls.RECEIVERS.get(receiver_type)
+        if receiver is None:
+            # Subclasses of the value types, such as NumPy's float64
+            receiver = next((receiver for base, receiver in cls.RECEIVERS.items()
+                             if issubclass(receiver_type, base)), None)
+            if receiver is None:
+                raise SPLError(f"Object of type {receiver_type} has no methods")
+        kind, methods, errors, message = receiver
+        method = methods.get(method_name)
+        if method is None:
+            raise SPLError(f"{kind} has no method '{method_name}'")
+
+        def call(obj, args):
+            try:
+                return method(obj, *args)
+            except errors as e:
+                raise SPLError(message.format(method=method_name, error=e))
+        return call
+
+    @classmethod
+    def _lookup_static_method(cls, class_name, method_name):
+        methods = cls.STATIC_METHODS.get(class_name)
+        if methods is None:
+            raise SPLError(f"Unknown class: {class_name}")
+        method = methods.get(method_name)
+        if method is None:
+            raise SPLError(f"{class_name} class has no static method '{method_name}'")
+        return method
 
     def _execute_statements(self, statements):
         result = None
@@ -734,34 +1861,1836 @@ class Interpreter:
             result = self.interpret(stmt)
         return result
 
+def _spl_method_site(interpreter, method_name):
+    """site(obj, args) for one method call in a program. It keeps the method
+    it found for the last receiver type, so a loop calling it on values of
+    one type looks the method up once."""
+    lookup = interpreter._lookup_method
+    receiver_type = call = None
+
+    def site(obj, args):
+        nonlocal receiver_type, call
+        if type(obj) is not receiver_type:
+            call = lookup(type(obj), method_name)
+            receiver_type = type(obj)
+        if interpreter.quotas is not None:
+            return interpreter.quotas.call_method(obj, method_name, call, args)
+        return call(obj, args)
+    return site
+
+def _spl_static_method_site(interpreter, class_name, method_name):
+    """site(args) for one static method call in a program, which looks the
+    method up on its first call"""
+    method = None
+
+    def site(args):
+        nonlocal method
+        if method is None:
+            method = interpreter._lookup_static_method(class_name, method_name)
+        if interpreter.quotas is not None:
+            return interpreter.quotas.charge_value(method(*args))
+        return method(*args)
+    return site
+
 class BreakException(Exception): pass
 
+class Compiler:
+    """Turns the dict AST into nested closures in a single pass.
+
+    Operators, variable lookups and control flow are resolved once here, so
+    running the returned closure skips the per-node getattr dispatch of
+    Interpreter.interpret. Closures are bound to the slots of the interpreter's
+    variables, which are assigned here as names are first seen.
+    """
+    BINARY_OPS = {
+        '+': operator.add, '-': operator.sub, '*': operator.mul,
+        '>': operator.gt, '<': operator.lt, '>=': operator.ge,
+        '<=': operator.le, '==': operator.eq, '!=': operator.ne
+    }
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.variables = interpreter.variables
+        # Cells of the Invariant nodes owned by each loop being compiled
+        self.loop_cells = []
+
+    def compile(self, node):
+        method = getattr(self, f'compile_{node["type"]}', None)
+        if method is None:
+            raise SPLError(f"No visit method for {node['type']}")
+        if self.interpreter.profiler is not None:
+            return self.interpreter.profiler.wrap(node, method(node))
+        return method(node)
+
+    def compile_block(self, statements):
+        compiled = [self.compile(stmt) for stmt in statements]
+        if not compiled:
+            return lambda: None
+        if len(compiled) == 1:
+            return compiled[0]
+        def block():
+            result = None
+            for stmt in compiled:
+                result = stmt()
+            return result
+        return block
+
+    def compile_Program(self, node): return self.compile_block(node['statements'])
+
+    def compile_Number(self, node):
+        value = node['value']
+        return lambda: value
+
+    compile_Boolean = compile_Number
+    compile_String = compile_Number
+
+    def compile_Break(self, node):
+        def break_loop():
+            raise BreakException()
+        return break_loop
+
+    def compile_Variable(self, node):
+        name, slots = node['name'], self.variables.slots
+        slot = self.variables.slot(name)
+        def variable():
+            value = slots[slot]
+            if value is _spl_missing:
+                raise SPLError(f"Variable '{name}' is not defined")
+            if type(value) is StringBuilder:
+                return value.build()
+            return value
+        return variable
+
+    def compile_BinOp(self, node):
+        op = node['op']
+        left, right = self.compile(node['left']), self.compile(node['right'])
+        if op == '/':
+            return lambda: _spl_divide(left(), right())
+
+        fn = self.BINARY_OPS.get(op)
+        if fn is None:
+            raise SPLError(f"Unknown operator: {op}")
+        quotas = self.interpreter.quotas
+        if quotas is not None and op == '+':
+            charge = quotas.charge_value
+            return lambda: charge(left() + right())
+        if quotas is not None and op == '*':
+            multiply = quotas.multiply
+            return lambda: multiply(left(), right())
+        if node['right']['type'] in ('Number', 'String', 'Boolean'):
+            constant = node['right']['value']
+            return lambda: fn(left(), constant)
+        return lambda: fn(left(), right())
+
+    def compile_UnaryOp(self, node):
+        if node['op'] != '-':
+            raise SPLError(f"Unknown unary operator: {node['op']}")
+        operand = self.compile(node['operand'])
+        return lambda: -operand()
+
+    def compile_Assign(self, node):
+        slots, slot = self.variables.slots, self.variables.slot(node['name'])
+        parts = _spl_append_parts(node)
+        if parts is not None:
+            return self.compile_append(node['name'], slot, [self.compile(part) for part in parts])
+        value = self.compile(node['value'])
+        def assign():
+            result = slots[slot] = value()
+            return result
+        return assign
+
+    def compile_append(self, name, slot, parts):
+        slots, quotas = self.variables.slots, self.interpreter.quotas
+        if len(parts) == 1 and quotas is None:
+            part = parts[0]
+            # Mostly counters like i = i + 1, so numbers skip _spl_append
+            def append_one():
+                current = slots[slot]
+                if current is _spl_missing:
+                    raise SPLError(f"Variable '{name}' is not defined")
+                value = part()
+                if type(value) is str:
+                    result = slots[slot] = _spl_append(current, (value,))
+                    return result
+                if type(current) is StringBuilder:
+                    current = current.build()
+                result = slots[slot] = current + value
+                return result
+            return append_one
+        def append():
+            current = slots[slot]
+            if current is _spl_missing:
+                raise SPLError(f"Variable '{name}' is not defined")
+            result = slots[slot] = _spl_append(current, [part() for part in parts], quotas)
+            return result
+        return append
+
+    def compile_ExpressionStatement(self, node):
+        expression = self.compile(node['expression'])
+        def expression_statement():
+            expression()
+        return expression_statement
+
+    def compile_Print(self, node):
+        interpreter = self.interpreter
+        args = [self.compile(arg) for arg in node['args']]
+        def print_statement():
+            interpreter.output.append(' '.join([str(arg()) for arg in args]))
+        return print_statement
+
+    def compile_If(self, node):
+        condition = self.compile(node['condition'])
+        then_branch = self.compile_block(node['then_branch'])
+        else_branch = self.compile_block(node['else_branch']) if node['else_branch'] else None
+        def if_statement():
+            if condition():
+                return then_branch()
+            elif else_branch is not None:
+                return else_branch()
+            return None
+        return if_statement
+
+    def charged_body(self, node, body):
+        """Charge each run of a loop body to the quotas as every node in the loop"""
+        quotas = self.interpreter.quotas
+        if quotas is None:
+            return body
+        charge_nodes, cost = quotas.charge_nodes, _spl_node_count(node)
+        def charged():
+            charge_nodes(cost)
+            return body()
+        return charged
+
+    def compile_While(self, node):
+        self.loop_cells.append([])
+        condition, body = self.compile(node['condition']), self.charged_body(node, self.compile_block(node['body']))
+        cells = self.loop_cells.pop()
+        def while_loop():
+            for cell in cells:
+                cell[0] = _spl_missing
+            result = None
+            try:
+                while condition():
+                    result = body()
+            except BreakException:
+                pass
+            return result
+        return while_loop
+
+    def compile_For(self, node):
+        slots, slot = self.variables.slots, self.variables.slot(node['var_name'])
+        if node['iterable']['type'] == 'Range':
+            # As in Interpreter._iterate
+            args = [self.compile(arg) for arg in node['iterable']['args']]
+            iterate = lambda: _spl_python_range([arg() for arg in args])
+        else:
+            iterable = self.compile(node['iterable'])
+            iterate = lambda: _spl_iterate(iterable())
+        self.loop_cells.append([])
+        body = self.charged_body(node, self.compile_block(node['body']))
+        cells = self.loop_cells.pop()
+        interpreter, variables = self.interpreter, self.variables
+        plan = _spl_parallel_plan(node) if node.get('parallel') else None
+        def for_loop():
+            items = iterate()
+            if plan is not None:
+                ran = _spl_parallel_for(interpreter, plan, items, variables)
+                if ran is not _spl_missing:
+                    return _spl_parallel_result(variables, ran)
+            for cell in cells:
+                cell[0] = _spl_missing
+            result = None
+            try:
+                for item in items:
+                    slots[slot] = item
+                    result = body()
+            except BreakException:
+                pass
+            return result
+        return for_loop
+
+    def compile_Invariant(self, node):
+        expression = self.compile(node['expression'])
+        cell = [_spl_missing]
+        self.loop_cells[node['depth']].append(cell)
+        def invariant():
+            value = cell[0]
+            if value is _spl_missing:
+                value = cell[0] = expression()
+            return value
+        return invariant
+
+    def compile_Range(self, node):
+        make_range = self.interpreter._make_range
+        args = [self.compile(arg) for arg in node['args']]
+        return lambda: make_range([arg() for arg in args])
+
+    def compile_List(self, node):
+        elements = [self.compile(element) for element in node['elements']]
+        if self.interpreter.quotas is not None:
+            charge = self.interpreter.quotas.charge_value
+            return lambda: charge([element() for element in elements])
+        return lambda: [element() for element in elements]
+
+    def compile_Index(self, node):
+        index_value = self.interpreter._index
+        obj, index = self.compile(node['object']), self.compile(node['index'])
+        return lambda: index_value(obj(), index())
+
+    def compile_MethodCall(self, node):
+        site = _spl_method_site(self.interpreter, node['method'])
+        obj = self.compile(node['object'])
+        args = [self.compile(arg) for arg in node['args']]
+        if not args:
+            return lambda: site(obj(), ())
+        return lambda: site(obj(), [arg() for arg in args])
+
+    def compile_StaticMethodCall(self, node):
+        site = _spl_static_method_site(self.interpreter, node['class'], node['method'])
+        args = [self.compile(arg) for arg in node['args']]
+        return lambda: site([arg() for arg in args])
+
+class Transpiler:
+    """Translates the dict AST into Python source for CPython to compile.
+
+    The program becomes one function, _spl_main(_out, _values), and every
+    SPL variable x is its fast local v_x. The locals are loaded from the
+    _values list on entry and stored back into it on exit, in the order of
+    the _spl_names tuple the module also defines.
+    Only the last statement of a block stores its value, since that is the
+    only one Interpreter._execute_statements returns.
+    Each method call site gets a module-level inline cache, _m1, _m2 and so
+    on, made by _method_site or _static_method_site when the module runs.
+
+    With quotas set, + and * and list literals are charged through _charge
+    and _multiply, and streaming must be set too.
+
+    lists names variables that only ever hold a plain list, such as the
+    hidden lists of a parallel for loop's pieces; appends to them call
+    list.append directly.
+
+    A parallel for loop, unless streaming is set, calls _parallel with its
+    plan and runs the loop itself only when that gives _MISSING.
+
+    With streaming set, _spl_main(_out, _values, _budget) is a generator.
+    It yields None after every print, and yields the number of AST nodes
+    run so far whenever the count passes _budget. Each loop iteration counts
+    as all the nodes of the loop. This lets its caller pass output on, or
+    hand control back to an event loop, while the program runs.
+    """
+    OPERATORS = ('+', '-', '*', '>', '<', '>=', '<=', '==', '!=')
+
+    def __init__(self, streaming=False, quotas=False, lists=()):
+        self.streaming = streaming
+        self.quotas = quotas
+        self.lists = lists
+        self.lines = []
+        self.depth = 0
+        self.loop_depth = 0
+        self.temp_count = 0
+        # Temporaries of the Invariant nodes owned by each enclosing loop
+        self.invariants = []
+
+    def transpile(self, program):
+        self.lines = []
+        self.names = {}
+        self.sites = []
+        self.depth = 2
+        if self.streaming:
+            self.emit('_n = 0')
+        self.block(program['statements'], '_r')
+        if self.streaming:
+            # Report the nodes run since the last pause, so that programs run
+            # one statement at a time are charged for all of them
+            self.emit('if _n: yield _n')
+            # Also makes _spl_main a generator when the program never prints
+            self.emit('yield')
+        self.emit('return _r')
+        body, self.lines = self.lines, []
+        names = [f'v_{name}' for name in self.names]
+
+        self.depth = 0
+        self.lines.extend(self.sites)
+        self.emit('def _spl_main(_out, _values, _budget):' if self.streaming else 'def _spl_main(_out, _values):')
+        self.depth = 1
+        if names:
+            self.emit(f"{', '.join(names)}, = _values")
+            for name in names:
+                # Variables that aren't defined yet start out unbound
+                self.emit(f'if {name} is _MISSING: del {name}')
+        self.emit('try:')
+        self.lines.extend(body)
+        self.emit('finally:')
+        self.depth = 2
+        self.emit('_locals = locals()')
+        self.emit(f"_values[:] = [{', '.join(f'_locals.get({name!r}, _MISSING)' for name in names)}]")
+        self.depth = 0
+        self.emit(f'_spl_names = {tuple(self.names)!r}')
+        return '\\n'.join(self.lines) + '\\n'
+
+    def local(self, name):
+        self.names[name] = None
+        return f'v_{name}'
+
+    def emit(self, line): self.lines.append('    ' * self.depth + line)
+
+    def temp(self, prefix):
+        self.temp_count += 1
+        return f'_{prefix}{self.temp_count}'
+
+    def block(self, statements, target):
+        if not statements:
+            self.emit(f'{target} = None' if target else 'pass')
+        for i, stmt in enumerate(statements):
+            self.statement(stmt, target if i == len(statements) - 1 else None)
+
+    def statement(self, node, target):
+        kind = node['type']
+        assign_to = f'{target} = ' if target else ''
+        if kind == 'Assign':
+            parts = _spl_append_parts(node)
+            if parts is not None and (len(parts) > 1 or self.quotas):
+                self.append(node['name'], parts, target)
+            else:
+                self.emit(f"{assign_to}{self.local(node['name'])} = {self.expression(node['value'])}")
+        elif kind == 'ExpressionStatement':
+            self.emit(self.expression(node['expression']))
+            if target: self.emit(f'{target} = None')
+        elif kind == 'Print':
+            args = ', '.join(f'str({self.expression(arg)})' for arg in node['args'])
+            self.emit(f"_out.append(' '.join([{args}]))")
+            if self.streaming: self.emit('yield')
+            if target: self.emit(f'{target} = None')
+        elif kind == 'Break':
+            self.emit('break' if self.loop_depth else 'raise _BreakException()')
+        elif kind == 'If':
+            if target: self.emit(f'{target} = None')
+            self.emit(f"if {self.expression(node['condition'])}:")
+            self.indented(node['then_branch'], target)
+            if node['else_branch']:
+                self.emit('else:')
+                self.indented(node['else_branch'], target)
+        elif kind in ('While', 'For'):
+            start = len(self.lines)
+            if kind == 'For':
+                if node['iterable']['type'] == 'Range':
+                    # As in Interpreter._iterate
+                    iterable = f"_range([{self.arguments(node['iterable'])}])"
+                else:
+                    iterable = f"_iterate({self.expression(node['iterable'])})"
+            self.invariants.append([])
+            cost = _spl_node_count(node)
+            plan = _spl_parallel_plan(node) if node.get('parallel') and not self.streaming else None
+            if kind == 'While':
+                self.loop(f"while {self.expression(node['condition'])}:", node['body'], target, cost)
+            elif plan is not None:
+                self.parallel_loop(node, plan, iterable, target, cost)
+            else:
+                self.loop(f"for {self.local(node['var_name'])} in {iterable}:", node['body'], target, cost)
+            # Reset this loop's invariants each time it starts
+            self.lines[start:start] = ['    ' * self.depth + f'{name} = _MISSING' for name in self.invariants.pop()]
+        else:
+            self.emit(self.expression(node))
+            if target: self.emit(f'{target} = None')
+
+    def append(self, name, parts, target):
+        # CPython grows a str in place for v_x = v_x + part when nothing else
+        # refers to it, as in the plain translation of a single part. Chains
+        # of string parts are added up first so that v_x is grown just once,
+        # and with quotas only the new characters are charged.
+        local = self.local(name)
+        temps = []
+        for part in parts:
+            temps.append(self.temp('p'))
+            self.emit(f'{temps[-1]} = {self.expression(part)}')
+        self.emit(f"if {' and '.join(f'type({value}) is str' for value in [local] + temps)}:")
+        added = ' + '.join(temps)
+        self.emit(f'    {local} += _charge({added})' if self.quotas else f'    {local} += {added}')
+        self.emit('else:')
+        value = local
+        for temp in temps:
+            value = f'_charge({value} + {temp})' if self.quotas else f'({value} + {temp})'
+        self.emit(f'    {local} = {value}')
+        if target: self.emit(f'{target} = {local}')
+
+    def indented(self, statements, target):
+        self.depth += 1
+        self.block(statements, target)
+        self.depth -= 1
+
+    def loop(self, header, body, target, cost):
+        # A break mid-iteration must leave the previous iteration's result
+        iteration = self.temp('t') if target else None
+        if target: self.emit(f'{target} = None')
+        self.emit(header)
+        if self.streaming:
+            self.depth += 1
+            self.emit(f'_n += {cost}')
+            self.emit('if _n >= _budget:')
+            self.emit('    yield _n')
+            self.emit('    _n = 0')
+            self.depth -= 1
+        self.loop_depth += 1
+        self.indented(body, iteration)
+        self.loop_depth -= 1
+        if target:
+            self.depth += 1
+            self.emit(f'{target} = {iteration}')
+            self.depth -= 1
+
+    def parallel_loop(self, node, plan, iterable, target, cost):
+        # _parallel gives _MISSING when the loop has to run here after all,
+        # and otherwise the variables it wrote, its value and its error
+        import marshal
+        site = self.site(f'_parallel_plan({marshal.dumps(plan)!r})')
+        items, ran = self.temp('l'), self.temp('f')
+        self.emit(f'{items} = {iterable}')
+        self.emit(f'{ran} = _parallel({site}, {items}, locals())')
+        self.emit(f'if {ran} is _MISSING:')
+        self.depth += 1
+        self.loop(f"for {self.local(node['var_name'])} in {items}:", node['body'], target, cost)
+        self.depth -= 1
+        self.emit('else:')
+        self.depth += 1
+        for name in plan['writes'] + tuple(name for name, _ in plan['sums']):
+            self.emit(f"if {name!r} in {ran}[0]: {self.local(name)} = {ran}[0][{name!r}]")
+        self.emit(f'if {ran}[2] is not None: raise {ran}[2]')
+        if target: self.emit(f'{target} = {ran}[1]')
+        self.depth -= 1
+
+    def expression(self, node):
+        kind = node['type']
+        if kind == 'Number':
+            value = node['value']
+            return repr(value) if math.isfinite(value) else f"float('{value}')"
+        elif kind in ('String', 'Boolean'):
+            return repr(node['value'])
+        elif kind == 'Variable':
+            return self.local(node['name'])
+        elif kind == 'BinOp':
+            left, right, op = self.expression(node['left']), self.expression(node['right']), node['op']
+            if op == '/':
+                return f'_divide({left}, {right})'
+            if op not in self.OPERATORS:
+                raise SPLError(f"Unknown operator: {op}")
+            if self.quotas and op == '*':
+                return f'_multiply({left}, {right})'
+            if self.quotas and op == '+':
+                return f'_charge({left} + {right})'
+            return f'({left} {op} {right})'
+        elif kind == 'UnaryOp':
+            if node['op'] != '-':
+                raise SPLError(f"Unknown unary operator: {node['op']}")
+            return f"(-{self.expression(node['operand'])})"
+        elif kind == 'List':
+            items = '[' + ', '.join(self.expression(e) for e in node['elements']) + ']'
+            return f'_charge({items})' if self.quotas else items
+        elif kind == 'Index':
+            return f"_index({self.expression(node['object'])}, {self.expression(node['index'])})"
+        elif kind == 'Range':
+            return f"_make_range([{self.arguments(node)}])"
+        elif kind == 'MethodCall':
+            target = node['object']
+            if node['method'] == 'append' and target['type'] == 'Variable' and target['name'] in self.lists:
+                local = self.local(target['name'])
+                return f"({local}.append({self.arguments(node)}) or {local})"
+            site = self.site(f"_method_site({node['method']!r})")
+            return f"{site}({self.expression(node['object'])}, [{self.arguments(node)}])"
+        elif kind == 'StaticMethodCall':
+            site = self.site(f"_static_method_site({node['class']!r}, {node['method']!r})")
+            return f"{site}([{self.arguments(node)}])"
+        elif kind == 'Invariant':
+            name = self.temp('i')
+            self.invariants[node['depth']].append(name)
+            return f"({name} if {name} is not _MISSING else ({name} := {self.expression(node['expression'])}))"
+        raise SPLError(f"No visit method for {kind}")
+
+    def arguments(self, node): return ', '.join(self.expression(arg) for arg in node['args'])
+
+    def site(self, make):
+        """A module-level name for the call site that make builds when the module runs"""
+        name = self.temp('m')
+        self.sites.append(f'{name} = {make}')
+        return name
+
+class Optimizer:
+    """Rewrites the dict AST between parsing and execution.
+
+    Level 0 leaves it alone. Level 1 folds constant expressions and drops
+    If/While branches whose condition is a literal. Level 2 also wraps
+    expressions that can't change while a loop runs in an Invariant node,
+    which the engines evaluate once per run of that loop. Constants are
+    folded with the Interpreter itself, and anything that raises (such as a
+    division by zero) is left to fail at run time. Returns new dicts and
+    never modifies the input, which may be shared through ast_cache.
+    """
+    LITERALS = ('Number', 'String', 'Boolean')
+    BLOCKS = ('statements', 'then_branch', 'else_branch', 'body')
+    MAX_FOLDED_STRING = 4096
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def optimize(self, program):
+        if self.level <= 0:
+            return program
+        program = self.visit(program)
+        if self.level >= 2:
+            program = dict(program, statements=[self.hoist(stmt, 0) for stmt in program['statements']])
+        return program
+
+    def visit(self, node):
+        optimized = {}
+        for key, value in node.items():
+            if key in self.BLOCKS and value is not None:
+                value = self.block(value)
+            elif isinstance(value, dict):
+                value = self.visit(value)
+            elif isinstance(value, list):
+                value = [self.visit(item) for item in value]
+            optimized[key] = value
+        if optimized['type'] in ('BinOp', 'UnaryOp'):
+            return self.fold(optimized)
+        return optimized
+
+    def block(self, statements):
+        optimized = []
+        for i, stmt in enumerate(statements):
+            stmt = self.visit(stmt)
+            is_last = i == len(statements) - 1
+            if stmt['type'] == 'If' and stmt['condition']['type'] in self.LITERALS:
+                branch = stmt['then_branch'] if stmt['condition']['value'] else stmt['else_branch']
+                # An If whose branch is empty still gives the block its None result
+                if branch or not is_last:
+                    optimized.extend(branch or [])
+                    continue
+            elif stmt['type'] == 'While' and stmt['condition']['type'] in self.LITERALS:
+                if not stmt['condition']['value'] and not is_last:
+                    continue
+            optimized.append(stmt)
+        return optimized
+
+    def fold(self, node):
+        operands = [node['left'], node['right']] if node['type'] == 'BinOp' else [node['operand']]
+        if any(operand['type'] not in self.LITERALS for operand in operands):
+            return node
+        folder = Interpreter()
+        # The quota stops a repetition like "ab" * 10**9 before it is built
+        folder.quotas = Quotas(max_string_chars=self.MAX_FOLDED_STRING)
+        try:
+            value = folder.interpret(node)
+        except Exception:
+            return node
+        if isinstance(value, bool):
+            kind = 'Boolean'
+        elif isinstance(value, (int, float)):
+            kind = 'Number'
+        elif isinstance(value, str) and len(value) <= self.MAX_FOLDED_STRING:
+            kind = 'String'
+        else:
+            return node
+        return {'type': kind, 'value': value, 'line': node.get('line'), 'col': node.get('col')}
+
+    def hoist(self, node, depth):
+        """Mark loop invariants in every loop inside node"""
+        kind = node['type']
+        if kind == 'If':
+            else_branch = node['else_branch']
+            return dict(node, then_branch=[self.hoist(stmt, depth) for stmt in node['then_branch']],
+                        else_branch=[self.hoist(stmt, depth) for stmt in else_branch] if else_branch else else_branch)
+        if kind not in ('While', 'For'):
+            return node
+        # A method call may change a list in place, so values read through
+        # variables are only known to be fixed in loops without one
+        if not any(child['type'] == 'MethodCall' for child in _walk(node)):
+            assigned = {child.get('name', child.get('var_name')) for child in _walk(node)
+                        if child['type'] in ('Assign', 'For')}
+            mark = lambda child: self.mark(child, assigned, depth)
+            if kind == 'While':
+                node = dict(node, condition=mark(node['condition']))
+            node = dict(node, body=[mark(stmt) for stmt in node['body']])
+        # Loops inside this one get their own invariants, one level deeper
+        return dict(node, body=[self.hoist(stmt, depth + 1) for stmt in node['body']])
+
+    def mark(self, node, assigned, depth):
+        """Wrap the largest expressions in node that don't use a name in assigned"""
+        kind = node['type']
+        if kind == 'Invariant':
+            return node
+        if kind in ('BinOp', 'UnaryOp'):
+            names = self.used_names(node)
+            if names and not names & assigned:
+                return {'type': 'Invariant', 'expression': node, 'depth': depth,
+                        'line': node.get('line'), 'col': node.get('col')}
+        marked = {}
+        for key, value in node.items():
+            if isinstance(value, dict):
+                value = self.mark(value, assigned, depth)
+            elif isinstance(value, list):
+                value = [self.mark(item, assigned, depth) for item in value]
+            marked[key] = value
+        return marked
+
+    def used_names(self, node):
+        """Variables a pure expression reads, or None if it isn't pure"""
+        kind = node['type']
+        if kind == 'Variable':
+            return {node['name']}
+        elif kind in self.LITERALS:
+            return set()
+        elif kind == 'BinOp':
+            left, right = self.used_names(node['left']), self.used_names(node['right'])
+            return None if left is None or right is None else left | right
+        elif kind == 'UnaryOp':
+            return self.used_names(node['operand'])
+        return None
+
+def _walk(node):
+    """Yield node and every dict node below it"""
+    yield node
+    for value in node.values():
+        if isinstance(value, dict):
+            yield from _walk(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    yield from _walk(item)
+
+def _spl_node_count(node):
+    return sum(1 for _ in _walk(node))
+
+def _spl_divide(left, right):
+    # Arrays check their own divisors, element by element
+    if not isinstance(right, SPLArray) and right == 0:
+        raise SPLError("Division by zero")
+    return left / right
+
+def _spl_iterate(value):
+    if isinstance(value, (list, ListView)):
+        return value
+    elif isinstance(value, SPLArray):
+        return value.tolist()
+    raise SPLError(f"Object is not iterable: {type(value)}")
+
+# Bump when the grammar or the AST dicts change so cached programs are invalidated
+GRAMMAR_VERSION = 2
+AST_VERSION = 4
+
+class ProgramCache:
+    """LRU cache of parsed or compiled programs, keyed by a hash of the SPL
+    source, the grammar/AST versions and the Python version.
+
+    build(code) produces the value on a miss; tag keeps caches that store
+    different kinds of value apart when they share a cache_dir. Entries are weighed by the length of their source and the least recently
+    used ones are evicted once the total goes over max_bytes. With cache_dir
+    set, each value is also written there as a .splc file (a header plus the
+    marshalled value, like a .pyc) so a reload can skip lexing, parsing and
+    compiling.
+    """
+    MAGIC = b'SPLC'
+
+    def __init__(self, tag, max_bytes=8 * 1024 * 1024, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.tag = tag
+        # Made by the first key(), so that loading the interpreter doesn't import importlib.util
+        self.header = None
+
+    def key(self, code, variant=b''):
+        import hashlib
+        if self.header is None:
+            import importlib.util
+            self.header = (self.MAGIC + self.tag + bytes([GRAMMAR_VERSION, AST_VERSION]) +
+                           importlib.util.MAGIC_NUMBER)
+        digest = hashlib.sha256(self.header + variant + b'\\0')
+        digest.update(code.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def get(self, code, build, variant=b''):
+        """Cached value for code, calling build(code) on a miss; variant
+        separates values built differently from the same source"""
+        key = self.key(code, variant)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = self.load(key)
+        if value is None:
+            value = build(code)
+            self.store(key, value)
+        if len(code) <= self.max_bytes:
+            self.entries[key] = (value, len(code))
+            self.size += len(code)
+            while self.size > self.max_bytes:
+                _, (_, size) = self.entries.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+        return value
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.splc')
+
+    def load(self, key):
+        if self.cache_dir is None:
+            return None
+        import marshal
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+            if not data.startswith(self.header):
+                return None
+            value = marshal.loads(data[len(self.header):])
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        self.disk_hits += 1
+        return value
+
+    def store(self, key, value):
+        if self.cache_dir is None:
+            return
+        import marshal
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self.path(key) + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(self.header + marshal.dumps(value))
+            os.replace(temp_path, self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits,
+                'evictions': self.evictions, 'entries': len(self.entries), 'size': self.size}
+
+# Parsed ASTs for the closure and tree engines, code objects for the python engine
+ast_cache = ProgramCache(b'A')
+program_cache = ProgramCache(b'P')
+
+def transpile_spl_code(code, optimize=1, streaming=False, quotas=False):
+    def transpile(code):
+        ast = Optimizer(optimize).optimize(global_parser.reparse(code))
+        return compile(Transpiler(streaming, quotas).transpile(ast), '<spl>', 'exec')
+    return program_cache.get(code, transpile, bytes([optimize, streaming, quotas]))
+
+def _spl_load_transpiled(code_obj, interpreter):
+    """Exec code_obj; returns its _spl_main, the slots of its variables and their values"""
+    import marshal
+    namespace = {
+        '_divide': _spl_divide, '_iterate': _spl_iterate, '_range': _spl_python_range,
+        '_index': interpreter._index, '_make_range': interpreter._make_range,
+        '_method_site': lambda method_name: _spl_method_site(interpreter, method_name),
+        '_static_method_site': lambda class_name, method_name: _spl_static_method_site(
+            interpreter, class_name, method_name),
+        '_BreakException': BreakException, '_MISSING': _spl_missing,
+        '_parallel_plan': marshal.loads,
+        '_parallel': lambda plan, items, scope: _spl_parallel_for(
+            interpreter, plan, items, {name[2:]: value for name, value in scope.items() if name[:2] == 'v_'})
+    }
+    if interpreter.quotas is not None:
+        namespace.update(_charge=interpreter.quotas.charge_value, _multiply=interpreter.quotas.multiply)
+    exec(code_obj, namespace)
+    variables = interpreter.variables
+    slots = [variables.slot(name) for name in namespace['_spl_names']]
+    return namespace['_spl_main'], slots, [_spl_flatten(variables.slots[slot]) for slot in slots]
+
+def _spl_raise_transpiled(error):
+    """Re-raise an exception from transpiled code as the SPLError the other engines give"""
+    if isinstance(error, (SPLError, BreakException)):
+        raise error
+    if isinstance(error, UnboundLocalError):
+        # The message quotes the local, as in "local variable 'v_x' ..."
+        name = str(error).split("'")[1][2:]
+        raise SPLError(f"Variable '{name}' is not defined") from None
+    raise SPLError(str(error)) from error
+
+def run_transpiled(code_obj, interpreter):
+    main, slots, values = _spl_load_transpiled(code_obj, interpreter)
+    try:
+        return main(interpreter.output, values)
+    except Exception as e:
+        _spl_raise_transpiled(e)
+    finally:
+        for slot, value in zip(slots, values):
+            interpreter.slots[slot] = value
+
+def stream_transpiled(code_obj, interpreter, budget=None):
+    """Generator version of run_transpiled for code transpiled with
+    streaming=True. It yields what _spl_main yields, pausing at every print
+    and after about every budget AST nodes, and returns the result."""
+    main, slots, values = _spl_load_transpiled(code_obj, interpreter)
+    try:
+        return (yield from main(interpreter.output, values, budget or NODES_PER_PAUSE))
+    except Exception as e:
+        _spl_raise_transpiled(e)
+    finally:
+        for slot, value in zip(slots, values):
+            interpreter.slots[slot] = value
+
 # Global interpreter instance
 global_interpreter = Interpreter()
+# Keeps the last parse so the next run only re-parses what was edited
+global_parser = IncrementalParser()
+
+# Printed lines kept for the result of a run; earlier ones are only counted
+MAX_OUTPUT_LINES = 10000
+# AST nodes a streamed or async run evaluates between pauses
+NODES_PER_PAUSE = 100000
+
+def _spl_run_with_quotas(steps, quotas):
+    """Run a stream_transpiled generator to its end, charging the nodes it reports to quotas"""
+    try:
+        while True:
+            try:
+                count = next(steps)
+            except StopIteration as stop:
+                return stop.value
+            if count is not None:
+                quotas.charge_nodes(count)
+    finally:
+        steps.close()
+
+class ListSnapshot:
+    """A snapshot of a list holding lists: a copy-on-write view of it, and
+    (index, snapshot) for each list inside it."""
+    __slots__ = ('view', 'inner')
+
+    def __init__(self, view):
+        self.view = view
+        self.inner = []
+
+def _spl_storage(value):
+    """The Python list or LazyItems that the list or view value reads its items from"""
+    return value if type(value) is list else value.shared.items
+
+def _spl_lists_in(view):
+    """(index, item) for the items of view that are lists"""
+    items = view.shared.items
+    if isinstance(items, LazyItems):
+        if not isinstance(items, FillItems) or not isinstance(items.value, (list, ListView)):
+            return []
+        return list(enumerate(view))
+    start = view.start - view.shared.offset
+    items = itertools.islice(items, start, start + len(view))
+    if not {list, ListView} & set(map(type, items)):
+        return []
+    return [(i, item) for i, item in enumerate(view) if isinstance(item, (list, ListView))]
+
+def _spl_freeze(value, memo):
+    """value as it is now, unchanged by what a program does to it later.
+
+    A list becomes a copy-on-write view of its items, which are only copied
+    if the list changes later, and a list holding lists becomes a
+    ListSnapshot. memo maps the ids of the lists already frozen to their
+    snapshots, so lists two variables share stay shared."""
+    if type(value) is StringBuilder:
+        return value.build()
+    if not isinstance(value, (list, ListView)):
+        return value
+    snapshot = memo.get(id(value))
+    if snapshot is None:
+        view = _spl_slice(value, 0)
+        lists = _spl_lists_in(view)
+        snapshot = memo[id(value)] = ListSnapshot(view) if lists else view
+        for i, item in lists:
+            snapshot.inner.append((i, _spl_freeze(item, memo)))
+    return snapshot
+
+def _spl_thaw(snapshot, memo):
+    """A value holding what snapshot holds, which a program can change
+    without changing snapshot"""
+    copy = memo.get(id(snapshot))
+    if copy is not None:
+        return copy
+    if type(snapshot) is ListView:
+        copy = memo[id(snapshot)] = _spl_slice(snapshot, 0)
+    elif type(snapshot) is ListSnapshot:
+        copy = memo[id(snapshot)] = snapshot.view.tolist()
+        for i, inner in snapshot.inner:
+            copy[i] = _spl_thaw(inner, memo)
+    else:
+        copy = snapshot
+    return copy
+
+def _spl_unchanged(value, snapshot, seen=None):
+    """Whether the list or view value still holds what snapshot, frozen from it, holds"""
+    if type(snapshot) is ListView:
+        return snapshot.shared.items is _spl_storage(value)
+    if type(snapshot) is not ListSnapshot or snapshot.view.shared.items is not _spl_storage(value):
+        return False
+    seen = set() if seen is None else seen
+    if id(snapshot) in seen:
+        return True
+    seen.add(id(snapshot))
+    view = snapshot.view
+    return all(_spl_unchanged(view.item(i), inner, seen) for i, inner in snapshot.inner)
+
+def _spl_remember(value, snapshot, memo):
+    """Record in memo that the unchanged list value, and the lists inside
+    it, are frozen as snapshot"""
+    memo[id(value)] = snapshot
+    if type(snapshot) is ListSnapshot:
+        for i, inner in snapshot.inner:
+            item = snapshot.view.item(i)
+            if id(item) not in memo:
+                _spl_remember(item, inner, memo)
+
+# Static methods whose result differs from run to run, so a statement calling one is never replayed
+_SPL_IMPURE = {('Math', 'random')}
+
+def _spl_replayable(statement):
+    """Whether running statement does no more than assign variables, change their lists and print"""
+    return not any(node['type'] == 'StaticMethodCall' and (node['class'], node['method']) in _SPL_IMPURE
+                   for node in _walk(statement))
+
+class Checkpoints:
+    """The variables and printed lines after each top-level statement of
+    the last incremental run on an interpreter.
+
+    run() re-runs a program from its first statement that changed. The
+    statements before it are skipped: their printed lines are replayed from
+    here, and the variables are put back as they were after the last of
+    them. That holds only for statements that do nothing but assign
+    variables, change lists in them and print, and only while the variables
+    are as the last run left them; anything else re-runs the program from
+    the start. Variables are frozen with _spl_freeze(), and a list that
+    hasn't changed since the last checkpoint keeps its snapshot, so a
+    checkpoint only takes time for the lists that changed. Each statement is
+    transpiled on its own, cached in program_cache by its source text.
+    """
+    # Printed lines kept for replay, over all the statements of a run; a
+    # statement printing past this is re-run instead
+    MAX_REPLAYED_LINES = 10000
+
+    def __init__(self):
+        self.parser = IncrementalParser()
+        self.optimize = None
+        # The statements the last run finished, with the lines each printed,
+        # its value and whether it can be replayed
+        self.statements = []
+        self.outputs = []
+        self.results = []
+        self.replayable = []
+        # states[i] holds the frozen variables before statements[i], and
+        # states[-1] those after the last one
+        self.states = []
+        # Frozen variables when the last run ended, and the values they were frozen from
+        self.end = []
+        self.live = []
+        # Statements replayed by the last run
+        self.replayed = 0
+        self.stats = {'replayed': 0, 'run': 0}
+
+    def run(self, interpreter, code, optimize=1, budget=None, quotas=False):
+        """Generator like stream_transpiled() that runs code on interpreter
+        from its first statement that changed since the last run"""
+        self.replayed = 0
+        program = self.parser.reparse(code)
+        statements, starts, text = program['statements'], self.parser.starts, self.parser.text
+        keep = self._unchanged(interpreter, statements, optimize)
+        self.optimize = optimize
+        del self.statements[keep:], self.outputs[keep:], self.results[keep:], self.replayable[keep:]
+        if keep:
+            del self.states[keep + 1:]
+            # The variables are already as the last statement kept left them
+            # when the last run ended after it
+            if self.states[keep] is not self.end:
+                self._restore(interpreter, self.states[keep])
+        else:
+            self.states = [self._capture(interpreter, self.end)]
+        self.replayed = keep
+        self.stats['replayed'] += keep
+        output = interpreter.output
+        for lines in self.outputs:
+            for line in lines:
+                output.append(line)
+        result = _spl_thaw(self.results[-1], {}) if keep else None
+        finished = False
+        try:
+            for i in range(keep, len(statements)):
+                statement = statements[i]
+                source = text[starts[i]:starts[i + 1] if i + 1 < len(starts) else len(text)]
+                code_obj = program_cache.get(source, lambda _: compile(
+                    Transpiler(True, quotas).transpile(
+                        Optimizer(optimize).optimize({'type': 'Program', 'statements': [statement]})),
+                    '<spl>', 'exec'), bytes([optimize, True, quotas]) + b'S')
+                before = output.dropped + len(output.lines)
+                result = yield from stream_transpiled(code_obj, interpreter, budget)
+                self.stats['run'] += 1
+                self._finish(statement, result, output, output.dropped + len(output.lines) - before)
+                self.states.append(self._capture(interpreter, self.states[-1]))
+            finished = True
+        finally:
+            self.end = self.states[-1] if finished else self._capture(interpreter, self.states[-1])
+        return result
+
+    def _unchanged(self, interpreter, statements, optimize):
+        """The number of statements at the start of statements that can be replayed"""
+        if optimize != self.optimize or not self._current(interpreter):
+            return 0
+        keep = 0
+        for old, new, replayable in zip(self.statements, statements, self.replayable):
+            if not replayable or (old is not new and old != new):
+                break
+            keep += 1
+        return keep
+
+    def _current(self, interpreter):
+        """Whether the interpreter's variables are as the last run left them"""
+        slots, live, end = interpreter.slots, self.live, self.end
+        if not end:
+            return False
+        for i, value in enumerate(slots):
+            if i >= len(live):
+                if value is not _spl_missing:
+                    return False
+            elif value is not live[i]:
+                return False
+            elif isinstance(value, (list, ListView)) and not _spl_unchanged(value, end[i]):
+                return False
+            elif type(value) is StringBuilder and value.build() != end[i]:
+                return False
+        return True
+
+    def _finish(self, statement, result, output, printed):
+        """Record a statement that ran, and the printed lines it left at the end of output"""
+        lines = output.lines
+        kept = sum(map(len, self.outputs)) + printed <= self.MAX_REPLAYED_LINES and printed <= len(lines)
+        self.statements.append(statement)
+        self.outputs.append(list(itertools.islice(lines, len(lines) - printed, None)) if kept and printed else [])
+        self.results.append(_spl_freeze(result, {}))
+        self.replayable.append(kept and _spl_replayable(statement))
+
+    def _capture(self, interpreter, last):
+        """The frozen variables of interpreter, reusing the snapshots in
+        last of lists that haven't changed since it was captured"""
+        memo = {}
+        live, previous = list(interpreter.slots), self.live
+        snapshots = []
+        for i, value in enumerate(live):
+            if isinstance(value, (list, ListView)) and id(value) not in memo and i < len(previous) \\
+                    and previous[i] is value and _spl_unchanged(value, last[i]):
+                _spl_remember(value, last[i], memo)
+            snapshots.append(_spl_freeze(value, memo))
+        self.live = live
+        return snapshots
+
+    def _restore(self, interpreter, snapshots):
+        """Put the interpreter's variables back as they were when snapshots was captured"""
+        memo = {}
+        slots = interpreter.slots
+        for i in range(len(slots)):
+            slots[i] = _spl_thaw(snapshots[i], memo) if i < len(snapshots) else _spl_missing
+        self.live = list(slots)
+
+# Processes that parallel for loops may spread their iterations over
+PARALLEL_WORKERS = os.cpu_count() or 1
+# Seconds of a parallel for loop's work that are timed in this process
+# before it decides whether the rest is worth sending to processes
+PARALLEL_PROBE_SECONDS = 0.01
+# Estimated seconds of remaining work that make a parallel for loop use processes
+PARALLEL_MIN_SECONDS = 0.05
+# Seconds an iteration must take on average to be worth sending to a
+# process; cheaper ones cost more to send and merge than they save
+PARALLEL_MIN_ITEM_SECONDS = 0.00002
+# Pieces of the rest of a loop sent to each process, so that uneven
+# iterations even out
+PARALLEL_PIECES_PER_WORKER = 4
+
+def _spl_strip_invariants(node):
+    """A copy of node without its Invariant nodes, to run it outside the loops they belong to"""
+    if node['type'] == 'Invariant':
+        return _spl_strip_invariants(node['expression'])
+    copy = {}
+    for key, value in node.items():
+        if isinstance(value, dict):
+            value = _spl_strip_invariants(value)
+        elif isinstance(value, list):
+            value = [_spl_strip_invariants(item) if isinstance(item, dict) else item for item in value]
+        copy[key] = value
+    return copy
+
+class ParallelPlanner:
+    """Works out whether the iterations of a parallel for loop are
+    independent, so that they can run apart, and if so how.
+
+    An iteration may read the variables the loop doesn't assign, and
+    assign variables of its own if it assigns each one before reading it.
+    The only lists it may change are ones it made itself. Results build up
+    across iterations in two ways: list.append(item) on a list the loop
+    uses nowhere else, and name = name + part with name read nowhere else.
+    Those statements are rewritten to put the items and parts in hidden
+    lists, which the loop adds to the real ones in iteration order. A break
+    out of the loop itself or a call to Math.random() keeps it serial.
+
+    plan(node) returns None for such a loop, and otherwise a dict of
+    marshallable values: the worker code for a piece of the loop, the
+    loop's own code to re-run a piece with, and the names it reads, writes,
+    appends to and adds up.
+    """
+    # Methods that make a new list out of the one they are called on
+    FRESH_METHODS = ('copy', 'slice')
+
+    def plan(self, node):
+        var, body = node['var_name'], [_spl_strip_invariants(stmt) for stmt in node['body']]
+        nodes = [child for stmt in body for child in _walk(stmt)]
+        names = [var] + [child.get('name', child.get('var_name')) for child in nodes
+                         if child['type'] in ('Variable', 'Assign', 'For')]
+        if any(name.startswith('_spl_') for name in names):
+            return None
+        reads = collections.Counter(child['name'] for child in nodes if child['type'] == 'Variable')
+        assigns = collections.defaultdict(list)
+        for child in nodes:
+            if child['type'] == 'Assign':
+                assigns[child['name']].append(child)
+        loop_vars = {var} | {child['var_name'] for child in nodes if child['type'] == 'For'}
+        appends = collections.Counter(child['expression']['object']['name'] for child in nodes if self.is_append(child))
+        self.appends = {name: f'_spl_a{i}' for i, name in enumerate(sorted(
+            name for name, count in appends.items()
+            if count == reads[name] and name not in assigns and name not in loop_vars))}
+        self.sums = {name: f'_spl_s{i}' for i, name in enumerate(sorted(
+            name for name, nodes in assigns.items()
+            if name not in loop_vars and len(nodes) == reads[name]
+            and all(_spl_append_parts(assign) is not None for assign in nodes)))}
+        self.locals = (loop_vars | set(assigns)) - set(self.sums)
+        # Locals only ever holding lists made in the iteration, found by
+        # dropping those assigned anything else until none are left to drop
+        self.fresh = self.locals - loop_vars
+        while True:
+            fresh = {name for name in self.fresh if all(self.is_fresh(assign['value']) for assign in assigns[name])}
+            if fresh == self.fresh:
+                break
+            self.fresh = fresh
+        rewritten = self.rewrite(body)
+        if self.block(rewritten, {var}, 0) is None:
+            return None
+        reads = {child['name'] for stmt in rewritten for child in _walk(stmt) if child['type'] == 'Variable'}
+        return {'reads': tuple(sorted(name for name in reads - self.locals if not name.startswith('_spl_'))),
+                'writes': tuple(sorted(self.locals)),
+                'appends': tuple(self.appends.items()), 'sums': tuple(self.sums.items()),
+                'code': self.transpile(var, rewritten), 'serial': self.transpile(var, body)}
+
+    def is_append(self, node):
+        """Whether node is a statement name.append(item)"""
+        if node['type'] != 'ExpressionStatement':
+            return False
+        call = node['expression']
+        return (call['type'] == 'MethodCall' and call['method'] == 'append' and len(call['args']) == 1
+                and call['object']['type'] == 'Variable')
+
+    def is_fresh(self, node):
+        """Whether the value of node is a list made where it is evaluated"""
+        kind = node['type']
+        if kind == 'Variable':
+            return node['name'] in self.fresh or node['name'].startswith('_spl_')
+        return (kind in ('List', 'Range') or (kind == 'StaticMethodCall' and node['class'] == 'List')
+                or (kind == 'MethodCall' and node['method'] in self.FRESH_METHODS))
+
+    def rewrite(self, statements):
+        return [self.rewrite_statement(stmt) for stmt in statements]
+
+    def rewrite_statement(self, node):
+        kind = node['type']
+        if self.is_append(node) and node['expression']['object']['name'] in self.appends:
+            hidden = {'type': 'Variable', 'name': self.appends[node['expression']['object']['name']]}
+            return dict(node, expression=dict(node['expression'], object=hidden))
+        if kind == 'Assign' and node['name'] in self.sums:
+            # hidden = hidden.append([part, ...]), whose value is the hidden
+            # list; the loop gives the sum in its place
+            name = self.sums[node['name']]
+            parts = {'type': 'List', 'elements': _spl_append_parts(node)}
+            value = {'type': 'MethodCall', 'object': {'type': 'Variable', 'name': name}, 'method': 'append',
+                     'args': [parts]}
+            return {'type': 'Assign', 'name': name, 'value': value, 'line': node.get('line'), 'col': node.get('col')}
+        if kind == 'If':
+            else_branch = node['else_branch']
+            return dict(node, then_branch=self.rewrite(node['then_branch']),
+                        else_branch=self.rewrite(else_branch) if else_branch else else_branch)
+        if kind in ('While', 'For'):
+            return dict(node, body=self.rewrite(node['body']))
+        return node
+
+    def block(self, statements, definite, depth):
+        """The locals surely assigned after statements run, given those in
+        definite before them, or None if an iteration running them isn't
+        independent. depth counts the loops inside the parallel one."""
+        for node in statements:
+            definite = self.statement(node, definite, depth)
+            if definite is None:
+                return None
+        return definite
+
+    def statement(self, node, definite, depth):
+        kind = node['type']
+        if kind == 'Assign':
+            return definite | {node['name']} if self.expression(node['value'], definite) else None
+        if kind == 'ExpressionStatement':
+            return definite if self.expression(node['expression'], definite) else None
+        if kind == 'Print':
+            return definite if all(self.expression(arg, definite) for arg in node['args']) else None
+        if kind == 'If':
+            if not self.expression(node['condition'], definite):
+                return None
+            then_branch = self.block(node['then_branch'], definite, depth)
+            else_branch = self.block(node['else_branch'] or [], definite, depth)
+            return None if then_branch is None or else_branch is None else then_branch & else_branch
+        # A loop's body may not run, so what it assigns isn't surely assigned after it
+        if kind == 'While':
+            independent = (self.expression(node['condition'], definite)
+                           and self.block(node['body'], definite, depth + 1) is not None)
+            return definite if independent else None
+        if kind == 'For':
+            independent = (self.expression(node['iterable'], definite)
+                           and self.block(node['body'], definite | {node['var_name']}, depth + 1) is not None)
+            return definite if independent else None
+        if kind == 'Break':
+            return definite if depth else None
+        return None
+
+    def expression(self, node, definite):
+        """Whether node reads only the locals in definite, changes only
+        lists the iteration made, and gives the same value every run"""
+        for child in _walk(node):
+            kind = child['type']
+            if kind == 'Variable' and child['name'] in self.locals and child['name'] not in definite:
+                return False
+            if kind == 'StaticMethodCall' and (child['class'], child['method']) in _SPL_IMPURE:
+                return False
+            if kind == 'MethodCall' and child['method'] in _SPL_LIST_WRITES and not self.is_fresh(child['object']):
+                return False
+        return True
+
+    def transpile(self, var, body):
+        """Marshalled code for for var in _spl_items { body }"""
+        import marshal
+        loop = {'type': 'For', 'var_name': var, 'iterable': {'type': 'Variable', 'name': '_spl_items'}, 'body': body}
+        transpiler = Transpiler(lists=set(self.appends.values()) | set(self.sums.values()))
+        return marshal.dumps(compile(transpiler.transpile({'type': 'Program', 'statements': [loop]}), '<spl>', 'exec'))
+
+# Marshalled For node -> its ParallelPlanner plan
+_spl_parallel_plans = {}
+
+def _spl_parallel_plan(node):
+    """The plan of the parallel for loop node, or None if it runs serially"""
+    import marshal
+    key = marshal.dumps(node)
+    if key not in _spl_parallel_plans:
+        if len(_spl_parallel_plans) >= 256:
+            _spl_parallel_plans.clear()
+        _spl_parallel_plans[key] = ParallelPlanner().plan(node)
+    return _spl_parallel_plans[key]
+
+# Marshalled code in plans -> the code object
+_spl_parallel_codes = {}
+
+def _spl_parallel_code(data):
+    code = _spl_parallel_codes.get(data)
+    if code is None:
+        import marshal
+        if len(_spl_parallel_codes) >= 256:
+            _spl_parallel_codes.clear()
+        code = _spl_parallel_codes[data] = marshal.loads(data)
+    return code
+
+# Types of the values whose identity a worker's results keep
+_SPL_CONTAINERS = {list, ListView, SharedList, FillItems}
+
+def _spl_containers(values):
+    """The lists, views and view storage reachable from values, in the
+    order a walk finds them; a copy of values gives its copies in the same order"""
+    found, seen = [], set()
+    stack = list(values)[::-1]
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind is FillItems:
+            stack.append(value.value)
+            continue
+        if kind not in _SPL_CONTAINERS or id(value) in seen:
+            continue
+        seen.add(id(value))
+        found.append(value)
+        children = value if kind is list else (value.shared,) if kind is ListView else (value.items,)
+        stack.extend([child for child in reversed(children) if type(child) in _SPL_CONTAINERS])
+    return found
+
+def _spl_chunkable(items):
+    """What a for loop walks, as a list or range to cut into pieces"""
+    if isinstance(items, ListView):
+        storage, offset = items.shared.items, items.shared.offset
+        if isinstance(storage, RangeItems):
+            return storage.range[items.start - offset:items.stop - offset]
+        return items.tolist()
+    return items
+
+def _spl_add_up(value, groups):
+    """value + part for each part in each of groups, in order"""
+    parts = list(itertools.chain.from_iterable(groups))
+    if type(value) is str and all(type(part) is str for part in parts):
+        return value + ''.join(parts)
+    for part in parts:
+        value = value + part
+    return value
+
+def _spl_extend(target, items):
+    """target.append(item) for each of items"""
+    if not items:
+        return
+    if type(target) is list:
+        _spl_unshare(target).extend(items)
+    else:
+        storage = target.writable()
+        storage.extend(items)
+        target.stop = len(storage)
+
+def _spl_run_chunk(plan, env, items, max_lines=None):
+    """Run a plan's worker code over items with the variables env.
+
+    Returns the lines printed (only the last max_lines, if set), how many
+    were dropped, the values of the variables the loop wrote, the hidden
+    lists by name, the loop's value and whether it stopped with an error.
+    """
+    worker = Interpreter()
+    worker.output = OutputSink(max_lines=max_lines)
+    variables = worker.variables
+    for name, value in env.items():
+        variables[name] = value
+    variables['_spl_items'] = list(items) if isinstance(items, range) else items
+    hidden = {}
+    for _, name in plan['appends'] + plan['sums']:
+        hidden[name] = variables[name] = []
+    try:
+        result, failed = run_transpiled(_spl_parallel_code(plan['code']), worker), False
+    except SPLError:
+        result, failed = None, True
+    written = {name: variables[name] for name in plan['writes'] if name in variables}
+    return list(worker.output.lines), worker.output.dropped, written, hidden, result, failed
+
+def _spl_parallel_task(plan, env_data, items_data, max_lines):
+    """_spl_run_chunk in a worker process, taking and returning pickles.
+
+    Lists the result shares with env or items are pickled as their place
+    among _spl_containers() of those, so the parent gets its own lists back
+    rather than copies, and the views made on them go on sharing them.
+    """
+    import io, pickle
+    env, items = pickle.loads(env_data), pickle.loads(items_data)
+    places = {id(value): place for place, value in
+              enumerate(_spl_containers(env.values()) + _spl_containers([items]))}
+    outcome = _spl_run_chunk(plan, env, items, max_lines)
+
+    def persistent_id(value):
+        kind = type(value)
+        if kind is not list and kind is not ListView and kind is not SharedList:
+            return None
+        place = places.get(id(value))
+        if place is None and kind is SharedList and type(value.items) is list:
+            # Storage of views made here on one of the lists sent
+            place = places.get(id(value.items))
+            return None if place is None else (place, value.low, value.high)
+        return place
+
+    data = io.BytesIO()
+    pickler = pickle.Pickler(data, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(outcome)
+    return data.getvalue()
+
+def _spl_parallel_load(data, objects):
+    """The outcome _spl_parallel_task pickled, with the lists it refers to from objects"""
+    import io, pickle
+
+    def persistent_load(place):
+        if type(place) is int:
+            return objects[place]
+        place, low, high = place
+        return _spl_slice(objects[place], low, high).shared
+
+    unpickler = pickle.Unpickler(io.BytesIO(data))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+def _spl_parallel_worker_init():
+    # Parallel loops inside a worker's piece run in the worker
+    global _spl_pool
+    _spl_pool = False
+
+# The process pool parallel for loops share, False once it couldn't start
+_spl_pool = None
+
+def _spl_parallel_pool():
+    """The process pool, started on first use, or None when processes can't be used"""
+    global _spl_pool
+    if PARALLEL_WORKERS < 2 or _spl_pool is False:
+        return None
+    # Workers find _spl_parallel_task and the classes it returns by module
+    # name, in the sys.modules they inherit when forked
+    module = sys.modules.get(__name__)
+    if getattr(module, '_spl_parallel_task', None) is not _spl_parallel_task:
+        if __name__ == '__main__':
+            return None
+        module = sys.modules[__name__] = types.ModuleType(__name__)
+        module.__dict__.update(globals())
+    if _spl_pool is None:
+        try:
+            import concurrent.futures, multiprocessing
+            context = multiprocessing.get_context('fork' if sys.platform == 'linux' else None)
+            _spl_pool = concurrent.futures.ProcessPoolExecutor(
+                PARALLEL_WORKERS, mp_context=context, initializer=_spl_parallel_worker_init)
+        except (ImportError, OSError, ValueError, NotImplementedError):
+            # As under Pyodide, which has no processes
+            _spl_pool = False
+            return None
+    return _spl_pool
+
+class ParallelLoop:
+    """One run of a parallel for loop by its plan.
+
+    The first iterations run here, in pieces that double in size, until
+    they have taken PARALLEL_PROBE_SECONDS. If iterations take at least
+    PARALLEL_MIN_ITEM_SECONDS and the rest would take PARALLEL_MIN_SECONDS
+    at that rate, it is cut into pieces for the process pool, and otherwise
+    it runs here as well. Each piece's output,
+    appended items and added parts are merged in iteration order, and the
+    variables the loop writes end up as the last iteration to write them
+    left them, so the loop does what it would serially. A piece that
+    stopped with an error, or whose parts can't be added, is run again here
+    with the loop's own code, which stops at the same place serially.
+    """
+
+    def __init__(self, interpreter, plan, env, targets, sums):
+        self.interpreter = interpreter
+        self.plan = plan
+        self.env = env
+        self.targets = targets
+        self.sums = sums
+        output = interpreter.output
+        # With no sink to pass every line to, a piece only needs the lines that are kept
+        self.max_lines = output.lines.maxlen if output.deliver is None else None
+        self.written = {}
+        self.result = None
+        self.error = None
+
+    def run(self, items):
+        done, size, spent = 0, 1, 0.0
+        while done < len(items) and (not done or spent < PARALLEL_PROBE_SECONDS):
+            piece = items[done:done + size]
+            start = time.perf_counter()
+            outcome = _spl_run_chunk(self.plan, self.env, piece, self.max_lines)
+            spent += time.perf_counter() - start
+            if not self.merge(piece, outcome):
+                return
+            done += len(piece)
+            size *= 2
+        rest = len(items) - done
+        if not rest:
+            return
+        each = spent / done
+        worth = each >= PARALLEL_MIN_ITEM_SECONDS and each * rest >= PARALLEL_MIN_SECONDS
+        pool = _spl_parallel_pool() if worth else None
+        if pool is None:
+            piece = items[done:]
+            self.merge(piece, _spl_run_chunk(self.plan, self.env, piece, self.max_lines))
+            return
+        self.run_in(pool, [items[done + rest * i // count:done + rest * (i + 1) // count]
+                           for count in [min(rest, PARALLEL_WORKERS * PARALLEL_PIECES_PER_WORKER)]
+                           for i in range(count)])
+
+    def run_in(self, pool, pieces):
+        import pickle
+        global _spl_pool
+        env_data = pickle.dumps(self.env, pickle.HIGHEST_PROTOCOL)
+        env_objects = _spl_containers(self.env.values())
+        futures = []
+        try:
+            for piece in pieces:
+                try:
+                    futures.append(pool.submit(_spl_parallel_task, self.plan, env_data,
+                                               pickle.dumps(piece, pickle.HIGHEST_PROTOCOL), self.max_lines))
+                except Exception:
+                    # The rest run here
+                    break
+            for i, piece in enumerate(pieces):
+                outcome = None
+                if i < len(futures):
+                    try:
+                        outcome = _spl_parallel_load(futures[i].result(),
+                                                     env_objects + _spl_containers([piece]))
+                    except Exception as e:
+                        if type(e).__name__ == 'BrokenProcessPool':
+                            _spl_pool = None
+                if outcome is None:
+                    outcome = _spl_run_chunk(self.plan, self.env, piece, self.max_lines)
+                if not self.merge(piece, outcome):
+                    return
+        finally:
+            for future in futures:
+                future.cancel()
 
-def execute_spl_code(code):
+    def merge(self, piece, outcome):
+        """Apply what running piece did; False once the loop stopped with an error"""
+        lines, dropped, written, hidden, result, failed = outcome
+        sums = {}
+        if not failed:
+            try:
+                for name, place in self.plan['sums']:
+                    sums[name] = _spl_add_up(self.sums[name], hidden[place])
+            except Exception:
+                failed = True
+        if failed:
+            return self.rerun(piece)
+        output = self.interpreter.output
+        output.dropped += dropped
+        for line in lines:
+            output.append(line)
+        for name, place in self.plan['appends']:
+            _spl_extend(self.targets[name], hidden[place])
+        self.sums.update(sums)
+        self.written.update(written)
+        self.result = result
+        for name, place in self.plan['sums']:
+            if result is hidden[place]:
+                self.result = sums[name]
+        return True
+
+    def rerun(self, piece):
+        """Run piece here with the loop's own code, printing straight to the
+        interpreter's output and changing the real lists"""
+        worker = Interpreter()
+        worker.output = self.interpreter.output
+        variables = worker.variables
+        for name, value in itertools.chain(self.env.items(), self.targets.items(), self.sums.items()):
+            variables[name] = value
+        variables['_spl_items'] = list(piece) if isinstance(piece, range) else piece
+        try:
+            self.result = run_transpiled(_spl_parallel_code(self.plan['serial']), worker)
+        except SPLError as e:
+            self.error = e
+        finally:
+            self.written.update((name, variables[name]) for name in self.plan['writes'] if name in variables)
+            self.sums.update((name, variables[name]) for name in self.sums)
+        return self.error is None
+
+def _spl_parallel_for(interpreter, plan, items, values):
+    """Run the parallel for loop with plan over items, which the engine
+    walks, reading variables from the mapping values.
+
+    Returns _spl_missing when the loop must run serially after all, as it
+    does with quotas, while profiling, when plan is None or when a list it
+    appends to can also be reached through what it reads. Otherwise
+    returns the variables the loop wrote, its value and the error it
+    stopped with, or None.
+    """
+    if plan is None or interpreter.quotas is not None or interpreter.profiler is not None:
+        return _spl_missing
+    env = {}
+    for name in plan['reads']:
+        value = values.get(name, _spl_missing)
+        if value is not _spl_missing:
+            env[name] = _spl_flatten(value)
+    targets = {}
+    for name, _ in plan['appends']:
+        target = values.get(name, _spl_missing)
+        if type(target) is not list and type(target) is not ListView:
+            return _spl_missing
+        targets[name] = target
+    sums = {}
+    for name, _ in plan['sums']:
+        value = values.get(name, _spl_missing)
+        if value is _spl_missing:
+            return _spl_missing
+        sums[name] = _spl_flatten(value)
+    if targets:
+        reachable = {id(value) for value in _spl_containers(list(env.values()) + list(sums.values()) + [items])}
+        ids = {id(target) for target in targets.values()}
+        if len(ids) < len(targets) or not reachable.isdisjoint(ids):
+            return _spl_missing
+    loop = ParallelLoop(interpreter, plan, env, targets, sums)
+    loop.run(_spl_chunkable(items))
+    return dict(loop.written, **loop.sums), loop.result, loop.error
+
+def _spl_parallel_result(variables, ran):
+    """Store what _spl_parallel_for returned in variables, giving the loop's value or raising its error"""
+    written, result, error = ran
+    for name, value in written.items():
+        variables[name] = value
+    if error is not None:
+        raise error
+    return result
+
+def execute_spl_code(code, engine='closure', optimize=1, sink=None, batch_size=100, max_lines=MAX_OUTPUT_LINES,
+                     quotas=None, profile=False):
+    """Run code and return a dict with 'success', 'output', 'result', 'error'
+    and 'truncated'. With quotas, a Quotas, the run stops with a
+    QuotaExceeded error once it goes over a limit, and 'quota' names it.
+
+    With profile set, 'profile' holds a Profiler report of the run. Only the
+    tree and closure engines can be profiled, so the python engine runs the
+    program as closures instead."""
     global global_interpreter
+    output = global_interpreter.output = OutputSink(sink, batch_size, max_lines)
+    global_interpreter.quotas = output.quotas = quotas
+    if quotas is not None:
+        quotas.start()
+    profiler = Profiler() if profile else None
+    if profiler is not None:
+        global_interpreter.set_profiler(profiler)
+        engine = 'tree' if engine == 'tree' else 'closure'
     try:
-        global_interpreter.output = []  # Clear previous output
-        lexer = Lexer(code)
-        tokens = lexer.tokenize()
-        parser = Parser(tokens)
-        ast = parser.parse()
-        result = global_interpreter.interpret(ast)
-        
-        return {
-            'success': True,
-            'output': global_interpreter.output,
-            'result': result,
-            'error': None
-        }
+        if engine == 'python' and quotas is not None:
+            code_obj = transpile_spl_code(code, optimize, streaming=True, quotas=True)
+            steps = stream_transpiled(code_obj, global_interpreter, quotas.pause_interval())
+            result = _spl_run_with_quotas(steps, quotas)
+        elif engine == 'python':
+            result = run_transpiled(transpile_spl_code(code, optimize), global_interpreter)
+        else:
+            ast = Optimizer(optimize).optimize(ast_cache.get(code, global_parser.reparse))
+            if engine == 'closure':
+                result = _spl_flatten(Compiler(global_interpreter).compile(ast)())
+            else:
+                result = global_interpreter.run(ast)
+        status = {'success': True, 'result': result, 'error': None}
+    except QuotaExceeded as e:
+        status = {'success': False, 'result': None, 'error': str(e), 'quota': e.quota}
     except Exception as e:
-        return {
-            'success': False,
-            'output': global_interpreter.output,
-            'result': None,
-            'error': str(e)
-        }
+        status = {'success': False, 'result': None, 'error': str(e)}
+    finally:
+        global_interpreter.quotas = output.quotas = None
+        if profiler is not None:
+            global_interpreter.set_profiler(None)
+    if profiler is not None:
+        status['profile'] = profiler.report()
+    output.flush()
+    return dict(status, output=list(output.lines), truncated=output.dropped)
+
+def execute_spl_code_stream(code, optimize=1, batch_size=100, max_lines=MAX_OUTPUT_LINES):
+    """Run code with the python engine, yielding printed lines while it runs.
+
+    Each item is a dict whose 'output' holds the lines printed since the
+    last one, in batches of batch_size. The last item also has 'done' set
+    and the 'success', 'result', 'error' and 'truncated' keys of
+    execute_spl_code.
+    """
+    batches = []
+    output = global_interpreter.output = OutputSink(batches.append, batch_size, max_lines)
+
+    def take():
+        lines = [line for batch in batches for line in batch]
+        batches.clear()
+        return lines
+
+    steps = None
+    try:
+        steps = stream_transpiled(transpile_spl_code(code, optimize, streaming=True), global_interpreter)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                status = {'success': True, 'result': stop.value, 'error': None}
+                break
+            if batches:
+                yield {'output': take(), 'done': False}
+    except Exception as e:
+        status = {'success': False, 'result': None, 'error': str(e)}
+    finally:
+        if steps is not None:
+            steps.close()
+    output.flush()
+    yield dict(status, output=take(), done=True, truncated=output.dropped)
+
+async def execute_spl_code_async(code, optimize=1, yield_every=NODES_PER_PAUSE, on_progress=None,
+                                 interpreter=None, batch_size=100, max_lines=MAX_OUTPUT_LINES, quotas=None,
+                                 incremental=False):
+    """Run code with the python engine, handing control back to the asyncio
+    event loop after about every yield_every evaluated AST nodes.
+
+    The browser stays responsive while a long program runs, and on a server
+    many programs can run as tasks side by side. Pass an Interpreter of its
+    own to each concurrent task; the default is global_interpreter. At
+    every pause on_progress, if given, is called with a dict of the lines
+    printed since the last call ('output') and the nodes run so far
+    ('nodes'). It is called once more at the end with the remaining lines.
+    cancel_spl_code() stops the program at its next pause, and cancelling
+    the task stops it as well. quotas limits the run as in
+    execute_spl_code. With incremental set, the run starts from the first
+    top-level statement that changed since the last incremental run on
+    interpreter, replaying the output of those before it (see Checkpoints).
+    Returns the dict of execute_spl_code, plus 'nodes', 'stopped' and
+    'replayed', the number of statements replayed.
+    """
+    import asyncio
+    interpreter = interpreter or global_interpreter
+    batches = []
+    output = interpreter.output = OutputSink(batches.append if on_progress else None, batch_size, max_lines)
+    interpreter.quotas = output.quotas = quotas
+    if quotas is not None:
+        quotas.start()
+        yield_every = min(yield_every, quotas.pause_interval())
+    interpreter.stop_requested = False
+    nodes = 0
+    stopped = False
+
+    def report():
+        output.flush()
+        on_progress({'output': [line for batch in batches for line in batch], 'nodes': nodes})
+        batches.clear()
+
+    steps = None
+    checkpoints = None
+    try:
+        if incremental:
+            checkpoints = interpreter.checkpoints = interpreter.checkpoints or Checkpoints()
+            steps = checkpoints.run(interpreter, code, optimize, yield_every, quotas is not None)
+        else:
+            code_obj = transpile_spl_code(code, optimize, streaming=True, quotas=quotas is not None)
+            steps = stream_transpiled(code_obj, interpreter, yield_every)
+        while True:
+            try:
+                count = next(steps)
+            except StopIteration as stop:
+                status = {'success': True, 'result': stop.value, 'error': None}
+                break
+            if count is None:
+                continue  # A print; output is reported at the next pause
+            nodes += count
+            if quotas is not None:
+                quotas.charge_nodes(count)
+            if on_progress is not None:
+                report()
+            await asyncio.sleep(0)
+            if interpreter.stop_requested:
+                stopped = True
+                status = {'success': False, 'result': None, 'error': 'Stopped'}
+                break
+    except QuotaExceeded as e:
+        status = {'success': False, 'result': None, 'error': str(e), 'quota': e.quota}
+    except Exception as e:
+        status = {'success': False, 'result': None, 'error': str(e)}
+    finally:
+        if steps is not None:
+            steps.close()
+        interpreter.quotas = output.quotas = None
+    if on_progress is not None:
+        report()
+    else:
+        output.flush()
+    return dict(status, output=list(output.lines), truncated=output.dropped, nodes=nodes, stopped=stopped,
+                replayed=checkpoints.replayed if checkpoints is not None else 0)
+
+def cancel_spl_code(interpreter=None):
+    """Ask the execute_spl_code_async run on interpreter to stop at its next pause"""
+    (interpreter or global_interpreter).stop_requested = True
 
 print("SPL Interpreter loaded successfully!")
 `;
@@ -782,14 +3711,67 @@ const examples = [
     `# Lists and for loops\nnumbers = [1, 2, 3, 4, 5];\nfor num in numbers {\n    print("Number:", num);\n}\n\nfor i in range(3) {\n    print("Range:", i);\n}`
 ];
 
+// The interpreter below as a precompiled module; rebuild it with
+// `python embedded.py` whenever splInterpreterCode changes
+const SPL_PACKAGE_URL = 'spl_interpreter.zip';
+const SPL_PACKAGE_PATH = '/home/pyodide/spl_interpreter.zip';
+
+// Milliseconds since the page started loading at which the interpreter was
+// ready and the first run finished, reported in the console
+const startupTimes = {};
+
+// NumPy is only downloaded for programs that make arrays
+const USES_ARRAYS = /\bList\s*\.\s*array\b/;
+let numpyRequest = null;
+
+// Load NumPy the first time a program uses List.array. Without it, arrays
+// fall back to Python lists
+function loadNumpy() {
+    if (numpyRequest === null) {
+        numpyRequest = pyodide.loadPackage('numpy').catch(error => {
+            console.warn("NumPy unavailable, arrays fall back to Python lists:", error);
+        });
+    }
+    return numpyRequest;
+}
+
+// Import spl_interpreter from the prebuilt zip, or compile splInterpreterCode
+// when the zip can't be fetched (as when index.html is opened from disk)
+async function loadSplInterpreter(packageRequest) {
+    try {
+        const response = await packageRequest;
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        pyodide.FS.writeFile(SPL_PACKAGE_PATH, new Uint8Array(await response.arrayBuffer()));
+        pyodide.runPython(`
+import sys
+sys.path.insert(0, '${SPL_PACKAGE_PATH}')
+from spl_interpreter import *
+`);
+        return 'package';
+    } catch (error) {
+        console.warn("Precompiled interpreter unavailable, compiling it from source:", error);
+        await pyodide.runPythonAsync(splInterpreterCode);
+        return 'source';
+    }
+}
+
 // Initialize Pyodide and SPL interpreter
 async function initializePyodide() {
     try {
         console.log("Loading Pyodide...");
+        // Fetch the interpreter while Pyodide downloads
+        const packageRequest = fetch(SPL_PACKAGE_URL);
+        packageRequest.catch(() => {});
         pyodide = await loadPyodide();
+        startupTimes.pyodide = performance.now();
         console.log("Pyodide loaded, loading SPL interpreter...");
-        await pyodide.runPythonAsync(splInterpreterCode);
-        console.log("SPL interpreter loaded successfully");
+        const loadedFrom = await loadSplInterpreter(packageRequest);
+        startupTimes.interpreter = performance.now();
+        console.log(`SPL interpreter loaded from ${loadedFrom} in ` +
+            `${(startupTimes.interpreter - startupTimes.pyodide).toFixed(0)} ms, ` +
+            `${(startupTimes.interpreter / 1000).toFixed(2)} s after page load`);
         return true;
     } catch (error) {
         console.error("Failed to initialize:", error);
@@ -813,9 +3795,12 @@ function initializeEditor() {
     codeEditor.setValue(examples[0]);
 }
 
-// Execute SPL code with improved error handling
+// Execute SPL code without blocking the page: the interpreter hands control
+// back to the browser between slices of work, so output appears as it is
+// printed and the Stop button can interrupt a long-running program
 async function runCode() {
     const runBtn = document.getElementById('run-btn');
+    const stopBtn = document.getElementById('stop-btn');
     const code = codeEditor.getValue().trim();
     
     if (!code) {
@@ -827,30 +3812,41 @@ async function runCode() {
         // Update UI
         runBtn.disabled = true;
         runBtn.innerHTML = '<span class="btn-icon">⏳</span>Running...';
+        stopBtn.disabled = false;
         
         // Clear output and show running message
         clearOutput(false);
         addOutput(`> Running code...`, "info");
+        if (USES_ARRAYS.test(code)) {
+            await loadNumpy();
+        }
+        
+        let printed = 0;
+        pyodide.globals.set('report_progress', (progressStr) => {
+            const progress = JSON.parse(progressStr);
+            progress.output.slice(-MAX_DISPLAYED_LINES).forEach(line => addOutput(line, "print"));
+            printed += progress.output.length;
+            trimOutput(MAX_DISPLAYED_LINES);
+        });
         
         // Execute code via Pyodide
         pyodide.globals.set('user_code', code);
-        const resultStr = pyodide.runPython(`
+        const resultStr = await pyodide.runPythonAsync(`
 import json
-result = execute_spl_code(user_code)
-json.dumps(result)
+result = await execute_spl_code_async(
+    user_code, incremental=True, on_progress=lambda progress: report_progress(json.dumps(progress, default=str)))
+json.dumps(result, default=str)
         `);
         
         const result = JSON.parse(resultStr);
         
         // Display results
-        if (result.error) {
+        if (result.stopped) {
+            addOutput("■ Stopped", "info");
+        } else if (result.error) {
             addOutput(`Error: ${result.error}`, "error");
-        } else {
-            if (result.output?.length > 0) {
-                result.output.forEach(line => addOutput(line, "print"));
-            } else {
-                addOutput("✓ Code executed successfully (no output)", "info");
-            }
+        } else if (printed === 0) {
+            addOutput("✓ Code executed successfully (no output)", "info");
         }
         
     } catch (error) {
@@ -859,9 +3855,18 @@ json.dumps(result)
     } finally {
         runBtn.disabled = false;
         runBtn.innerHTML = '<span class="btn-icon">▶</span>Run Code';
+        stopBtn.disabled = true;
+        if (startupTimes.firstRun === undefined) {
+            startupTimes.firstRun = performance.now();
+            console.log(`First run finished ${(startupTimes.firstRun / 1000).toFixed(2)} s after page load`, startupTimes);
+        }
     }
 }
 
+function stopCode() {
+    pyodide.runPython('cancel_spl_code()');
+}
+
 // Utility functions for output management
 function addOutput(text, type = "output") {
     const output = document.getElementById('output');
@@ -880,6 +3885,16 @@ function addOutput(text, type = "output") {
     output.scrollTop = output.scrollHeight;
 }
 
+// Drop the oldest lines so a program that prints without end can't fill the page
+const MAX_DISPLAYED_LINES = 10000;
+
+function trimOutput(maxLines) {
+    const output = document.getElementById('output');
+    while (output.children.length > maxLines) {
+        output.firstElementChild.remove();
+    }
+}
+
 function clearOutput(clearWelcome = true) {
     const output = document.getElementById('output');
     if (clearWelcome) {
@@ -935,6 +3950,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Button events
     document.getElementById('run-btn').addEventListener('click', runCode);
+    document.getElementById('stop-btn').addEventListener('click', stopCode);
     document.getElementById('clear-btn').addEventListener('click', () => clearOutput(true));
     document.getElementById('example-btn').addEventListener('click', loadExample);
     
@@ -942,7 +3958,7 @@ document.addEventListener('DOMContentLoaded', function() {
     document.addEventListener('keydown', function(e) {
         if ((e.ctrlKey || e.metaKey) && e.key === 'Enter') {
             e.preventDefault();
-            runCode();
+            if (!document.getElementById('run-btn').disabled) runCode();
         }
     });
     
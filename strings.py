@@ -0,0 +1,90 @@
+"""Strings that grow in place.
+
+s = s + part makes a new string and copies all of s into it, so a program
+that builds a long string one part at a time takes quadratic time. The
+resolver turns such an assignment into an Append node, and the engines keep
+the variable's value in a StringBuilder while it grows: each part is added
+to a list, and the parts are joined the first time the variable is read.
+"""
+from AST import ASTNode, BinaryOp, Call, Identifier, Local
+
+
+class StringBuilder:
+    """A string held as a list of parts, joined when it is read.
+
+    Only variables hold one; reading the variable calls build(), so every
+    other value a program sees is a plain str.
+    """
+    __slots__ = ("parts",)
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def extend(self, parts):
+        self.parts.extend(parts)
+
+    def build(self):
+        """The string, joining the parts into one so the next build() is free"""
+        parts = self.parts
+        if len(parts) != 1:
+            parts[:] = ["".join(parts)]
+        return parts[0]
+
+    def __repr__(self):
+        return f"StringBuilder({self.build()!r})"
+
+
+def add_parts(current, parts):
+    """current + part + ..., with the text added to a StringBuilder.
+
+    Parts are added with + until current or a part is a string, and as
+    text from then on. current is only extended once every part has been
+    added, so a part that can't be added leaves it as it was.
+    """
+    pending = []
+    for part in parts:
+        if pending or isinstance(part, str) or isinstance(current, (str, StringBuilder)):
+            pending.append(str(part))
+        else:
+            current = current + part
+    if pending:
+        if type(current) is StringBuilder:
+            current.extend(pending)
+        else:
+            current = StringBuilder([str(current)] + pending)
+    return current
+
+
+def flatten(value):
+    """value, or the string a StringBuilder holds"""
+    return value.build() if type(value) is StringBuilder else value
+
+
+def append_parts(node):
+    """The parts of an Assignment name = name + part + ..., or None.
+
+    The parts are the right operands of the chain of + whose leftmost
+    operand is name. Assignments whose parts read name themselves are left
+    alone, since those must see the value from before the assignment, and
+    so are those whose parts call a function, which may read it.
+    """
+    value = node.value
+    parts = []
+    while isinstance(value, BinaryOp) and value.operator.type.value == "PLUS":
+        parts.append(value.right)
+        value = value.left
+    if not parts or not isinstance(value, (Identifier, Local)) or value.name != node.name:
+        return None
+    if any(_reads(part, node.name) for part in parts):
+        return None
+    parts.reverse()
+    return parts
+
+
+def _reads(node, name):
+    """Whether the expression node may read the variable name"""
+    if isinstance(node, (Identifier, Local)):
+        return node.name == name
+    if isinstance(node, Call):
+        return True
+    return isinstance(node, ASTNode) and any(_reads(getattr(node, field), name) for field in node.__slots__)
@@ -1,5 +1,80 @@
-from parser import parse
-from interpreter import interpret, Interpreter
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import tempfile
+from bench_suite import WORKLOADS, compare, main as bench_main, run_suite
+from cache import ProgramCache, dump_program, load_program
+from compiler import Compiler
+from embedded import build_package, embedded_source, load_embedded, load_package, packaged_source
+from main import main as spl_main, run_batch
+from optimizer import optimize_ast
+from profiler import Profiler
+from AST import (Append, Assignment, BinaryOp, Call, FunctionDef, Identifier, Local, LocalAssignment, LoopInvariant,
+                 Number, PrintStatement, Program, String, WhileStatement)
+from functions import Function
+from lexer import LexerError, Tokenizer, TokenType
+from parser import OPERATOR_TOKENS, parse
+from interpreter import interpret, interpret_stream, Interpreter, OutputHandler
+from quotas import QuotaExceededError, Quotas
+from resolver import Resolver, SlotTable
+from strings import StringBuilder
+from vm import VM
+
+
+class Checks:
+    """The passed and failed counts of one test's checks.
+
+    check(description, condition) counts a check and prints the description
+    of one that failed; report() prints the counts and fails the test if
+    any check did.
+    """
+
+    def __init__(self):
+        self.passed = 0
+        self.failed = 0
+
+    def __call__(self, description, condition):
+        if condition:
+            self.passed += 1
+        else:
+            print(f"FAILED - {description}")
+            self.failed += 1
+
+    def report(self):
+        print("Results:")
+        print(f"Passed: {self.passed}")
+        print(f"Failed: {self.failed}")
+        print(f"Success Rate: {self.passed}/{self.passed+self.failed}")
+        assert self.failed == 0, f"{self.failed} checks failed"
+
+
+def run_everywhere(spl, code, fields=("output", "error", "quota"), **options):
+    """The fields of the embedded interpreter's result for code, the same on
+    every engine, or the results of all engines if they differ. The field
+    "variables" is the program's variables after it ran."""
+    results = []
+    for engine in ("tree", "closure", "python"):
+        result = spl.execute_spl_code(code, engine=engine, **options)
+        result["variables"] = dict(spl.global_interpreter.variables)
+        spl.global_interpreter.variables.clear()
+        results.append(tuple(result.get(field) for field in fields))
+    return results[0] if results.count(results[0]) == len(results) else results
+
+
+def run_both(code, **options):
+    """interpret(code) on the tree engine and the VM, as a value or the error
+    raised, or both results if they differ"""
+    results = []
+    for engine in ("tree", "vm"):
+        try:
+            results.append(interpret(code, engine=engine, **options))
+        except Exception as e:
+            results.append(f"{type(e).__name__}: {e}")
+    return results[0] if results[0] == results[1] else results
+
 
 def test_complete_pipeline():
 
@@ -67,7 +142,7 @@ def test_variable_persistence():
         print(f"\nExecuting: {code}")
         try:
             ast = parse(code)
-            result = interpreter.visit(ast)
+            result = interpreter.run(ast)
             print(f"Result: {result}")
             print(f"Variables: {interpreter.variables}")
 
@@ -86,6 +161,815 @@ def test_variable_persistence():
     print(f"Failed: {failed}")
     print(f"Success Rate: {passed}/{passed+failed}")
 
+def test_engine_parity():
+    print("\nEngine Parity Test")
+    check = Checks()
+
+    programs = [
+        "2 + 3",
+        "(2 + 3) * 4",
+        "10 / 4",
+        "x = 5",
+        "5 > 3",
+        "-(3 + 2)",
+        'greeting = "hi " + 3',
+        "x = 0\nwhile x < 10: x = x + 1\nx",
+        "x = 3\nif x > 2: y = 1 else: y = 2\ny",
+        "if 1 < 0: 5",
+        "while 0 > 1: 1",
+    ]
+
+    for code in programs:
+        try:
+            tree_result = interpret(code)
+            vm_result = interpret(code, engine="vm")
+            check(f"{code!r}: tree gave {tree_result!r}, vm gave {vm_result!r}",
+                  tree_result == vm_result and type(tree_result) == type(vm_result))
+        except Exception as e:
+            check(f"{code!r} raised {e}", False)
+
+    for code in ["1 / 0", "missing + 1"]:
+        errors = []
+        for engine in ["tree", "vm"]:
+            try:
+                interpret(code, engine=engine)
+                errors.append(None)
+            except Exception as e:
+                errors.append((type(e), str(e)))
+        check(f"{code!r}: tree raised {errors[0]}, vm raised {errors[1]}", errors[0] is not None and errors[0] == errors[1])
+
+    check.report()
+
+def test_closure_engine():
+    print("\nClosure Engine Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+
+    programs = {
+        'x = 0; while x < 5 { x = x + 1; }; print(x);': (["5.0"], None),
+        'x = 2; if x > 1 { y = "big"; } else { y = "small"; }; print(y, x >= 2, x != 2);': (["big True False"], None),
+        'for i in range(10) { if i == 3 { break; }; print(i); };': (["0", "1", "2"], None),
+        't = 0; for row in [[1, 2], [3]] { for v in row { t = t + v; }; }; s = "ab"; print(t, s.upper(), Math.max([t, 9]));':
+            (["6.0 AB 9.0"], None),
+        'print(missing);': ([], "Variable 'missing' is not defined"),
+        'x = 1; print(x); y = x / 0;': (["1.0"], "Division by zero"),
+        'items = [1, 2]; print(items[5]);': ([], "List index out of range: 5"),
+    }
+    for code, expected in programs.items():
+        check(f"{code!r} runs as closures as it does on the tree engine",
+              run_everywhere(spl, code, ("output", "error")) == expected)
+
+    interpreter = spl.Interpreter()
+    interpreter.output = spl.OutputSink(None, 100, 100)
+    run = spl.Compiler(interpreter).compile(spl.global_parser.reparse("n = 0; while n < 3 { n = n + 1; }; print(n);"))
+    run()
+    run()
+    check("a compiled program can be run again", list(interpreter.output.lines) == ["3.0", "3.0"])
+
+    check.report()
+
+def test_transpiler():
+    print("\nTranspiler Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+
+    source = spl.Transpiler().transpile(spl.global_parser.reparse("x = 1; print(x);"))
+    check("a program becomes one Python function", source.startswith("def _spl_main(") and "v_x = 1.0" in source)
+    code_obj = spl.transpile_spl_code("x = 1; print(x);")
+    check("code objects are cached by source", spl.transpile_spl_code("x = 1; print(x);") is code_obj
+          and spl.transpile_spl_code("x = 2; print(x);") is not code_obj)
+    check("runtime errors are the other engines' SPLErrors",
+          run_everywhere(spl, "x = 1; print(x); y = x / 0;", ("output", "error")) == (["1.0"], "Division by zero")
+          and run_everywhere(spl, "print(x + missing);", ("output", "error")) == ([], "Variable 'x' is not defined"))
+    spl.execute_spl_code("a = 3;", engine="python")
+    result = spl.execute_spl_code("a = a + 1; print(a * 2);", engine="python")
+    check("variables carry over between runs", result["output"] == ["8.0"] and spl.global_interpreter.variables["a"] == 4)
+    spl.global_interpreter.variables.clear()
+
+    check.report()
+
+def test_token_scanning():
+    print("\nToken Scanning Test")
+    check = Checks()
+
+    def scan(text, path):
+        """The tokens of text by one of the lexer's paths, or the error it raised"""
+        tokenizer = Tokenizer(text)
+        try:
+            if path == "pattern":
+                tokens = tokenizer.tokenize()
+            elif path == "buffer":
+                buffer = tokenizer.tokenize_buffer()
+                tokens = [buffer[i] for i in range(len(buffer))]
+            else:
+                tokens = [tokenizer.next_token()]
+                while tokens[-1].type != TokenType.EOF:
+                    tokens.append(tokenizer.next_token())
+                tokenizer.check_trailing_operator(tokens[-2] if len(tokens) >= 2 else None)
+            return [(token.type, token.value, token.line, token.column) for token in tokens]
+        except LexerError as e:
+            return str(e)
+
+    sources = [
+        "x = 1\nwhile x < 10: x = x + 1.5\nx",
+        's = "a\\"b\\n" + \'c\'\n\tcaf\u00e9 = 2',
+        "@memo(4)\ndef f(a, b): a / b",
+        'a = "x\ny"',
+        'message = "hello, " + name + "tab\\tquote\\"s"',
+        "if x > 0: y = 1.5\nelse: y = 2",
+        "while count < 10:\n    count = count + 1",
+        "   \n\n  q",
+        "y = 1.2.3",
+        "z = 12abc",
+        's = "open',
+        "x = 3 +",
+    ]
+    for text in sources:
+        characters = scan(text, "characters")
+        check(f"{text!r}: the master pattern gives the character scanner's tokens", scan(text, "pattern") == characters)
+        check(f"{text!r}: a TokenBuffer holds the same tokens as tokenize()", scan(text, "buffer") == characters)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+
+    def embedded_scan(text, pattern):
+        lexer = spl.Lexer(text)
+        try:
+            if pattern:
+                tokens = lexer.tokenize()
+            else:
+                tokens = []
+                while lexer.pos < lexer.end:
+                    lexer.scan_char(tokens)
+                tokens.append(spl.Token("EOF", None, lexer.line, lexer.col, lexer.pos))
+            return [(token.type, token.value, token.line, token.col) for token in tokens]
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+    for text in ['x = [1, 2.5]; # note\nprint(x.length() >= 2, "a b");', 's = "x\ny"; t = 2;', "a != b == c <= d\n\n  q",
+                 "\u00e9 = 1;", "y = 1.2.3;", 's = "open', "x = 3 ~ 4"]:
+        check(f"{text!r}: the embedded lexer's pattern gives the character scanner's tokens",
+              embedded_scan(text, True) == embedded_scan(text, False))
+
+    check.report()
+
+def test_streaming():
+    print("\nStreaming Test")
+    check = Checks()
+
+    programs = [
+        "2 + 3 * 4",
+        "x = 0\nwhile x < 10: x = x + 1\nx",
+        'name = "stream"\ngreeting = "hello " + name\ngreeting',
+        "a = 5\nb = a * 2\nif b > a: c = b - a else: c = 0\nc",
+    ]
+
+    for code in programs:
+        for chunk_size in [1, 4, 1 << 16]:
+            for source in [io.StringIO(code), io.BytesIO(code.encode("utf-8"))]:
+                try:
+                    expected = interpret(code)
+                    result = interpret_stream(source, chunk_size=chunk_size)
+                    check(f"{code!r} (chunk {chunk_size}): expected {expected}, got {result}", result == expected)
+                except Exception as e:
+                    check(f"{code!r} (chunk {chunk_size}) raised {e}", False)
+
+    check.report()
+
+def test_incremental_parser():
+    print("\nIncremental Parser Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+
+    def parse_with(parse, text):
+        """The program parse(text) gives, with line and column numbers, or the error it raised"""
+        try:
+            return parse(text)
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+    parser = spl.IncrementalParser()
+    lines = ["x = 1;", "items = [1, 2, 3];", "for v in items {", "    x = x + v;", '    if x > 3 { print("big", x); }',
+             "};", 's = "done";', "print(s, x);", "y = x * 2;", "print(y);"]
+    edits = {
+        "the first parse": lines,
+        "inserting a line": lines[:1] + ["z = 5;"] + lines[1:],
+        "deleting a line": lines[:6] + lines[7:],
+        "editing a line inside a block": lines[:3] + ["    x = x + v * 2;"] + lines[4:],
+        "breaking a line": lines[:8] + ["y = x * ;"] + lines[9:],
+        "fixing it again": lines,
+        "inserting a line at the start": ["w = 0;"] + lines,
+        "editing the last line": lines[:-1] + ["print(y, x);"],
+        "deleting part of a block": lines[:4] + lines[6:],
+    }
+    for edit, text in edits.items():
+        text = "\n".join(text)
+        check(f"re-parsing after {edit} gives what a full parse does",
+              parse_with(parser.reparse, text) == parse_with(lambda text: spl.Parser(spl.Lexer(text).tokenize()).parse(), text))
+    check("statements an edit didn't touch are reused", parser.stats["reused"] > 0)
+
+    check.report()
+
+def test_program_cache():
+    print("\nProgram Cache Test")
+    check = Checks()
+
+    programs = [
+        "2 + 3 * 4",
+        "x = 0\nwhile x < 10: x = x + 1\nx",
+        "a = 5\nb = a * 2\nif b > a: c = b - a else: c = 0\nc",
+        'name = "cache"\n"hello " + name',
+    ]
+
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ProgramCache(cache_dir=cache_dir)
+            for code in programs:
+                first = cache.parse(code)
+                check(f"repeat parse of {code!r} is a hit", cache.parse(code) is first)
+                check(f"cached result of {code!r}", interpret(code, cache=cache) == interpret(code))
+            check("hit/miss counters", (cache.hits, cache.misses) == (8, 4))
+
+            fresh = ProgramCache(cache_dir=cache_dir)
+            for code in programs:
+                check(f"{code!r} loaded from .splc", interpret(code, cache=fresh) == interpret(code))
+            check("disk hits", fresh.disk_hits == len(programs))
+
+        check("round trip through .splc bytes", all(
+            interpret_program(load_program(dump_program(parse(code)))) == interpret(code) for code in programs))
+
+        stale = bytearray(dump_program(parse("1 + 1")))
+        stale[4] += 1
+        try:
+            load_program(bytes(stale))
+            check("stale grammar version is rejected", False)
+        except ValueError:
+            check("stale grammar version is rejected", True)
+
+        small = ProgramCache(max_bytes=40)
+        for code in programs:
+            small.parse(code)
+        check("size-based eviction", small.size <= 40 and small.evictions > 0)
+        check("evicted entry is parsed again", small.parse(programs[0]) is not None and small.misses == 5)
+    except Exception as e:
+        check(f"the cache raised {e}", False)
+
+    check.report()
+
+def test_optimizer():
+    print("\nOptimizer Test")
+    check = Checks()
+
+    programs = [
+        "(10 + 5) * 2 - 3 / 1.5",
+        '"total: " + 2 * 3',
+        "if 1 > 0: y = 5 else: y = 6\ny",
+        "if 0 > 1: y = 5",
+        "x = 5\nwhile 1 < 0: x = 1\nx",
+        "a = 3\nb = 4\nx = 0\nwhile x < a * b + 1: x = x + a * b - 11\nx",
+        "a = 2\nj = 0\nwhile j < 12: while j < a * 5 + a: j = j + a * a\nj",
+        "1 / 0",
+        "a = 0\nx = 0\nwhile x < 3: x = x + 1 / a",
+        "x = 0\nwhile x < 3: x = x + missing * 2",
+    ]
+
+    for code in programs:
+        results = []
+        for level in [0, 1, 2]:
+            for engine in ["tree", "vm"]:
+                try:
+                    results.append(interpret(code, engine=engine, optimize=level))
+                except Exception as e:
+                    results.append((type(e), str(e)))
+        check(f"{code!r}: {results}", all(result == results[0] for result in results))
+
+    folded = optimize_ast(parse("(10 + 5) * 2 - 3 / 1.5"), 1).statements
+    check("constant expression is folded", len(folded) == 1 and isinstance(folded[0], Number) and folded[0].value == 28.0)
+    branch = optimize_ast(parse('if 1 > 0: "yes" else: "no"'), 1).statements
+    check("dead branch is dropped", len(branch) == 1 and isinstance(branch[0], String) and branch[0].value == "yes")
+    loop = optimize_ast(parse("a = 3\nx = 0\nwhile x < a * 4: x = x + 1"), 2).statements[2]
+    check("loop invariant is marked", isinstance(loop.condition.right, LoopInvariant))
+
+    check.report()
+
+def test_slot_resolution():
+    print("\nSlot Resolution Test")
+    check = Checks()
+
+    table = SlotTable()
+    program = Resolver(table).resolve(parse("x = 1\ny = x + 2\nx = y"))
+    slots = [program.statements[0].slot, program.statements[1].value.left.slot, program.statements[2].slot]
+    check(f"unexpected slots {slots}, {table.index}",
+          slots == [0, 0, 0] and program.statements[1].slot == 1 and table.index == {"x": 0, "y": 1})
+
+    interpreter = Interpreter()
+    interpreter.run(parse("a = 4\nb = a * 2"))
+    results = [interpreter.run(parse("a + b")), interpreter.visit(parse("c = b - a"))]
+    check(f"variables persist across runs: {results}, {interpreter.variables}",
+          results == [12, 4] and dict(interpreter.variables) == {"a": 4, "b": 8, "c": 4})
+
+    interpreter.variables.clear()
+    try:
+        interpreter.run(parse("a"))
+        check("cleared variable is no longer defined", False)
+    except NameError:
+        check("cleared variable is no longer defined", True)
+
+    check.report()
+
+def test_arrays():
+    print("\nArrays Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+    check("NumPy is not imported until an array is made", spl.numpy is None)
+
+    programs = {
+        "element-wise arithmetic": ("a = List.array([1, 2, 3]); b = List.array([4, 5, 6]); print(a + b, b - a, a * b, b / a);",
+                                    ["[5.0, 7.0, 9.0] [3.0, 3.0, 3.0] [4.0, 10.0, 18.0] [4.0, 2.5, 2.0]"], None),
+        "element-wise comparisons": ("a = List.array([1, 2, 3]); b = List.array([3, 2, 1]); "
+                                     "print(a > b, a < b, a >= b, a <= b, a == b, a != b);",
+                                     ["[False, False, True] [True, False, False] [False, True, True] "
+                                      "[True, True, False] [False, True, False] [True, False, True]"], None),
+        "numbers on either side": ("a = List.array(range(5)); print(a * 2 + 1, 10 - a, 1 / List.array([1, 2, 4]), 2 * a);",
+                                   ["[1.0, 3.0, 5.0, 7.0, 9.0] [10.0, 9.0, 8.0, 7.0, 6.0] [1.0, 0.5, 0.25] "
+                                    "[0.0, 2.0, 4.0, 6.0, 8.0]"], None),
+        "Math reductions": ("a = List.array([4, 1, 7]); print(Math.sum(a), Math.max(a), Math.min(a), Math.average(a));",
+                            ["12.0 7.0 1.0 4.0"], None),
+        "arrays of different lengths": ("a = List.array([1, 2]); print(a + List.array([1, 2, 3]));",
+                                        [], "Array lengths differ: 2 and 3"),
+        "dividing by a zero": ("print(1 / List.array([1, 0]));", [], "Division by zero"),
+        "arrays of other values": ('a = List.array([1, "x"]);', [], "List.array needs a list of numbers"),
+        "the maximum of nothing": ("print(Math.max(List.array([])));", [], "Math.max of an empty array"),
+    }
+    for name, (code, output, error) in programs.items():
+        check(f"{name} with NumPy", run_everywhere(spl, code, ("output", "error")) == (output, error))
+    check("arrays are held in NumPy arrays when it is installed", spl.numpy is not None)
+
+    spl._spl_import_numpy = lambda: None
+    for name, (code, output, error) in programs.items():
+        check(f"{name} without NumPy", run_everywhere(spl, code, ("output", "error")) == (output, error))
+    spl.execute_spl_code("a = List.array([1, 2]);")
+    check("arrays are held in lists without NumPy", type(spl.global_interpreter.variables["a"].data) is list)
+    spl.global_interpreter.variables.clear()
+
+    check.report()
+
+def test_output_sinks():
+    print("\nOutput Sink Test")
+    check = Checks()
+
+    # The parser has no print syntax, so the program is built directly
+    program = Program([
+        Assignment("i", Number(0)),
+        WhileStatement(BinaryOp(Identifier("i"), OPERATOR_TOKENS[TokenType.LESS], Number(25)), [
+            PrintStatement([String("line"), Identifier("i")]),
+            Assignment("i", BinaryOp(Identifier("i"), OPERATOR_TOKENS[TokenType.PLUS], Number(1))),
+        ]),
+    ])
+    expected = [f"line {i}" for i in range(25)]
+
+    batches = []
+    interpreter = Interpreter()
+    interpreter.output_handler = OutputHandler(batches.append, batch_size=10, max_lines=5)
+    interpreter.run(program)
+    interpreter.output_handler.flush()
+    check("callable sink gets every line in batches", [len(batch) for batch in batches] == [10, 10, 5]
+          and sum(batches, []) == expected)
+    check("only the last max_lines lines are kept", interpreter.output_handler.get_output() == expected[-5:])
+    check("dropped lines are counted", interpreter.output_handler.dropped == 20)
+
+    file = io.StringIO()
+    interpreter = Interpreter()
+    interpreter.output_handler = OutputHandler(file, batch_size=7)
+    interpreter.run(program)
+    interpreter.output_handler.flush()
+    check("file sink gets one line per print", file.getvalue().splitlines() == expected)
+
+    received = []
+    def collect():
+        while True:
+            received.extend((yield))
+    interpreter = Interpreter()
+    interpreter.output_handler = OutputHandler(collect(), batch_size=4, max_lines=0)
+    interpreter.run(program)
+    interpreter.output_handler.flush()
+    check("generator sink is sent every line", received == expected)
+    check("max_lines=0 keeps nothing", interpreter.output_handler.get_output() == [])
+
+    check.report()
+
+def test_async_runs():
+    print("\nAsync Runs Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+
+    async def stopped_run(code, pauses):
+        """Run code as a task and press Stop after the event loop has had control pauses times"""
+        interpreter = spl.Interpreter()
+        run = asyncio.create_task(spl.execute_spl_code_async(code, yield_every=1000, interpreter=interpreter))
+        for _ in range(pauses):
+            await asyncio.sleep(0)
+        spl.cancel_spl_code(interpreter)
+        return await run
+
+    result = asyncio.run(stopped_run("i = 0; while True { print(i); i = i + 1; }", 5))
+    check("Stop ends a run that would never finish",
+          result["stopped"] and result["error"] == "Stopped" and not result["success"])
+    check("a stopped run keeps the output printed before it stopped",
+          0 < len(result["output"]) and result["output"] == [f"{i}.0" for i in range(len(result["output"]))])
+
+    async def cancelled_run():
+        run = asyncio.create_task(spl.execute_spl_code_async("while True { x = 1; }", yield_every=1000,
+                                                             interpreter=spl.Interpreter()))
+        await asyncio.sleep(0)
+        run.cancel()
+        try:
+            await run
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    check("cancelling the task stops the run", asyncio.run(cancelled_run()))
+
+    progress = []
+    result = asyncio.run(spl.execute_spl_code_async(
+        "t = 0; for i in range(2000) { t = t + i; if i == 700 { print(i); }; }; print(t);",
+        yield_every=1000, interpreter=spl.Interpreter(), on_progress=progress.append))
+    nodes = [entry["nodes"] for entry in progress]
+    check("on_progress is called at every pause and once at the end", len(progress) == result["nodes"] // 1000 + 1)
+    check("a pause comes after every yield_every nodes",
+          all(1000 <= later - earlier < 1100 for earlier, later in zip([0] + nodes[:-3], nodes[:-2])))
+    check("on_progress gets each printed line once, in order",
+          [line for entry in progress for line in entry["output"]] == result["output"] == ["700", "1999000.0"])
+
+    async def ticking_run(code):
+        """The run's result and how often another task got control while it ran"""
+        ticks = 0
+        run = asyncio.create_task(spl.execute_spl_code_async(code, interpreter=spl.Interpreter()))
+        while not run.done():
+            ticks += 1
+            await asyncio.sleep(0)
+        return run.result(), ticks
+
+    result, ticks = asyncio.run(ticking_run("t = 0; for i in range(40000) { t = t + i; };"))
+    check("by default the run pauses every NODES_PER_PAUSE nodes",
+          result["nodes"] > 2 * spl.NODES_PER_PAUSE and ticks >= result["nodes"] // spl.NODES_PER_PAUSE)
+
+    check.report()
+
+def test_quotas():
+    print("\nQuota Test")
+    check = Checks()
+
+    def exceeded(code=None, quotas=None, program=None):
+        """Name of the quota the run went over, or None if it finished"""
+        try:
+            if program is not None:
+                Interpreter(quotas).run(program)
+            else:
+                interpret(code, quotas=quotas)
+        except QuotaExceededError as e:
+            return e.quota
+        return None
+
+    check("runaway loop stops at max_nodes", exceeded("x = 0\nwhile 1: x = x + 1", Quotas(max_nodes=10000)) == "nodes")
+    check("runaway loop stops at max_time", exceeded("x = 0\nwhile 1: x = x + 1", Quotas(max_time=0.05)) == "time")
+    check("string repetition is stopped before it is built",
+          exceeded('s = "ab" * 1000000000', Quotas(max_string_chars=1000)) == "string_chars")
+    check("growing string stops at max_string_chars",
+          exceeded('s = "a"\nwhile 1: s = s + s', Quotas(max_string_chars=100000)) == "string_chars")
+    program = Program([
+        WhileStatement(Number(1), [PrintStatement([String("spam")])]),
+    ])
+    check("printing stops at max_output_lines", exceeded(program=program, quotas=Quotas(max_output_lines=100)) == "output_lines")
+
+    quotas = Quotas(max_nodes=10000)
+    check("a program within its quotas runs normally",
+          interpret("x = 0\nwhile x < 100: x = x + 1\nx", quotas=quotas) == 100 and 0 < quotas.nodes <= 10000)
+    first_run = quotas.nodes
+    check("start() resets the counters for the next run",
+          interpret("x = 0\nwhile x < 100: x = x + 1\nx", quotas=quotas) == 100 and quotas.nodes == first_run)
+    try:
+        interpret("1", engine="vm", quotas=Quotas())
+        check("quotas on the vm engine are rejected", False)
+    except ValueError:
+        check("quotas on the vm engine are rejected", True)
+
+    check.report()
+
+def test_profiler():
+    print("\nProfiler Test")
+    check = Checks()
+
+    code = "x = 0\ny = 2 * -x\nwhile x < 50: x = x + 1\nx"
+    program = parse(code)
+    assignment = program.statements[1]
+    check("statements carry their line and column", (assignment.line, assignment.column) == (2, 1))
+    check("expressions carry the position of their first token",
+          (assignment.value.line, assignment.value.column) == (2, 5)
+          and (assignment.value.right.line, assignment.value.right.column) == (2, 9))
+    resolved = Resolver(SlotTable()).resolve(optimize_ast(program, 2))
+    check("optimized and resolved nodes keep their positions",
+          [statement.line for statement in resolved.statements] == [1, 2, 3, 4])
+    check("positions survive a .splc round trip", load_program(dump_program(program)).statements[2].line == 3)
+
+    profiler = Profiler()
+    check("a profiled run gives the same result", interpret(code, profiler=profiler) == 50)
+    report = profiler.report()
+    lines = {entry["line"]: entry for entry in report["lines"]}
+    check("every line is in the report", sorted(lines) == [1, 2, 3, 4])
+    check("a line's hits count the statements run on it", lines[3]["hits"] == 51 and lines[4]["hits"] == 1)
+    nodes = {entry["type"]: entry["hits"] for entry in report["nodes"]}
+    # x = x + 1 runs as an Append, which adds to the variable in place
+    check("node types are counted",
+          nodes["WhileStatement"] == 1 and nodes["Assignment"] == 2 and nodes["Append"] == 50)
+    check("line times add up to the total", abs(sum(entry["time"] for entry in report["lines"]) - report["total"]) < 1e-3)
+    check("the table lists the hottest line first", profiler.format(code).splitlines()[1].split()[0] == "3")
+    try:
+        interpret(code, engine="vm", profiler=Profiler())
+        check("profiling the vm engine is rejected", False)
+    except ValueError:
+        check("profiling the vm engine is rejected", True)
+
+    check.report()
+
+def test_cli():
+    print("\nCommand Line Test")
+    check = Checks()
+
+    programs = {
+        "a.spl": ("x = 5\ny = x * 3\ny + 1", 16),
+        "b.spl": ("x = 0\nwhile x < 10: x = x + 1\nx", 10),
+        "nested/c.spl": ('"batch " + "run"', "batch run"),
+        "nested/bad.spl": ("1 / 0", None),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (code, _) in programs.items():
+            path = os.path.join(directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(code)
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            status = spl_main(["run", os.path.join(directory, "a.spl")])
+        check("spl run prints the result", status == 0 and stdout.getvalue() == "16\n")
+
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            status = spl_main(["run", os.path.join(directory, "nested", "bad.spl")])
+        check("spl run reports errors with exit status 1", status == 1 and "Division by zero" in stderr.getvalue())
+
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as stderr:
+            status = spl_main(["run", "--profile", os.path.join(directory, "b.spl")])
+        hottest = stderr.getvalue().splitlines()[1]
+        check("spl run --profile prints the hottest lines", status == 0 and hottest.split()[0] == "2"
+              and hottest.endswith("while x < 10: x = x + 1"))
+
+        out = io.StringIO()
+        failures = run_batch([directory], jobs=2, optimize=2, out=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        results = {os.path.relpath(record["file"], directory).replace(os.sep, "/"): record for record in records}
+        check("batch writes one JSON line per program", len(records) == len(programs) and failures == 1)
+        for name, (_, expected) in programs.items():
+            record = results.get(name)
+            if expected is None:
+                check(f"{name} failed", record is not None and record["status"] == 1 and record["error"])
+            else:
+                check(f"{name} gave {expected!r}", record is not None and record["status"] == 0
+                      and record["result"] == expected and record["time"] >= 0)
+
+    check.report()
+
+def test_benchmarks():
+    print("\nBenchmark Suite Test")
+    check = Checks()
+
+    suite = run_suite(scale=0.01, repeat=2)
+    results = suite["results"]
+    check("every workload is timed", {key.split("/")[1] for key in results} == set(WORKLOADS))
+    check("each implementation times tokenize, parse and interpret",
+          all(f"{implementation}/numeric_loop/{phase}" in results
+              for implementation in ("standalone", "embedded") for phase in ("tokenize", "parse", "interpret")))
+    check("workloads the standalone language can't express are skipped",
+          "standalone/list_manipulation/interpret" not in results and "embedded/list_manipulation/interpret" in results)
+    check("results are JSON", json.loads(json.dumps(suite)) == suite)
+    check("best times are no more than medians", all(0 <= stats["min"] <= stats["median"] for stats in results.values()))
+
+    baseline = {"results": {"slower": {"min": 0.010}, "noise": {"min": 0.0001}, "faster": {"min": 0.010}}}
+    current = {"results": {"slower": {"min": 0.020}, "noise": {"min": 0.0004}, "faster": {"min": 0.005},
+                           "new": {"min": 0.001}}}
+    statuses = {row[0]: row[4] for row in compare(current, baseline)}
+    check("slowdowns over the threshold are regressions", statuses["slower"] == "regression")
+    check("tiny differences are not flagged", statuses["noise"] == "ok")
+    check("speedups are reported", statuses["faster"] == "improvement" and "new" not in statuses)
+    check("a run compared with itself has no regressions",
+          all(row[4] == "ok" for row in compare(suite, suite)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "baseline.json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            status = bench_main(["--scale", "0.01", "--repeat", "1", "--workload", "numeric_loop",
+                                 "--baseline", path, "--save-baseline"])
+        with open(path, encoding="utf-8") as file:
+            saved = json.load(file)
+        check("--save-baseline stores the run", status == 0 and sorted(saved["results"]) == sorted(
+            key for key in results if "/numeric_loop/" in key))
+
+    check.report()
+
+def test_embedded_package():
+    print("\nEmbedded Package Test")
+    check = Checks()
+
+    check("spl_interpreter.zip is up to date with script.js (rebuild with python embedded.py)",
+          packaged_source() == embedded_source())
+    with tempfile.TemporaryDirectory() as directory:
+        first = build_package(os.path.join(directory, "first.zip"))
+        second = build_package(os.path.join(directory, "second.zip"))
+        with open(first, "rb") as a, open(second, "rb") as b:
+            check("builds are reproducible", a.read() == b.read())
+        with contextlib.redirect_stdout(io.StringIO()):
+            spl = load_package(first)
+    check("the module is imported from bytecode", spl.__spec__.origin.endswith("spl_interpreter.pyc"))
+    check("modules only some features use are not imported up front",
+          not any(hasattr(spl, name) for name in ("random", "string", "asyncio", "hashlib", "marshal", "bisect", "weakref"))
+          and spl.numpy is None)
+    result = spl.execute_spl_code('x = Math.random(); print(x < 1, String.digits());')
+    check("Math.random and String.digits import what they need",
+          result["success"] and result["output"] == ["True 0123456789"])
+
+    check.report()
+
+def test_method_dispatch():
+    print("\nMethod Dispatch Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+
+    check("booleans get the Boolean methods, not the Number ones",
+          run_everywhere(spl, 'b = True; print(b.tostring(), b.not(), b.tonumber());') == (["true False 1"], None, None))
+    check("a call site follows a change of receiver type",
+          run_everywhere(spl, 'items = ["ab", [1, 2, 3], List.array([1, 2])]; for v in items { print(v.length()); };')
+          == (["2", "3", "2"], None, None))
+    check("unknown methods are reported",
+          run_everywhere(spl, 'x = 5; x.nope();') == ([], "Number has no method 'nope'", None))
+    check("bad arguments are reported",
+          run_everywhere(spl, 'x = "a"; x.replace(1);') == ([], "Wrong number of arguments for string.replace", None))
+    check("static methods are found once per call site",
+          run_everywhere(spl, 't = 0; for i in range(3) { t = t + Math.max([i, 1]); }; print(t);') == (["4.0"], None, None))
+    check("method results are still charged to quotas",
+          run_everywhere(spl, 'x = []; for i in range(100) { x.append(i); };', quotas=spl.Quotas(max_list_elements=10))[2]
+          == "list_elements")
+    check("methods are looked up in tables built once",
+          (str, "length") in spl.Interpreter._method_cache and "length" in spl.Interpreter.STRING_METHODS)
+
+    check.report()
+
+def test_string_builder():
+    print("\nString Builder Test")
+    check = Checks()
+
+    code = 's = ""\nn = 1\ns = s + n + ","\ns = s + "x" + 2\nt = s\ns = s + "!"\nn = n + 2 + 3\nt + "|" + s + "|" + n'
+    check("appends give the same result on both engines",
+          interpret(code) == interpret(code, engine="vm") == "1,x2|1,x2!|6")
+    resolved = Resolver(SlotTable()).resolve(parse('s = "a"\ns = s + "b" + "c"\ns = s + s\ns = "b" + s'))
+    check("only name = name + part assignments become Appends",
+          [type(statement) for statement in resolved.statements] == [Assignment, Append, Assignment, Assignment]
+          and len(resolved.statements[1].parts) == 2)
+
+    interpreter = Interpreter()
+    interpreter.execute(parse('s = "a"\ns = s + "b"\ns = s + "c"'))
+    check("the variable grows a StringBuilder in place", type(interpreter.slots[0]) is StringBuilder)
+    check("reading the variable gives a str", interpreter.variables["s"] == "abc" and interpreter.run(parse("s")) == "abc")
+    failed = []
+    for engine in (Interpreter(), VM()):
+        for code in ('s = "a"\nn = 1', 's = s + "b" + 1 / 0', 'n = n + 2 + s + 1 / 0'):
+            code = parse(code)
+            try:
+                engine.run(code if type(engine) is Interpreter else Compiler().compile(code))
+            except ZeroDivisionError:
+                pass
+        failed.append(engine.variables)
+    check("a failed append leaves the variable as it was on both engines", failed == [{"s": "a", "n": 1}] * 2)
+    quotas = Quotas(max_string_chars=1000)
+    check("appends are charged only for the new characters",
+          interpret('s = "0123456789"\n' + 's = s + "0123456789"\n' * 99 + "s", quotas=quotas) == "0123456789" * 100
+          and quotas.string_chars == 990)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+    fields = ("output", "result", "error", "variables")
+
+    check("a built string works with print, methods and comparisons",
+          run_everywhere(spl, 's = ""; for w in ["x", "y"] { s = s + w + "-"; }; print(s.upper(), s.find("y"), s == "x-y-");',
+                         fields)
+          == (["X-Y- 2 True"], None, None, {"s": "x-y-", "w": "y"}))
+    check("a failed append leaves the variable as it was",
+          run_everywhere(spl, 's = "a"; s = s + "b" + 1;', fields)[3] == {"s": "a"})
+    check("the result of a program ending in an append is a str",
+          run_everywhere(spl, 's = ""; for i in range(3) { s = s + "ab"; };', fields)[1] == "ababab")
+    report = 'line = "' + "x" * 49 + '"; s = ""; for i in range(20000) { s = s + line + "."; }; print(s.length());'
+    check("a 1 MB report builds line by line", run_everywhere(spl, report, fields)[0] == ["1000000"])
+
+    check.report()
+
+def test_list_views():
+    print("\nList Views Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+
+    check("slices are views that read like lists",
+          run_everywhere(spl, 'items = [1, 2, 3, 4, 5]; w = items.slice(1, -1); '
+                         'print(w, w[0], w.length(), w.contains(4), w.index(4), w == [2, 3, 4]); '
+                         'for v in w { print(v); };')
+          == (["[2.0, 3.0, 4.0] 2.0 3 True 2 True", "2.0", "3.0", "4.0"], None, None))
+    # What the copying slice of a plain list printed for the same bounds
+    items = [1.0, 2.0, 3.0, 4.0, 5.0]
+    windows = [f"{i} {items[i:i + 2]} {sum(items[i:i + 2])}" for i in range(5)]
+    check("a window walk slices with loop-variable bounds",
+          run_everywhere(spl, 'items = [1, 2, 3, 4, 5]; for i in range(5) { w = items.slice(i, i + 2); '
+                         's = 0; for v in w { s = s + v; }; print(i, w, s); };')
+          == (windows, None, None))
+    check("slice bounds are clamped and may be negative as for a copy",
+          run_everywhere(spl, 'items = [1, 2, 3, 4, 5]; print(items.slice(3), items.slice(-2), items.slice(4, 2), '
+                         'items.slice(2, 10), items.slice(1, 3).slice(1));')
+          == ([f"{items[3:]} {items[-2:]} {items[4:2]} {items[2:10]} {items[1:3][1:]}"], None, None))
+    check("a view keeps the items the list had when it was made",
+          run_everywhere(spl, 'items = [1, 2, 3]; w = items.slice(1); c = items.copy(); '
+                         'items.append(4); items.reverse(); print(items, w, c);')
+          == (["[4.0, 3.0, 2.0, 1.0] [2.0, 3.0] [1.0, 2.0, 3.0]"], None, None))
+    check("changing a view copies it and leaves the list alone",
+          run_everywhere(spl, 'items = [1, 2, 3]; w = items.copy(); w.append(9); w.sort(); x = w.pop(); '
+                         'print(items, w, x, w.length());')
+          == (["[1.0, 2.0, 3.0] [1.0, 2.0, 3.0] 9.0 3"], None, None))
+    check("views of views keep their own snapshots",
+          run_everywhere(spl, 'items = [1, 2, 3, 4]; w = items.slice(1); v = w.slice(1); '
+                         'w.clear(); items.pop(); print(items, w, v, v + [5], w + v);')
+          == (["[1.0, 2.0, 3.0] [] [3.0, 4.0] [3.0, 4.0, 5.0] [3.0, 4.0]"], None, None))
+    check("out of range view indices are reported",
+          run_everywhere(spl, 'items = [1, 2, 3]; w = items.slice(2); print(w[1]);')
+          == ([], "List index out of range: 1", None))
+    check("views are charged their length when they are made",
+          run_everywhere(spl, 'items = []; for i in range(10) { items.append(i); }; '
+                         'for i in range(100) { w = items.copy(); };',
+                         quotas=spl.Quotas(max_list_elements=500))[2] == "list_elements")
+
+    run_everywhere(spl, 'items = [1, 2, 3]; w = items.copy(); v = w.slice(1);')
+    gc.collect()
+    check("the list is let go of once its views are gone", spl._spl_shared == {})
+
+    check.report()
+
+def test_lazy_lists():
+    print("\nLazy Lists Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+
+    check("ranges read like lists",
+          run_everywhere(spl, 'r = List.range(2, 8, 2); x = range(3); print(r, r.length(), r[1], r.contains(6), r.index(4), x, x[2]);')
+          == (["[2, 4, 6] 3 4 True 1 [0, 1, 2] 2"], None, None))
+    check("fills and characters read like lists",
+          run_everywhere(spl, 'f = List.fill(3, "a"); c = List.from_string("abc"); '
+                         'print(f, f[2], c.join("-"), c.index("c"), c.contains("bc"), c.slice(c.index("b")));')
+          == (["['a', 'a', 'a'] a a-b-c 2 False ['b', 'c']"], None, None))
+    check("a lazy list becomes a list when it changes",
+          run_everywhere(spl, 'r = range(3); s = r.slice(r.index(1)); r.reverse(); r.append(7); print(r, s);')
+          == (["[2, 1, 0, 7.0] [1, 2]"], None, None))
+    check("a loop sees changes the body makes to the list it walks",
+          run_everywhere(spl, 'r = range(3); for i in r { r.append(i); if r.length() > 6 { break; }; }; print(r);')
+          == (["[0, 1, 2, 0, 1, 2, 0]"], None, None))
+    check("a loop over a huge range makes no list",
+          run_everywhere(spl, 'for i in List.range(0, 100000000) { if i > 5 { break; }; }; '
+                         'r = range(100000000); print(i, r[99999999], r.index(5000000));',
+                         quotas=spl.Quotas(max_list_elements=10))
+          == (["6 99999999 5000000"], None, None))
+    check("lazy lists are charged when they become lists",
+          run_everywhere(spl, 'r = List.range(0, 1000); print(r.length()); r.append(1);',
+                         quotas=spl.Quotas(max_list_elements=100))
+          == (["1000"], "Quota exceeded: list_elements (limit 100, used 1000)", "list_elements"))
+    check("range() still takes 1 to 3 arguments",
+          run_everywhere(spl, "for i in range(1, 2, 3, 4) { print(i); };") == ([], "range() takes 1 to 3 arguments", None))
+
+    check.report()
+
+def interpret_program(program):
+    return Interpreter().visit(program)
+
 def interactive_interpreter():
     print("\n Interactive")
     print("Enter expressions or statements (or 'quit' to exit):")
@@ -122,9 +1006,210 @@ def interactive_interpreter():
         except Exception as e:
             print(f"Error: {e}")
 
+def test_functions():
+    print("\nFunctions Test")
+    check = Checks()
+
+    check("commas separate arguments",
+          [token.type for token in Tokenizer("f(a, b)").tokenize()][:6]
+          == [TokenType.IDENTIFIER, TokenType.LPAREN, TokenType.IDENTIFIER, TokenType.COMMA, TokenType.IDENTIFIER, TokenType.RPAREN])
+    fib = "def fib(n): if n < 2: n else: fib(n - 1) + fib(n - 2)\n"
+    check("a recursive function gives the same result on both engines", run_both(fib + "fib(15)") == 610)
+    for level in (0, 1, 2):
+        check(f"functions work at -O{level}", run_both(fib + "fib(10)", optimize=level) == 55)
+    resolved = Resolver(SlotTable()).resolve(parse("x = 1\ndef f(a): b = a + x\nf(2)"))
+    definition = resolved.statements[1]
+    check("parameters and assigned names are frame slots, others global",
+          isinstance(definition, FunctionDef) and definition.local_count == 2
+          and isinstance(definition.body[0], LocalAssignment) and isinstance(definition.body[0].value.left, Local)
+          and isinstance(definition.body[0].value.right, Identifier) and isinstance(resolved.statements[2], Call))
+    check("a function's locals don't leak into globals",
+          run_both("b = 10\ndef f(a): b = a * 2\nf(3) + b") == 16)
+    check("a function reads globals as they are when it is called",
+          run_both("x = 1\ndef addx(a): a + x\nx = 5\naddx(1)") == 6)
+    check("a local appended to in place gives a str", run_both('def bang(s): s = s + "!"\nbang("a") + bang(1)') == "a!1!")
+    check("a local read before it is assigned is a NameError",
+          run_both('def rep(t, n): while n > 0: r = r + t\nrep("a", 2)') == "NameError: Variable 'r' is not defined")
+    check("a wrong number of arguments is a TypeError",
+          run_both("def f(a, b): a\nf(1)") == "TypeError: f() takes 2 arguments but 1 were given")
+    check("calling a value that isn't a function is a TypeError", run_both("x = 1\nx(2)") == "TypeError: 1 is not a function")
+
+    memo_fib = "@memo\n" + fib
+    check("a @memo function runs in linear time", run_both(memo_fib + "fib(90)") == 2880067194370816120)
+    quotas = Quotas(max_nodes=10000)
+    check("memoized calls are not charged again", interpret(memo_fib + "fib(60)", quotas=quotas) == 1548008755920)
+    interpreter = Interpreter()
+    interpreter.execute(parse("@memo(4)\n" + fib + "fib(20)"))
+    function = interpreter.variables["fib"]
+    check("the memo keeps only its size", isinstance(function, Function) and len(function.memo.results) == 4)
+    one_call = Quotas()
+    three_calls = Quotas()
+    interpret(fib + "fib(1)", quotas=one_call)
+    interpret(fib + "fib(2)", quotas=three_calls)
+    check("each call is charged the nodes of its body", one_call.nodes > 0 and three_calls.nodes == 3 * one_call.nodes)
+    try:
+        interpret(fib + "fib(25)", quotas=Quotas(max_nodes=100000))
+        check("runaway recursion is stopped by the node quota", False)
+    except QuotaExceededError as e:
+        check("runaway recursion is stopped by the node quota", e.quota == "nodes")
+    for code, message in [("def f(a): def g(b): b", "Functions can only be defined at the top level"),
+                          ("def f(a, a): a", "Duplicate parameter 'a' in function f"),
+                          ("@memo(0)\ndef f(a): a", None)]:
+        try:
+            parse(code)
+            check(f"{code!r} is a syntax error", False)
+        except SyntaxError as e:
+            check(f"{code!r} is a syntax error", message is None or message in str(e))
+    check("the vm calls without Python recursion",
+          interpret("def down(n): if n > 0: down(n - 1) else: 7\ndown(5000)", engine="vm") == 7)
+    deep = "def total(n): if n > 0: n + total(n - 1) else: 0\n"
+    check("both engines call 9999 deep", run_both(deep + "total(9999)") == 49995000)
+    check("the profiled tree engine calls 5000 deep", interpret(deep + "total(5000)", profiler=Profiler()) == 12502500)
+    check("calls past MAX_CALL_DEPTH raise CallDepthError on both engines",
+          run_both(deep + "total(20000)") == "CallDepthError: Maximum call depth of 10000 exceeded in total()")
+
+    program = parse("@memo(8)\n" + fib + "fib(30)")
+    loaded = load_program(dump_program(program))
+    check("definitions survive a .splc round trip",
+          (loaded.statements[0].name, loaded.statements[0].params, loaded.statements[0].memo) == ("fib", ["n"], 8)
+          and interpret("@memo(8)\n" + fib + "fib(30)") == 832040)
+    profiler = Profiler()
+    interpret("def f(a): b = a + 1\nx = f(1)\nx = f(2)", profiler=profiler)
+    check("a function body's statements count as hits of its line",
+          [entry["hits"] for entry in profiler.report()["lines"]] == [3, 1, 1])
+
+    check.report()
+
+def test_checkpoints():
+    print("\nCheckpoints Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+    interpreter = spl.Interpreter()
+
+    def run(*statements):
+        return asyncio.run(spl.execute_spl_code_async("\n".join(statements), interpreter=interpreter, incremental=True))
+
+    def run_fresh(*statements):
+        result = asyncio.run(spl.execute_spl_code_async("\n".join(statements), interpreter=spl.Interpreter()))
+        return result["output"], result["result"], result["error"]
+
+    setup = ["items = [];", "for i in range(1000) { items.append(i); };", 'print("built", items.length());',
+             "total = Math.sum(items);"]
+    first = run(*setup, "print(total);")
+    check("the first run runs every statement", first["replayed"] == 0 and first["output"] == ["built 1000", "499500"])
+    edited = run(*setup, "items.append(1000);", "print(total, items.length());")
+    check("an edit re-runs from the first statement that changed",
+          edited["replayed"] == 4 and (edited["output"], edited["result"], edited["error"])
+          == run_fresh(*setup, "items.append(1000);", "print(total, items.length());"))
+    again = run(*setup, "items.append(2000);", "print(total, items.length());")
+    check("a list changed after a checkpoint is put back as it was",
+          again["replayed"] == 4 and again["output"][-1] == "499500 1001")
+    ran = interpreter.checkpoints.stats["run"]
+    unchanged = run(*setup, "items.append(2000);", "print(total, items.length());")
+    check("an unchanged program is replayed without running",
+          unchanged["replayed"] == 6 and interpreter.checkpoints.stats["run"] == ran and unchanged["output"] == again["output"])
+
+    shared = ["a = [[1], [2]];", "b = a;", "c = a[0];"]
+    run(*shared, "print(a);")
+    result = run(*shared, "c.append(9);", "a.append(3);", "print(a, b, c);")
+    check("lists shared by variables are still shared when put back",
+          result["replayed"] == 3 and result["output"] == ["[[1.0, 9.0], [2.0], 3.0] [[1.0, 9.0], [2.0], 3.0] [1.0, 9.0]"])
+    run("x = Math.random();", "y = 1;", "print(y);")
+    check("a statement calling Math.random is re-run", run("x = Math.random();", "y = 1;", "print(y + 1);")["replayed"] == 0)
+    run("n = 5;", "m = n * 2;", "print(m);")
+    asyncio.run(spl.execute_spl_code_async("n = 100;", interpreter=interpreter))
+    check("variables changed by another run start the program over",
+          run("n = 5;", "m = n * 2;", "print(m + 1);")["replayed"] == 0)
+    run("p = 1;", "q = p / 0;", "print(p);")
+    result = run("p = 1;", "q = p / 1;", "print(p);")
+    check("a statement that failed is re-run", result["replayed"] == 1 and result["output"] == ["1.0"])
+    result = run("s = List.range(0, 100000000);", "print(s.length());")
+    check("lazy lists are checkpointed without making a list", result["output"] == ["100000000"]
+          and run("s = List.range(0, 100000000);", "print(s.length() + 1);")["replayed"] == 1)
+
+    check.report()
+
+def test_parallel_for():
+    print("\nParallel For Test")
+    check = Checks()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        spl = load_embedded()
+    # Use the process pool for every loop, even on one core
+    spl.PARALLEL_WORKERS = 2
+    spl.PARALLEL_PROBE_SECONDS = spl.PARALLEL_MIN_SECONDS = spl.PARALLEL_MIN_ITEM_SECONDS = 0
+    sent = []
+    load = spl._spl_parallel_load
+    spl._spl_parallel_load = lambda data, objects: sent.append(1) or load(data, objects)
+
+    def run(code, engine):
+        result = spl.execute_spl_code(code, engine=engine)
+        return result["success"], result["result"], result["error"], result["output"]
+
+    def plan(code):
+        return spl._spl_parallel_plan(spl.global_parser.reparse(code)["statements"][-1])
+
+    programs = {
+        "results": 'out = [];\ntotal = 0;\ns = "";\nparallel for x in range(40) {\n  y = x * x;\n  print("item", x, y);\n'
+                   '  out.append([y]);\n  total = total + y;\n  s = s + x.tostring();\n}\nprint(out.length(), total, s, x, y);',
+        "nested": 'rows = [[1, 2], [3, 4], [5]];\nsums = [];\nparallel for row in rows {\n  t = 0;\n'
+                  '  for v in row { t = t + v; }\n  sums.append(t);\n}\nprint(sums, t);',
+        "error": 'out = [];\nparallel for x in [1, 2, 0, 4, 5, 6] {\n  print("before", x);\n  out.append(10 / x);\n}',
+        "sum error": 's = 0;\nparallel for x in [1, 2, "a", 3] {\n  print(x);\n  s = s + x;\n}\nprint(s);',
+        "dependent": 'a = 0;\nparallel for x in range(5) {\n  print(a);\n  a = x;\n}\nprint(a);',
+    }
+    for engine in ("tree", "closure", "python"):
+        for name, code in programs.items():
+            check(f"{engine}: parallel {name} loop does what the serial loop does",
+                  run(code, engine) == run(code.replace("parallel for", "for"), engine))
+    check("independent loops run in worker processes", sent)
+
+    check("a loop reading what an earlier iteration wrote runs serially",
+          plan("a = 0;\nparallel for x in range(5) { print(a); a = x; }") is None)
+    check("a loop calling Math.random runs serially", plan("parallel for x in range(5) { y = Math.random(); }") is None)
+    check("a local assigned on only one branch can't be read",
+          plan("parallel for x in range(5) { if x > 1 { z = 1; }; print(z); }") is None
+          and plan("parallel for x in range(5) { if x > 1 { z = 1; } else { z = 2; }; print(z); }") is not None)
+    check("a loop appending to a list it also reads runs serially",
+          plan("a = [1];\nparallel for x in range(3) { a.append(x); print(a.length()); }") is None)
+
+    result = spl.execute_spl_code('rows = [[1], [2]];\nout = [];\nparallel for row in rows { out.append(row); };\n'
+                                  'rows[0].append(9);\nprint(out);')
+    check("appended lists are the loop's own lists", result["output"] == ["[[1.0, 9.0], [2.0]]"])
+    result = spl.execute_spl_code("parallel = 3;\nprint(parallel);")
+    check("parallel is still a name", result["output"] == ["3.0"])
+
+    check.report()
+
 if __name__ == "__main__":
     test_complete_pipeline()
     test_variable_persistence()
+    test_engine_parity()
+    test_closure_engine()
+    test_transpiler()
+    test_token_scanning()
+    test_streaming()
+    test_incremental_parser()
+    test_program_cache()
+    test_optimizer()
+    test_slot_resolution()
+    test_arrays()
+    test_output_sinks()
+    test_async_runs()
+    test_quotas()
+    test_profiler()
+    test_cli()
+    test_benchmarks()
+    test_embedded_package()
+    test_method_dispatch()
+    test_string_builder()
+    test_list_views()
+    test_lazy_lists()
+    test_functions()
+    test_checkpoints()
+    test_parallel_for()
 
     print("\n" + "=" * 60)
 
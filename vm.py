@@ -0,0 +1,219 @@
+from compiler import OpCode
+from functions import MAX_CALL_DEPTH, CallDepthError, Function
+from interpreter import OutputHandler
+from resolver import UNDEFINED
+from strings import StringBuilder, add_parts, flatten
+
+LOAD_CONST = OpCode.LOAD_CONST.value
+LOAD_NAME = OpCode.LOAD_NAME.value
+STORE_NAME = OpCode.STORE_NAME.value
+POP = OpCode.POP.value
+BINARY_ADD = OpCode.BINARY_ADD.value
+BINARY_SUB = OpCode.BINARY_SUB.value
+BINARY_MUL = OpCode.BINARY_MUL.value
+BINARY_DIV = OpCode.BINARY_DIV.value
+COMPARE_GT = OpCode.COMPARE_GT.value
+COMPARE_LT = OpCode.COMPARE_LT.value
+UNARY_NEG = OpCode.UNARY_NEG.value
+PRINT = OpCode.PRINT.value
+JUMP = OpCode.JUMP.value
+JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+RETURN = OpCode.RETURN.value
+APPEND_NAME = OpCode.APPEND_NAME.value
+LOAD_LOCAL = OpCode.LOAD_LOCAL.value
+STORE_LOCAL = OpCode.STORE_LOCAL.value
+APPEND_LOCAL = OpCode.APPEND_LOCAL.value
+MAKE_FUNCTION = OpCode.MAKE_FUNCTION.value
+CALL = OpCode.CALL.value
+START_APPEND_NAME = OpCode.START_APPEND_NAME.value
+START_APPEND_LOCAL = OpCode.START_APPEND_LOCAL.value
+APPEND_PARTS_NAME = OpCode.APPEND_PARTS_NAME.value
+APPEND_PARTS_LOCAL = OpCode.APPEND_PARTS_LOCAL.value
+
+# Memo.get() result for arguments a function has no result for yet
+_MISSING = object()
+
+
+class VM:
+    """Stack-based virtual machine for CodeObjects produced by compiler.py.
+
+    Exposes the same ``variables`` and ``output_handler`` attributes as
+    Interpreter so callers can switch engines freely. A CALL saves the
+    caller's code, pc, locals and stack on a list and carries on in the
+    same loop, so SPL calls don't nest Python calls and can go as deep as
+    MAX_CALL_DEPTH.
+    """
+
+    def __init__(self):
+        self.variables = {}
+        self.output_handler = OutputHandler()
+
+    def run(self, code_obj):
+        try:
+            return flatten(self.execute(code_obj))
+        finally:
+            # APPEND_NAME leaves StringBuilders in variables; callers see strings
+            for name, value in self.variables.items():
+                if type(value) is StringBuilder:
+                    self.variables[name] = value.build()
+
+    def execute(self, code_obj):
+        """run() leaving the result and variables unflattened, so appends can continue in the next run"""
+        code = code_obj.code
+        constants = code_obj.constants
+        names = code_obj.names
+        variables = self.variables
+        local_slots = None
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        # One (code_obj, pc, local_slots, stack, function, memo key) per call
+        # under way: the caller's state, and the function it called
+        calls = []
+
+        while True:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+
+            if op == LOAD_CONST:
+                push(constants[arg])
+            elif op == LOAD_NAME:
+                name = names[arg]
+                if name in variables:
+                    value = variables[name]
+                    push(value.build() if type(value) is StringBuilder else value)
+                else:
+                    raise NameError(f"Variable '{name}' is not defined")
+            elif op == STORE_NAME:
+                variables[names[arg]] = stack[-1]
+            elif op == LOAD_LOCAL:
+                value = local_slots[arg]
+                if value is UNDEFINED:
+                    raise NameError(f"Variable '{code_obj.local_names[arg]}' is not defined")
+                push(value.build() if type(value) is StringBuilder else value)
+            elif op == STORE_LOCAL:
+                local_slots[arg] = stack[-1]
+            elif op == APPEND_NAME:
+                name = names[arg]
+                if name not in variables:
+                    raise NameError(f"Variable '{name}' is not defined")
+                right = stack[-1]
+                left = variables[name]
+                if type(left) is StringBuilder:
+                    left.parts.append(str(right))
+                elif isinstance(left, str) or isinstance(right, str):
+                    left = variables[name] = StringBuilder([str(left), str(right)])
+                else:
+                    left = variables[name] = left + right
+                stack[-1] = left
+            elif op == APPEND_LOCAL:
+                left = local_slots[arg]
+                if left is UNDEFINED:
+                    raise NameError(f"Variable '{code_obj.local_names[arg]}' is not defined")
+                right = stack[-1]
+                if type(left) is StringBuilder:
+                    left.parts.append(str(right))
+                elif isinstance(left, str) or isinstance(right, str):
+                    left = local_slots[arg] = StringBuilder([str(left), str(right)])
+                else:
+                    left = local_slots[arg] = left + right
+                stack[-1] = left
+            elif op == POP:
+                pop()
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == BINARY_ADD:
+                right = pop()
+                left = stack[-1]
+                if isinstance(left, str) or isinstance(right, str):
+                    stack[-1] = str(left) + str(right)
+                else:
+                    stack[-1] = left + right
+            elif op == BINARY_SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == BINARY_MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == BINARY_DIV:
+                right = pop()
+                if right == 0:
+                    raise ZeroDivisionError("Division by zero")
+                stack[-1] = stack[-1] / right
+            elif op == COMPARE_GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == COMPARE_LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == UNARY_NEG:
+                stack[-1] = -stack[-1]
+            elif op == PRINT:
+                values = stack[len(stack) - arg:] if arg else []
+                del stack[len(stack) - arg:]
+                self.output_handler.write(" ".join(str(value) for value in values))
+                push(None)
+            elif op == MAKE_FUNCTION:
+                push(Function(*constants[arg]))
+            elif op == CALL:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                function = pop()
+                if type(function) is not Function:
+                    raise TypeError(f"{function!r} is not a function")
+                key = None
+                if function.memo is not None:
+                    key = tuple(args)
+                    value = function.memo.get(key, _MISSING)
+                    if value is not _MISSING:
+                        push(value)
+                        continue
+                frame = function.frame(args)
+                if len(calls) >= MAX_CALL_DEPTH:
+                    raise CallDepthError(f"Maximum call depth of {MAX_CALL_DEPTH} exceeded in {function.name}()")
+                calls.append((code_obj, pc, local_slots, stack, function, key))
+                code_obj = function.body
+                code, constants, names = code_obj.code, code_obj.constants, code_obj.names
+                local_slots = frame
+                stack = []
+                push = stack.append
+                pop = stack.pop
+                pc = 0
+            elif op == RETURN:
+                if not calls:
+                    return pop()
+                value = flatten(pop())
+                code_obj, pc, local_slots, stack, function, key = calls.pop()
+                if key is not None:
+                    function.memo.put(key, value)
+                code, constants, names = code_obj.code, code_obj.constants, code_obj.names
+                push = stack.append
+                pop = stack.pop
+                push(value)
+            elif op == START_APPEND_NAME:
+                name = names[arg]
+                if name not in variables:
+                    raise NameError(f"Variable '{name}' is not defined")
+                push(variables[name])
+            elif op == START_APPEND_LOCAL:
+                value = local_slots[arg]
+                if value is UNDEFINED:
+                    raise NameError(f"Variable '{code_obj.local_names[arg]}' is not defined")
+                push(value)
+            elif op == APPEND_PARTS_NAME:
+                index, count = constants[arg]
+                parts = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                stack[-1] = variables[names[index]] = add_parts(stack[-1], parts)
+            elif op == APPEND_PARTS_LOCAL:
+                index, count = constants[arg]
+                parts = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                stack[-1] = local_slots[index] = add_parts(stack[-1], parts)
+            else:
+                raise Exception(f"Unknown opcode: {op}")